@@ -0,0 +1,109 @@
+from thundercloud.util.lru import LRUCache
+
+import hashlib
+import os
+
+import logging
+
+log = logging.getLogger("auth.cache")
+
+# Caches the outcome of successful password checks so repeated HTTP basic
+# auth requests (e.g. dashboards polling job results) don't pay for a SQL
+# query and a crypt() on every hit.
+#
+# Entries are keyed on (scope, username), where the scope is whatever the
+# checker needs to distinguish -- e.g. the job ID for job node checkers, so
+# that job ownership is cached along with the password.  Only a salted digest
+# of the password is kept.  Every entry is stamped with the user's generation
+# number; bumping the generation (on delete or password change) invalidates
+# all of that user's entries and session tokens at once, without having to
+# find them.  A user's generation is forgotten once nothing stamped with it is
+# left in the cache, so there's only one kept per user with live entries.
+class CredentialCache(object):
+    def __init__(self, maxSize=4096, ttl=300, tokenTtl=3600):
+        self._salt = os.urandom(16)
+        self.configure(maxSize, ttl, tokenTtl)
+
+    def configure(self, maxSize=4096, ttl=300, tokenTtl=3600):
+        self._entries = LRUCache(maxSize, ttl, onEvict=lambda key, entry: self._release(key[1]))
+        self._tokens = LRUCache(maxSize, tokenTtl, onEvict=lambda token, entry: self._release(entry[0]))
+        self._generations = {}
+        self._holders = {}          # username -> entries and tokens it has
+
+    def _hold(self, username):
+        self._holders[username] = self._holders.get(username, 0) + 1
+
+    def _release(self, username):
+        holders = self._holders.get(username, 0) - 1
+        if holders > 0:
+            self._holders[username] = holders
+        else:
+            self._holders.pop(username, None)
+            self._generations.pop(username, None)
+
+    def _digest(self, password):
+        return hashlib.sha1(self._salt + password).digest()
+
+    def _generation(self, username):
+        return self._generations.get(username, 0)
+
+    # True if this password was verified for this user in this scope recently
+    def verify(self, scope, username, password):
+        entry = self._entries.get((scope, username))
+        if entry is None:
+            return False
+        (digest, generation) = entry
+        return digest == self._digest(password) and generation == self._generation(username)
+
+    # True if the user passed a check in this scope recently, with any password
+    def known(self, scope, username):
+        entry = self._entries.get((scope, username))
+        if entry is None:
+            return False
+        return entry[1] == self._generation(username)
+
+    def remember(self, scope, username, password=None):
+        if password is None:
+            digest = None
+        else:
+            digest = self._digest(password)
+        if (scope, username) not in self._entries:
+            self._hold(username)
+        self._entries.put((scope, username), (digest, self._generation(username)))
+
+    # drop everything cached for a user, including outstanding session tokens
+    def invalidate(self, username):
+        if username not in self._holders:
+            return
+        log.debug("Invalidating cached credentials for user %s" % username)
+        self._generations[username] = self._generation(username) + 1
+
+    def issueToken(self, username):
+        token = os.urandom(20).encode("hex")
+        self._hold(username)
+        self._tokens.put(token, (username, self._generation(username)))
+        return token
+
+    # return the username a token was issued to, or None if it's unknown,
+    # expired, or was revoked
+    def lookupToken(self, token):
+        entry = self._tokens.get(token)
+        if entry is None:
+            return None
+        (username, generation) = entry
+        if generation != self._generation(username):
+            self._tokens.pop(token)
+            return None
+        return username
+
+    def revokeToken(self, token):
+        self._tokens.pop(token)
+
+    def clear(self):
+        self._entries.clear()
+        self._tokens.clear()
+        self._generations = {}
+        self._holders = {}
+
+
+credentialCache = CredentialCache()
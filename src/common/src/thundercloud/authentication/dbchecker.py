@@ -4,6 +4,11 @@ from twisted.cred import error, credentials
 from twisted.internet import defer
 from twisted.python import failure
 import crypt
+import string
+import os
+
+from thundercloud.authentication.cache import credentialCache
+from thundercloud.authentication.token import ISessionToken
 
 import logging
 
@@ -12,25 +17,53 @@ log = logging.getLogger("auth.DBChecker")
 class UserNotFound(Exception):
     pass
 
+_SALT_CHARS = string.ascii_letters + string.digits + "./"
+
+def _salt(length):
+    return "".join([_SALT_CHARS[ord(c) % len(_SALT_CHARS)] for c in os.urandom(length)])
+
+# hash a password to be stored in the DB, with a random salt of its own.
+# SHA-512 crypt where the platform's crypt() has it, traditional DES where it
+# doesn't.  either way, crypt(password, hashed) == hashed checks it
+def hashPassword(password):
+    salt = "$6$" + _salt(16)
+    hashed = crypt.crypt(password, salt)
+    if hashed is not None and hashed.startswith(salt):
+        return hashed
+    return crypt.crypt(password, _salt(2))
+
 class IDBChecker(Interface):
     def getUserAndPassword(self, username): pass
 
 
 class DBChecker(object):
     implements(ICredentialsChecker)
-    
+
     # we're using HTTP BASIC auth, and passwords are hashed in the DB,
-    # so we can only accept plaintext passwords
-    credentialInterfaces = (credentials.IUsernamePassword,)
-    
-    def __init__(self, dbHandle):
+    # so we can only accept plaintext passwords.  session tokens are
+    # checked against the credential cache instead of the DB
+    credentialInterfaces = (credentials.IUsernamePassword, ISessionToken)
+
+    def __init__(self, dbHandle, cache=credentialCache):
         self.db = dbHandle
-    
+        self.cache = cache
+
     # this needs to be implemented by subclasses
     def getUserAndPassword(self, username):
-        raise NotImplementedException
-    
+        raise NotImplementedError
+
+    # what a successful check is cached against.  subclasses which check more
+    # than the password (e.g. job ownership) need to include that here
+    def cacheScope(self):
+        return self.__class__.__name__
+
     def requestAvatarId(self, creds):
+        if ISessionToken.providedBy(creds):
+            return self._checkToken(creds)
+
+        if self.cache is not None and self.cache.verify(self.cacheScope(), creds.username, creds.password):
+            return defer.succeed(creds.username)
+
         log.debug("Authenticating user %s" % creds.username)
         try:
             (username, dbPassword) = self.getUserAndPassword(creds.username)
@@ -39,7 +72,29 @@ class DBChecker(object):
 
         if crypt.crypt(creds.password, dbPassword) == dbPassword:
             log.debug("User authenticated")
+            if self.cache is not None:
+                self.cache.remember(self.cacheScope(), creds.username, creds.password)
             return defer.succeed(creds.username)
         else:
             log.debug("User authentication failed")
             return defer.fail(error.UnauthorizedLogin())
+
+    def _checkToken(self, creds):
+        if self.cache is None:
+            return defer.fail(error.UnauthorizedLogin())
+
+        username = self.cache.lookupToken(creds.token)
+        if username is None:
+            return defer.fail(error.UnauthorizedLogin())
+
+        # the token proves who the user is, but this checker may need more
+        # than that (e.g. that the user owns a job), so hit the DB the first
+        # time the user shows up in this scope
+        if not self.cache.known(self.cacheScope(), username):
+            try:
+                self.getUserAndPassword(username)
+            except:
+                return defer.fail(error.UnauthorizedLogin())
+            self.cache.remember(self.cacheScope(), username)
+
+        return defer.succeed(username)
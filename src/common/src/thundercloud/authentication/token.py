@@ -0,0 +1,38 @@
+from zope.interface import implements, Interface, Attribute
+from twisted.web.iweb import ICredentialFactory
+from twisted.cred import error
+
+# Session tokens let polling clients authenticate with
+#
+#     Authorization: Token <token>
+#
+# instead of HTTP basic auth.  Tokens are issued by the master after a
+# regular basic auth login and checked against the credential cache only,
+# so no database lookup or password hashing happens on the request path.
+class ISessionToken(Interface):
+    token = Attribute("The opaque session token string")
+
+
+class SessionToken(object):
+    implements(ISessionToken)
+
+    def __init__(self, token):
+        self.token = token
+
+
+class SessionTokenCredentialFactory(object):
+    implements(ICredentialFactory)
+
+    scheme = "token"
+
+    def __init__(self, realm):
+        self.realm = realm
+
+    def getChallenge(self, request):
+        return {"realm": self.realm}
+
+    def decode(self, response, request):
+        token = response.strip()
+        if not token:
+            raise error.LoginFailed("Empty session token")
+        return SessionToken(token)
@@ -2,18 +2,27 @@ import ConfigParser
 
 _config = ConfigParser.SafeConfigParser()
 
+class _NoDefault(object):
+    pass
+
 def readConfig(file):
     _config.read(file)
 
-def parameter(section, option, type=None):
-    if type is bool:
-        return _config.getboolean(section, option)
-    elif type is int:
-        return _config.getint(section, option)
-    elif type is float:
-        return _config.getfloat(section, option)
-    else:
-        return _config.get(section, option)
+# if a default is given, it's returned when the section or option is missing
+def parameter(section, option, type=None, default=_NoDefault):
+    try:
+        if type is bool:
+            return _config.getboolean(section, option)
+        elif type is int:
+            return _config.getint(section, option)
+        elif type is float:
+            return _config.getfloat(section, option)
+        else:
+            return _config.get(section, option)
+    except (ConfigParser.NoSectionError, ConfigParser.NoOptionError):
+        if default is _NoDefault:
+            raise
+        return default
 
 def section(section):
     return _config.items(section)
\ No newline at end of file
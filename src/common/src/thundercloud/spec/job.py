@@ -2,6 +2,7 @@ from zope.interface import Interface
 import simplejson as json
 import jsonpickle
 import sqlite3
+import re
 
 from thundercloud import constants
 from thundercloud.spec.dataobject import DataObject
@@ -49,10 +50,23 @@ class InvalidJobSpec(Exception):
     def __init__(self, msg):
         self.msg = msg
 
+# finest stats granularity, in seconds
+MIN_STATS_INTERVAL = 0.1
+
+# what a SEARCH job's search doesn't give.  step defaults to start, and
+# precision to an eighth of step
+SEARCH_DEFAULTS = {
+    "start": 10,
+    "stepDuration": 30,
+    "warmup": 5,
+}
+
 class JobSpec(DataObject):
     class JobProfile:
         HAMMER = 0
         BENCHMARK = 1
+        SESSION = 2
+        SEARCH = 3
         DUMMY = 9999
         
         @classmethod
@@ -60,9 +74,45 @@ class JobSpec(DataObject):
             return [
                 cls.HAMMER,
                 cls.BENCHMARK,
+                cls.SESSION,
+                cls.SEARCH,
                 cls.DUMMY,
             ]
     
+    # how the next URL is picked from requests/requestsFile
+    class RequestSelection:
+        ROUND_ROBIN = 0
+        WEIGHTED = 1
+        
+        @classmethod
+        def _all(cls):
+            return [
+                cls.ROUND_ROBIN,
+                cls.WEIGHTED,
+            ]
+    
+    # think time distributions, and what each needs in thinkTime:
+    #
+    #     constant      seconds
+    #     uniform       min, max
+    #     exponential   mean, and optionally max to cap it at
+    #     empirical     file, in the slaves' [files] directory, one number of
+    #                   seconds per line
+    class ThinkTime:
+        CONSTANT = "constant"
+        UNIFORM = "uniform"
+        EXPONENTIAL = "exponential"
+        EMPIRICAL = "empirical"
+        
+        @classmethod
+        def _all(cls):
+            return [
+                cls.CONSTANT,
+                cls.UNIFORM,
+                cls.EXPONENTIAL,
+                cls.EMPIRICAL,
+            ]
+    
     _attributes = {
         "requests": {"":{}},
         "duration": float("inf"),
@@ -72,6 +122,61 @@ class JobSpec(DataObject):
         "userAgent": str("thundercloud client/%s" % constants.VERSION),
         "profile": JobProfile.HAMMER,
         "timeout": float("inf"),
+        
+        # requests may also be given a "weight".  large request sets can be
+        # put in a file in the slaves' [files] directory, one
+        # "URL [weight [method [postdata]]]" per line, instead of being
+        # inlined in requests
+        "requestsFile": None,
+        "requestSelection": RequestSelection.ROUND_ROBIN,
+        
+        # the flow each virtual user runs through for SESSION jobs:
+        #
+        #     {"steps": [{"url": ..., "method": ..., "postdata": ...,
+        #                 "headers": {name: value}, "extract": {name: regex}}, ...],
+        #      "cookies": {name: value}, "variables": {name: value}}
+        #
+        # urls and postdata may refer to ${name}; ${vu} is the user's number
+        "session": None,
+        
+        # target hosts are resolved once when the job is created, and again
+        # as their TTLs run out.  dnsRoundRobin spreads requests over all of
+        # a host's A/AAAA records; measureResolution resolves on every
+        # request instead, so DNS time shows up in timeToConnect
+        "dnsRoundRobin": False,
+        "measureResolution": False,
+        
+        # https targets share one TLS context per job.  with tlsResumption
+        # off, every connection does a full handshake
+        "tlsResumption": True,
+        
+        # keep every request's timings in a raw sample log on the slave,
+        # which can be fetched from /job/n/samples
+        "recordSamples": False,
+        
+        # the job's share of a slave's clients, relative to the other jobs
+        # on the slave, when between them they want more than it runs
+        "weight": 1,
+        
+        # BENCHMARK and SESSION clients wait for a think time between an
+        # answer and their next request, {"distribution": ..., ...} (see
+        # ThinkTime), and send at most one request every pacing seconds
+        "thinkTime": None,
+        "pacing": None,
+        
+        # SEARCH jobs look for the highest rate (requests/sec, across all of
+        # the job's slaves) the target can take while meeting an SLO:
+        #
+        #     {"p99": seconds, "errorRate": fraction, "max": requests/sec,
+        #      "start": requests/sec, "step": requests/sec,
+        #      "stepDuration": seconds, "warmup": seconds,
+        #      "precision": requests/sec}
+        #
+        # the rate is stepped up from start until a step misses the SLO,
+        # then narrowed down by binary search, never past max.  each rate
+        # runs for stepDuration seconds and is judged on what comes after
+        # its warmup.  slaves are allocated by the client function as usual
+        "search": None,
     }                
 
     # verify rules for job specs are adhered to
@@ -80,9 +185,11 @@ class JobSpec(DataObject):
         if self.duration == float("inf") and self.transferLimit == float("inf"):
             raise InvalidJobSpec("Must set a duration or transfer limit")
     
-        # stats granularity must be an int
-        if type(self.statsInterval) != int:
+        # stats granularity is whole seconds, or tenths of a second
+        if type(self.statsInterval) not in (int, float) or self.statsInterval < MIN_STATS_INTERVAL:
             raise InvalidJobSpec("Invalid stats granularity")
+        if abs(self.statsInterval * 10 - round(self.statsInterval * 10)) > 1e-6:
+            raise InvalidJobSpec("Stats granularity must be in tenths of a second")
     
         # client function has to use t as an argument
         
@@ -90,24 +197,116 @@ class JobSpec(DataObject):
         if type(self.requests) != dict:
             raise InvalidJobSpec("Requests must be a well-formed dictionary")
         for request in self.requests:
+            # the default placeholder, if all URLs come from a requests file
+            # or a session
+            if request == "" and self.requests[request] == {} and \
+               (self.requestsFile is not None or self.profile == JobSpec.JobProfile.SESSION):
+                continue
             if type(self.requests[request]) != dict:
                 raise InvalidJobSpec("Malformed request")
             if not self.requests[request].has_key("method")   or \
                not self.requests[request].has_key("postdata") or \
                not self.requests[request].has_key("cookies"):
                 raise InvalidJobSpec("Malformed request, missing key")
+            if self.requests[request].has_key("weight"):
+                weight = self.requests[request]["weight"]
+                if type(weight) not in (int, float) or weight <= 0:
+                    raise InvalidJobSpec("Request weights must be positive numbers")
         
-        # if request dict is empty, spec is invalid
-        if self.requests == {"":{}} or self.requests == {}:
+        if self.profile == JobSpec.JobProfile.SESSION:
+            self._validateSession()
+        
+        # if request dict is empty and there's no request file, spec is invalid
+        elif self.requestsFile is None and (self.requests == {"":{}} or self.requests == {}):
             raise InvalidJobSpec("No URLs requested")
         
+        if self.requestsFile is not None and not isinstance(self.requestsFile, basestring):
+            raise InvalidJobSpec("Invalid requests file")
+        
+        if self.requestSelection not in JobSpec.RequestSelection._all():
+            raise InvalidJobSpec("Invalid request selection")
+        
+        if type(self.dnsRoundRobin) != bool or type(self.measureResolution) != bool:
+            raise InvalidJobSpec("DNS options must be true or false")
+        
+        if type(self.tlsResumption) != bool:
+            raise InvalidJobSpec("TLS resumption must be true or false")
+        
+        if type(self.weight) not in (int, float) or self.weight <= 0:
+            raise InvalidJobSpec("Job weight must be a positive number")
+        
+        if self.thinkTime is not None:
+            self._validateThinkTime()
+        if self.pacing is not None and (type(self.pacing) not in (int, float) or self.pacing <= 0):
+            raise InvalidJobSpec("Pacing must be a positive number of seconds")
+        
+        if self.profile == JobSpec.JobProfile.SEARCH:
+            self._validateSearch()
+        
         # profile has to be valid
         if self.profile != JobSpec.JobProfile.BENCHMARK and \
-           self.profile != JobSpec.JobProfile.HAMMER:
+           self.profile != JobSpec.JobProfile.HAMMER and \
+           self.profile != JobSpec.JobProfile.SESSION and \
+           self.profile != JobSpec.JobProfile.SEARCH:
             raise InvalidJobSpec("Invalid job profile")
         
         # if everything is ok...
         return True
+    
+    def _validateSearch(self):
+        if type(self.search) != dict:
+            raise InvalidJobSpec("Search jobs need a search")
+        if "p99" not in self.search and "errorRate" not in self.search:
+            raise InvalidJobSpec("Search needs an SLO, a p99 or an error rate")
+        if "max" not in self.search:
+            raise InvalidJobSpec("Search needs the highest rate to try, its max")
+        for key in ("p99", "errorRate", "max", "start", "step", "stepDuration", "warmup", "precision"):
+            if key in self.search and (type(self.search[key]) not in (int, float) or self.search[key] < 0):
+                raise InvalidJobSpec("Search %s must be a positive number" % key)
+        if 0 in [self.search[key] for key in ("max", "start", "step", "precision") if key in self.search]:
+            raise InvalidJobSpec("Search rates must be more than zero")
+        search = dict(SEARCH_DEFAULTS)
+        search.update(self.search)
+        if search["stepDuration"] - search["warmup"] < 2 * self.statsInterval:
+            raise InvalidJobSpec("Search steps must run for at least two stats intervals after their warmup")
+    
+    def _validateThinkTime(self):
+        if type(self.thinkTime) != dict or self.thinkTime.get("distribution") not in JobSpec.ThinkTime._all():
+            raise InvalidJobSpec("Think time must have a distribution")
+        required = {
+            JobSpec.ThinkTime.CONSTANT: ("seconds",),
+            JobSpec.ThinkTime.UNIFORM: ("min", "max"),
+            JobSpec.ThinkTime.EXPONENTIAL: ("mean",),
+            JobSpec.ThinkTime.EMPIRICAL: (),
+        }[self.thinkTime["distribution"]]
+        if self.thinkTime["distribution"] == JobSpec.ThinkTime.EXPONENTIAL and "max" in self.thinkTime:
+            required = required + ("max",)
+        for key in required:
+            if type(self.thinkTime.get(key)) not in (int, float) or self.thinkTime[key] < 0:
+                raise InvalidJobSpec("Think time %s must be a number of seconds" % key)
+        if self.thinkTime["distribution"] == JobSpec.ThinkTime.UNIFORM and self.thinkTime["min"] > self.thinkTime["max"]:
+            raise InvalidJobSpec("Think time min is more than its max")
+        if self.thinkTime["distribution"] == JobSpec.ThinkTime.EXPONENTIAL and self.thinkTime["mean"] <= 0:
+            raise InvalidJobSpec("Think time mean must be positive")
+        if self.thinkTime["distribution"] == JobSpec.ThinkTime.EMPIRICAL and not isinstance(self.thinkTime.get("file"), basestring):
+            raise InvalidJobSpec("Empirical think times need a file")
+    
+    def _validateSession(self):
+        if type(self.session) != dict or type(self.session.get("steps")) != list or not self.session["steps"]:
+            raise InvalidJobSpec("Session must have a list of steps")
+        for step in self.session["steps"]:
+            if type(step) != dict or not isinstance(step.get("url"), basestring):
+                raise InvalidJobSpec("Malformed session step")
+            if type(step.get("extract", {})) != dict or type(step.get("headers", {})) != dict:
+                raise InvalidJobSpec("Malformed session step, extract and headers must be dictionaries")
+            for pattern in step.get("extract", {}).values():
+                try:
+                    re.compile(pattern)
+                except (re.error, TypeError):
+                    raise InvalidJobSpec("Invalid extraction pattern %s" % pattern)
+        for key in ("cookies", "variables"):
+            if type(self.session.get(key, {})) != dict:
+                raise InvalidJobSpec("Session %s must be a dictionary" % key)
 
 sqlite3.register_converter("jobSpec", lambda s: JobSpec(json.loads(s)))
 
@@ -135,6 +334,7 @@ class JobResults(DataObject):
             400: 0,
             401: 0,
             500: 0,
+            "timeout": 0,
         },
         "results_byTime": {
             0: {
@@ -142,18 +342,42 @@ class JobResults(DataObject):
                 "iterations_success": 0,
                 "iterations_fail": 0,
                 "timeToConnect": 0,
+                "timeToHandshake": 0,
                 "timeToFirstByte": 0,
                 "responseTime": 0,
                 "requestsPerSec": 0,
                 "throughput": 0,
                 "bytesTransferred": 0,
+                
+                # seconds the entry covers, and how many responses fell in
+                # each of thundercloud.util.metrics.LATENCY_BUCKETS (and one
+                # more for anything slower) during that time.  rolled up
+                # entries also have the "resolution" they were rolled up to
+                "interval": 0,
+                "responseTimes": [],
+                
+                # requests the client function called for against those
+                # actually sent, how late the slave's reactor was running
+                # timers (seconds) and the fraction of a CPU it used.  if
+                # these look bad, the slave was the bottleneck, not the target
+                "requestsRequested": 0,
+                "requestsIssued": 0,
+                "loopLagP50": 0,
+                "loopLagP90": 0,
+                "loopLagP99": 0,
+                "loopLagMax": 0,
+                "cpu": 0,
                 "errors": {
                     400: 0,
                     401: 0,
                     500: 0,
+                    "timeout": 0,
                 },
             },
         },
+        
+        # what a SEARCH job found, filled in by the master
+        "search": None,
     }
 
 sqlite3.register_converter("jobResults", lambda s: JobResults(json.loads(s)))
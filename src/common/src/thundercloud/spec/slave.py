@@ -40,6 +40,7 @@ class SlaveSpec(DataObject):
         
         "connectionSpeed": None,
         "maxRequestsPerSec": None,
+        "maxSockets": None,
         
         "location": {
             "latitude": None,
@@ -56,6 +57,9 @@ class SlaveSpec(DataObject):
         if type(self.maxRequestsPerSec) != int or self.maxRequestsPerSec < 0:
             return False
         
+        if self.maxSockets is not None and (type(self.maxSockets) != int or self.maxSockets < 0):
+            return False
+        
         if type(self.port) != int:
             return False
         
@@ -0,0 +1,75 @@
+from collections import deque
+import ctypes
+import ctypes.util
+import time
+
+# How far another host's clock is from ours, worked out from round trips
+# whose replies carry its clock, the way NTP does it: if the reply was
+# stamped halfway through the trip, the remote clock is ahead by
+#
+#     remoteTime - (sent + received) / 2
+#
+# give or take half the round trip.  Of the last few samples, the one with
+# the shortest round trip spent the least time queued somewhere, so it's
+# the one that's trusted
+
+# round trips kept per host
+SAMPLES = 8
+
+class ClockOffset(object):
+    def __init__(self, samples=SAMPLES):
+        self.samples = deque(maxlen=samples)
+
+    def __len__(self):
+        return len(self.samples)
+
+    # a round trip sent and received on our clock, answered at remoteTime on
+    # the other host's
+    def sample(self, sent, remoteTime, received):
+        roundTrip = received - sent
+        if roundTrip < 0:
+            return
+        self.samples.append((roundTrip, remoteTime - (sent + received) / 2.0))
+
+    # seconds the remote clock is ahead of ours; 0 until there's a sample
+    def offset(self):
+        if not self.samples:
+            return 0.0
+        return min(self.samples)[1]
+
+    # how far off the offset could be, or None without any samples
+    def error(self):
+        if not self.samples:
+            return None
+        return min(self.samples)[0] / 2.0
+
+    # time t on our clock, on the remote host's
+    def toRemote(self, t):
+        return t + self.offset()
+
+
+class _timespec(ctypes.Structure):
+    _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+CLOCK_MONOTONIC = 1
+
+def _monotonicClock():
+    try:
+        librt = ctypes.CDLL(ctypes.util.find_library("rt") or "librt.so.1")
+        clock_gettime = librt.clock_gettime
+    except (OSError, AttributeError):
+        return None
+    clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(_timespec)]
+    spec = _timespec()
+    if clock_gettime(CLOCK_MONOTONIC, ctypes.byref(spec)) != 0:
+        return None
+
+    def monotonic():
+        clock_gettime(CLOCK_MONOTONIC, ctypes.byref(spec))
+        return spec.tv_sec + spec.tv_nsec * 1e-9
+    return monotonic
+
+# seconds since some arbitrary point, which never jump when the wall clock is
+# stepped, for timing intervals.  it's clock_gettime(CLOCK_MONOTONIC) where
+# that can be found, and the wall clock where it can't
+monotonic = _monotonicClock() or time.time
@@ -0,0 +1,137 @@
+from zope.interface import implements
+from twisted.internet.interfaces import IPullProducer
+
+from cStringIO import StringIO
+import gzip
+import zlib
+
+# gzip a string in one go
+def gzipBytes(data, level=6):
+    buf = StringIO()
+    gzipFile = gzip.GzipFile(fileobj=buf, mode="wb", compresslevel=level)
+    gzipFile.write(data)
+    gzipFile.close()
+    return buf.getvalue()
+
+def gunzipBytes(data):
+    return gzip.GzipFile(fileobj=StringIO(data), mode="rb").read()
+
+# true if the request's Accept-Encoding header allows the given coding.
+# q-values are only checked for being zero
+def acceptsEncoding(request, coding):
+    header = request.getHeader("accept-encoding")
+    if header is None:
+        return False
+
+    for item in header.split(","):
+        params = item.strip().split(";")
+        if params[0].strip().lower() not in (coding, "*"):
+            continue
+        for param in params[1:]:
+            param = param.strip().replace(" ", "")
+            if param in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+                return False
+        return True
+    return False
+
+
+# bodies shorter than this aren't worth compressing
+MIN_SIZE = 1024
+
+# bodies longer than this are compressed a chunk at a time as the client
+# reads them, rather than all at once
+STREAM_SIZE = 256 * 1024
+CHUNK_SIZE = 64 * 1024
+
+# the content coding to answer a request with, or None.  gzip wins if the
+# client takes both
+def negotiateEncoding(request):
+    for coding in ("gzip", "deflate"):
+        if acceptsEncoding(request, coding):
+            return coding
+    return None
+
+def _compressor(coding, level=6):
+    if coding == "gzip":
+        return zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS)
+
+# decode a response body with the Content-Encoding it came with
+def decodeBody(data, coding):
+    if coding is None:
+        return data
+    coding = coding.strip().lower()
+    if coding in ("gzip", "x-gzip"):
+        return zlib.decompress(data, 16 + zlib.MAX_WBITS)
+    elif coding == "deflate":
+        # some servers send raw deflate instead of the zlib format
+        try:
+            return zlib.decompress(data)
+        except zlib.error:
+            return zlib.decompress(data, -zlib.MAX_WBITS)
+    return data
+
+
+# Wraps writes to a request in the content coding the client asked for, so
+# a body of unknown length can be compressed as it's written
+class EncodingWriter(object):
+    def __init__(self, request, coding):
+        self.request = request
+        self._compressor = None
+        if coding is not None:
+            request.setHeader("Content-Encoding", coding)
+            self._compressor = _compressor(coding)
+
+    # true if anything was written.  the compressor holds on to data until
+    # it has enough to be worth writing
+    def write(self, data):
+        if self._compressor is not None:
+            data = self._compressor.compress(data)
+        if data:
+            self.request.write(data)
+            return True
+        return False
+
+    def finish(self):
+        if self._compressor is not None:
+            self.request.write(self._compressor.flush())
+        self.request.finish()
+
+
+# Compresses a large body a chunk at a time, as the client keeps up
+class _BodyProducer(object):
+    implements(IPullProducer)
+
+    def __init__(self, writer, body):
+        self.writer = writer
+        self.body = body
+        self.offset = 0
+
+    # the request only asks for more once something has been written, so
+    # keep going until the compressor gives something up
+    def resumeProducing(self):
+        while self.offset < len(self.body):
+            chunk = buffer(self.body, self.offset, CHUNK_SIZE)
+            self.offset = self.offset + CHUNK_SIZE
+            if self.writer.write(chunk):
+                return
+        self.writer.request.unregisterProducer()
+        self.writer.finish()
+
+    def stopProducing(self):
+        self.body = ""
+
+# Write a whole response body and finish the request, compressed if the
+# client accepts it and the body's big enough to bother
+def writeBody(request, body):
+    request.setHeader("Vary", "Accept-Encoding")
+    coding = None
+    if len(body) >= MIN_SIZE:
+        coding = negotiateEncoding(request)
+
+    writer = EncodingWriter(request, coding)
+    if coding is not None and len(body) > STREAM_SIZE:
+        request.registerProducer(_BodyProducer(writer, body), False)
+        return
+    writer.write(body)
+    writer.finish()
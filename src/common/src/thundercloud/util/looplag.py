@@ -0,0 +1,100 @@
+from twisted.internet import reactor
+
+from metrics import Metrics
+
+from collections import deque
+import time
+import os
+
+# Measures how late the reactor runs timers.  A callLater is scheduled every
+# interval seconds, and how long after its deadline it actually fires is the
+# lag: time the reactor spent on other work before it got around to it.  A
+# busy daemon shows up as growing lag long before anything fails outright.
+#
+# Samples go into a bounded window, and consumers such as job engines keep
+# a cursor into it so each can take percentiles of just the samples since
+# the last time it asked
+class _LoopLagMonitor(object):
+    def __init__(self, interval=0.05, window=12000, clock=reactor):
+        self.interval = interval
+        self.clock = clock
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self._expected = None
+        self._call = None
+
+    def start(self, interval=None):
+        if interval is not None:
+            self.interval = interval
+        if self._call is None:
+            self._schedule()
+
+    def stop(self):
+        if self._call is not None and self._call.active():
+            self._call.cancel()
+        self._call = None
+
+    def running(self):
+        return self._call is not None
+
+    def _schedule(self):
+        self._expected = self.clock.seconds() + self.interval
+        self._call = self.clock.callLater(self.interval, self._tick)
+
+    def _tick(self):
+        self.samples.append(max(self.clock.seconds() - self._expected, 0.0))
+        self.count = self.count + 1
+        self._schedule()
+
+    # a cursor marking the current end of the sample window
+    def cursor(self):
+        return self.count
+
+    # lag percentiles (in seconds) of the samples taken since cursor, and a
+    # new cursor.  samples which have already left the window are lost
+    def percentiles(self, cursor):
+        taken = min(self.count - cursor, len(self.samples))
+        if taken <= 0:
+            return {"p50": 0.0, "p90": 0.0, "p99": 0.0, "max": 0.0}, self.count
+
+        recent = sorted([self.samples[i] for i in xrange(len(self.samples) - taken, len(self.samples))])
+        def percentile(p):
+            return recent[min(int(p * taken), taken - 1)]
+        return {
+            "p50": percentile(0.50),
+            "p90": percentile(0.90),
+            "p99": percentile(0.99),
+            "max": recent[-1],
+        }, self.count
+
+    # CPU time used by the process, for working out how busy it was between
+    # two marks
+    def cpuMark(self):
+        times = os.times()
+        return (times[0] + times[1], time.time())
+
+    # fraction of one CPU the process used since mark, and a new mark
+    def cpu(self, mark):
+        now = self.cpuMark()
+        wall = now[1] - mark[1]
+        if wall <= 0:
+            return 0.0, mark
+        return (now[0] - mark[0]) / wall, now
+
+    # lag over (roughly) the last seconds, for the status APIs
+    def status(self, seconds=10):
+        samples = min(int(seconds / self.interval), len(self.samples))
+        (lag, cursor) = self.percentiles(self.count - samples)
+        lag["running"] = self.running()
+        lag["interval"] = self.interval
+        lag["samples"] = samples
+        return lag
+
+
+LoopLag = _LoopLagMonitor()
+
+def _lagQuantiles():
+    lag = LoopLag.status()
+    return dict([((quantile,), lag[key]) for (quantile, key) in [("0.5", "p50"), ("0.9", "p90"), ("0.99", "p99"), ("1", "max")]])
+
+Metrics.gauge("thundercloud_loop_lag_seconds", "How late the reactor ran timers over the last ten seconds", ("quantile",), function=_lagQuantiles)
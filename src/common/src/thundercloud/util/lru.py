@@ -0,0 +1,106 @@
+import time
+
+# A bounded least-recently-used cache with optional per-entry expiry.
+#
+# Entries live in a dict for O(1) lookup and on a circular doubly-linked
+# list for O(1) recency updates and eviction.  Links are plain lists
+# ([prev, next, key, value, expires]) rather than objects to keep the
+# per-entry overhead down, since some of these caches hold a lot of entries.
+#
+# onEvict, if given, is called with the key and value of every entry which
+# leaves the cache other than by being replaced or cleared: evicted, expired
+# or popped.
+_PREV, _NEXT, _KEY, _VALUE, _EXPIRES = 0, 1, 2, 3, 4
+
+class LRUCache(object):
+    def __init__(self, maxSize=1024, ttl=None, clock=time.time, onEvict=None):
+        self.maxSize = maxSize
+        self.ttl = ttl
+        self.clock = clock
+        self.onEvict = onEvict
+        self._map = {}
+        self._root = []
+        self._root[:] = [self._root, self._root, None, None, None]
+
+    def __len__(self):
+        return len(self._map)
+
+    def __contains__(self, key):
+        return self.get(key, _missing) is not _missing
+
+    def _unlink(self, link):
+        link[_PREV][_NEXT] = link[_NEXT]
+        link[_NEXT][_PREV] = link[_PREV]
+
+    def _linkAtHead(self, link):
+        root = self._root
+        link[_PREV] = root[_PREV]
+        link[_NEXT] = root
+        root[_PREV][_NEXT] = link
+        root[_PREV] = link
+
+    def get(self, key, default=None):
+        try:
+            link = self._map[key]
+        except KeyError:
+            return default
+
+        if link[_EXPIRES] is not None and link[_EXPIRES] <= self.clock():
+            self.pop(key)
+            return default
+
+        self._unlink(link)
+        self._linkAtHead(link)
+        return link[_VALUE]
+
+    def put(self, key, value, ttl=None):
+        if ttl is None:
+            ttl = self.ttl
+        if ttl is None:
+            expires = None
+        else:
+            expires = self.clock() + ttl
+
+        try:
+            link = self._map[key]
+        except KeyError:
+            link = [None, None, key, value, expires]
+            self._map[key] = link
+        else:
+            link[_VALUE] = value
+            link[_EXPIRES] = expires
+            self._unlink(link)
+        self._linkAtHead(link)
+
+        # evict from the cold end of the list
+        while len(self._map) > self.maxSize:
+            oldest = self._root[_NEXT]
+            self._unlink(oldest)
+            del self._map[oldest[_KEY]]
+            if self.onEvict is not None:
+                self.onEvict(oldest[_KEY], oldest[_VALUE])
+
+    def pop(self, key, default=None):
+        try:
+            link = self._map.pop(key)
+        except KeyError:
+            return default
+        self._unlink(link)
+        if self.onEvict is not None:
+            self.onEvict(key, link[_VALUE])
+        return link[_VALUE]
+
+    def clear(self):
+        self._map.clear()
+        self._root[:] = [self._root, self._root, None, None, None]
+
+    # keys from least to most recently used.  expired entries are included
+    def keys(self):
+        result = []
+        link = self._root[_NEXT]
+        while link is not self._root:
+            result.append(link[_KEY])
+            link = link[_NEXT]
+        return result
+
+_missing = object()
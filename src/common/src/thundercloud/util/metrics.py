@@ -0,0 +1,185 @@
+from bisect import bisect_left
+
+# Runtime counters for the monitoring scraper, exposed in the Prometheus text
+# format.  Everything here runs on the reactor thread, so updates are plain
+# attribute arithmetic: no locks, and nothing is allocated once a series
+# exists.  Metrics with labels hand out one child per set of label values,
+# which callers on hot paths should look up once and keep
+
+# response time buckets, in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _labelString(names, values, extra=None):
+    pairs = ["%s=\"%s\"" % (name, _escape(value)) for (name, value) in zip(names, values)]
+    if extra is not None:
+        pairs.append("%s=\"%s\"" % extra)
+    if not pairs:
+        return ""
+    return "{%s}" % ",".join(pairs)
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+def _valueLine(name, labelNames, values, value):
+    return "%s%s %s" % (name, _labelString(labelNames, values), _number(value))
+
+
+class _Metric(object):
+    kind = None
+
+    def __init__(self, name, help, labelNames=()):
+        self.name = name
+        self.help = help
+        self.labelNames = tuple(labelNames)
+        self._children = {}
+
+    # the series for one set of label values, created the first time
+    def labels(self, *values):
+        try:
+            return self._children[values]
+        except KeyError:
+            child = self._newChild()
+            self._children[values] = child
+            return child
+
+    def _newChild(self):
+        raise NotImplementedError
+
+    def _series(self):
+        if self.labelNames:
+            return self._children.items()
+        return [((), self)]
+
+    def expose(self):
+        lines = ["# HELP %s %s" % (self.name, self.help), "# TYPE %s %s" % (self.name, self.kind)]
+        for (values, series) in sorted(self._series()):
+            lines.extend(series._lines(self.name, self.labelNames, values))
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help, labelNames=()):
+        _Metric.__init__(self, name, help, labelNames)
+        self.value = 0
+
+    def _newChild(self):
+        return Counter(self.name, self.help)
+
+    def inc(self, amount=1):
+        self.value = self.value + amount
+
+    def _lines(self, name, labelNames, values):
+        return [_valueLine(name, labelNames, values, self.value)]
+
+
+# a value which goes up and down.  gauges can also be given a function which
+# is called at scrape time, for values that are already kept somewhere else;
+# with labels, the function returns a dict of label values -> value
+class Gauge(Counter):
+    kind = "gauge"
+
+    def __init__(self, name, help, labelNames=(), function=None):
+        Counter.__init__(self, name, help, labelNames)
+        self.function = function
+
+    def _newChild(self):
+        return Gauge(self.name, self.help)
+
+    def set(self, value):
+        self.value = value
+
+    def dec(self, amount=1):
+        self.value = self.value - amount
+
+    def _series(self):
+        if self.function is None:
+            return Counter._series(self)
+        if self.labelNames:
+            return [(values, _Constant(value)) for (values, value) in self.function().items()]
+        return [((), _Constant(self.function()))]
+
+
+class _Constant(object):
+    def __init__(self, value):
+        self.value = value
+
+    def _lines(self, name, labelNames, values):
+        return [_valueLine(name, labelNames, values, self.value)]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelNames=(), buckets=LATENCY_BUCKETS):
+        _Metric.__init__(self, name, help, labelNames)
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def _newChild(self):
+        return Histogram(self.name, self.help, buckets=self.buckets)
+
+    # counts are kept per bucket and only made cumulative when scraped
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum = self.sum + value
+        self.count = self.count + 1
+
+    def _lines(self, name, labelNames, values):
+        lines = []
+        total = 0
+        for (bound, count) in zip(self.buckets + (float("inf"),), self.counts):
+            total = total + count
+            lines.append("%s_bucket%s %d" % (name, _labelString(labelNames, values, ("le", _number(bound))), total))
+        labels = _labelString(labelNames, values)
+        lines.append("%s_sum%s %s" % (name, labels, _number(self.sum)))
+        lines.append("%s_count%s %d" % (name, labels, self.count))
+        return lines
+
+
+class MetricExists(Exception):
+    pass
+
+# All of a daemon's metrics, by name.  Asking for a metric that's already
+# registered returns it, so modules can declare the metrics they update
+class _Registry(object):
+    def __init__(self):
+        self.metrics = {}
+
+    def _register(self, cls, name, *args, **kwargs):
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = cls(name, *args, **kwargs)
+            self.metrics[name] = metric
+        elif metric.__class__ is not cls:
+            raise MetricExists("%s is already a %s" % (name, metric.kind))
+        return metric
+
+    def counter(self, name, help, labelNames=()):
+        return self._register(Counter, name, help, labelNames)
+
+    def gauge(self, name, help, labelNames=(), function=None):
+        return self._register(Gauge, name, help, labelNames, function)
+
+    def histogram(self, name, help, labelNames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram, name, help, labelNames, buckets)
+
+    def expose(self):
+        lines = []
+        for name in sorted(self.metrics.keys()):
+            lines.extend(self.metrics[name].expose())
+        return "\n".join(lines) + "\n"
+
+
+Metrics = _Registry()
@@ -0,0 +1,212 @@
+from twisted.internet import reactor
+
+import cProfile
+import pstats
+import signal
+import time
+import gc
+import logging
+
+log = logging.getLogger("profiler")
+
+# longest a profile may run for, so a forgotten one doesn't slow the daemon
+# down forever
+MAX_DURATION = 300
+
+CPROFILE = "cprofile"
+SAMPLING = "sampling"
+
+class ProfilerBusy(Exception):
+    pass
+
+class ProfilerUnavailable(Exception):
+    pass
+
+
+# Statistical profiler: every interval seconds of CPU time, SIGPROF
+# interrupts the reactor and the stack it was running is counted.  Much
+# cheaper than cProfile on a loaded process, at the cost of precision
+class _Sampler(object):
+    def __init__(self, interval):
+        if not hasattr(signal, "setitimer"):
+            raise ProfilerUnavailable("Sampling isn't supported on this platform")
+        if interval <= 0:
+            raise ValueError("Sampling interval must be positive")
+        self.interval = interval
+        self.samples = 0
+        self.selfCounts = {}
+        self.totalCounts = {}
+
+    def enable(self):
+        self._previous = signal.signal(signal.SIGPROF, self._sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def disable(self):
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, self._previous or signal.SIG_DFL)
+
+    def _sample(self, signum, frame):
+        self.samples = self.samples + 1
+        seen = set()
+        top = True
+        while frame is not None:
+            code = frame.f_code
+            key = (code.co_filename, code.co_firstlineno, code.co_name)
+            if top:
+                self.selfCounts[key] = self.selfCounts.get(key, 0) + 1
+                top = False
+            # recursive functions are only counted once per sample
+            if key not in seen:
+                seen.add(key)
+                self.totalCounts[key] = self.totalCounts.get(key, 0) + 1
+            frame = frame.f_back
+
+    def stats(self, sort, limit):
+        sortKey = {"self": 0, "time": 0}.get(sort, 1)
+        rows = []
+        for key in self.totalCounts.keys():
+            rows.append((self.selfCounts.get(key, 0), self.totalCounts[key], key))
+        rows.sort(key=lambda row: row[sortKey], reverse=True)
+
+        samples = float(max(self.samples, 1))
+        return [{
+            "function": name,
+            "file": filename,
+            "line": line,
+            "selfSamples": selfCount,
+            "totalSamples": totalCount,
+            "selfFraction": selfCount / samples,
+            "totalFraction": totalCount / samples,
+        } for (selfCount, totalCount, (filename, line, name)) in rows[:limit]]
+
+
+class _CProfiler(object):
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def enable(self):
+        self.profile.enable()
+
+    def disable(self):
+        self.profile.disable()
+
+    def stats(self, sort, limit):
+        sortKey = {"self": 2, "time": 2, "calls": 0}.get(sort, 3)
+        rows = pstats.Stats(self.profile).stats.items()
+        rows.sort(key=lambda row: row[1][sortKey], reverse=True)
+        return [{
+            "function": name,
+            "file": filename,
+            "line": line,
+            "calls": calls,
+            "primitiveCalls": primitiveCalls,
+            "totalTime": totalTime,
+            "cumulativeTime": cumulativeTime,
+        } for ((filename, line, name), (primitiveCalls, calls, totalTime, cumulativeTime, callers)) in rows[:limit]]
+
+
+# Profiles the reactor thread of a running daemon for a bounded amount of
+# time.  Only one profile runs at once; the last one's stats are kept until
+# the next one starts
+class _Profiler(object):
+    def __init__(self, clock=reactor):
+        self.clock = clock
+        self.mode = None
+        self.startTime = None
+        self.endTime = None
+        self.duration = None
+        self._profiler = None
+        self._stopCall = None
+
+    def running(self):
+        return self._stopCall is not None
+
+    def start(self, duration=30, mode=CPROFILE, interval=0.005):
+        if self.running():
+            raise ProfilerBusy("A profile is already running")
+        if mode == CPROFILE:
+            profiler = _CProfiler()
+        elif mode == SAMPLING:
+            profiler = _Sampler(interval)
+        else:
+            raise ProfilerUnavailable("Unknown profiler %s" % mode)
+
+        self.mode = mode
+        self.duration = max(0, min(duration, MAX_DURATION))
+        self.startTime = time.time()
+        self.endTime = None
+        self._profiler = profiler
+        self._profiler.enable()
+        self._stopCall = self.clock.callLater(self.duration, self.stop)
+        log.info("Started %s profile for %.1f seconds" % (mode, self.duration))
+
+    def stop(self):
+        if not self.running():
+            return
+        if self._stopCall.active():
+            self._stopCall.cancel()
+        self._stopCall = None
+        self._profiler.disable()
+        self.endTime = time.time()
+        log.info("Finished %s profile" % self.mode)
+
+    def status(self):
+        return {
+            "running": self.running(),
+            "mode": self.mode,
+            "startTime": self.startTime,
+            "endTime": self.endTime,
+            "duration": self.duration,
+        }
+
+    # aggregated stats of the current or last profile.  sort is "cumulative"
+    # (the default), "self" or, for cProfile, "calls"
+    def results(self, sort="cumulative", limit=50):
+        results = self.status()
+        results["stats"] = []
+        if self._profiler is not None:
+            results["stats"] = self._profiler.stats(sort, limit)
+        return results
+
+
+# Count live objects by type.  categories maps a name to a class, and counts
+# instances of the class and all of its subclasses, e.g. {"engines":
+# EngineBase}.  Only objects the garbage collector tracks are seen, which
+# leaves out things like strings and numbers
+def objectCounts(categories=None, limit=50):
+    categories = categories or {}
+    byType = {}
+    byCategory = dict([(name, 0) for name in categories.keys()])
+    for obj in gc.get_objects():
+        cls = getattr(obj, "__class__", type(obj))
+        name = "%s.%s" % (getattr(cls, "__module__", "?"), getattr(cls, "__name__", "?"))
+        byType[name] = byType.get(name, 0) + 1
+        for (category, categoryClass) in categories.iteritems():
+            if isinstance(obj, categoryClass):
+                byCategory[category] = byCategory[category] + 1
+
+    types = sorted(byType.items(), key=lambda item: item[1], reverse=True)
+    return {
+        "total": sum(byType.values()),
+        "categories": byCategory,
+        "types": types[:limit],
+    }
+
+
+# options for start() and results() from a REST request's query args.
+# raises ValueError if they're malformed
+def startArgs(args):
+    return {
+        "duration": float(args.get("duration", [30])[0]),
+        "mode": args.get("mode", [CPROFILE])[0],
+        "interval": float(args.get("interval", [0.005])[0]),
+    }
+
+def resultArgs(args):
+    return {
+        "sort": args.get("sort", ["cumulative"])[0],
+        "limit": int(args.get("limit", [50])[0]),
+    }
+
+
+Profiler = _Profiler()
@@ -2,6 +2,8 @@ from zope.interface import implements
 from twisted.web.client import HTTPClientFactory, _parse
 from twisted.internet import reactor
 
+from compression import decodeBody
+
 import simplejson as json
 import base64
 
@@ -9,10 +11,17 @@ import logging
 
 log = logging.getLogger("restApiClient")
 
+# undo the response's Content-Encoding, if it has one
+def _decodeResponse(page, factory):
+    codings = getattr(factory, "response_headers", {}).get("content-encoding")
+    if not codings:
+        return page
+    return decodeBody(page, codings[-1])
+
 # Cython compatibility
 def _RestApiClient__request(cls, url, method, postdata=None, cookies={}, timeout=None, credentials=None):
 
-    extraHeaders = {}
+    extraHeaders = {"Accept-Encoding": "gzip, deflate"}
     
     if postdata is not None:
         postdata = json.dumps(postdata)
@@ -41,7 +50,7 @@ def _RestApiClient__request(cls, url, method, postdata=None, cookies={}, timeout
                          cookies=cookies, 
                          timeout=timeout,
                          headers=extraHeaders)
-
+    factory.deferred.addCallback(_decodeResponse, factory)
     
     reactor.connectTCP(host, port, factory)
     return factory
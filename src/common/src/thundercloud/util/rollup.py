@@ -0,0 +1,211 @@
+from collections import deque
+import math
+
+# Round-robin rollups of a job's results_byTime.  Entries stay at full
+# resolution for a while, then get merged into progressively coarser tiers
+# as they age, so a job which runs for a week keeps a bounded number of
+# entries no matter how short its stats interval is.
+#
+# Entries are snapshots taken at the time they're keyed by, so merging two
+# of them has to respect what each value is:
+#
+#   - running totals and running averages are as of the later snapshot
+#   - rates are per second over the time the entry covers ("interval"), so
+#     they're averaged weighted by it
+#   - event loop lag is the worst seen.  merged percentiles are an upper
+#     bound rather than the true percentile
+#   - response time histograms are counts per bucket, and add up exactly
+#
+# A merged entry is keyed by the time of the latest snapshot in it and has
+# the tier's bucket size as its "resolution"
+
+# seconds entries stay at full resolution
+RECENT = 600
+
+# (bucket size, seconds an entry stays in the tier).  entries in the last
+# tier are kept for good
+TIERS = ((10, 3600), (60, 86400), (600, None))
+
+# most entries a query returns when it doesn't ask for a resolution
+MAX_POINTS = 1000
+
+# Slaves record stats in buckets on a grid of the job's statsInterval,
+# counted from the job's (shared) start, and key each entry by the end of
+# its bucket.  Intervals are whole seconds or tenths of one, and keys are
+# kept to tenths, so every slave's keys for a bucket come out the same
+def bucketTime(index, interval):
+    if isinstance(interval, (int, long)):
+        return index * interval
+    return round(index * interval, 1)
+
+# the index of the bucket ending at or just before time t
+def bucketIndex(t, interval):
+    return int(math.floor(float(t) / interval + 1e-6))
+
+
+_WEIGHTED = ("requestsPerSec", "throughput", "cpu")
+_WORST = ("loopLagP50", "loopLagP90", "loopLagP99", "loopLagMax")
+_ADDED = ("interval",)
+_HISTOGRAMS = ("responseTimes",)
+
+
+# a copy of entry as the first entry of a bucket resolution seconds wide
+def _bucketEntry(entry, resolution):
+    copied = dict(entry)
+    for key in _HISTOGRAMS:
+        if key in entry:
+            copied[key] = list(entry[key])
+    copied["resolution"] = resolution
+    return copied
+
+# merge entry b, snapshotted at time tb, with entry a from time ta
+def mergeEntries(ta, a, tb, b, resolution):
+    merged = dict(b)
+    if tb < ta:
+        merged = dict(a)
+    spanA = float(a.get("interval", 0))
+    spanB = float(b.get("interval", 0))
+    for key in _WEIGHTED:
+        if key in a or key in b:
+            if spanA + spanB > 0:
+                merged[key] = (float(a.get(key, 0)) * spanA + float(b.get(key, 0)) * spanB) / (spanA + spanB)
+            else:
+                merged[key] = max(float(a.get(key, 0)), float(b.get(key, 0)))
+    for key in _WORST:
+        if key in a or key in b:
+            merged[key] = max(float(a.get(key, 0)), float(b.get(key, 0)))
+    for key in _ADDED:
+        merged[key] = spanA + spanB
+    for key in _HISTOGRAMS:
+        if a.get(key) and b.get(key):
+            merged[key] = [x + y for (x, y) in zip(a[key], b[key])]
+        else:
+            merged[key] = list(a.get(key) or b.get(key) or [])
+    merged["resolution"] = resolution
+    return merged
+
+
+# One tier of buckets, oldest first.  Buckets are [time, entry]
+class _Tier(object):
+    def __init__(self, resolution, retention):
+        self.resolution = resolution
+        self.retention = retention
+        self.buckets = {}
+        self.order = deque()
+
+    def add(self, t, entry):
+        bucket = int(t // self.resolution)
+        try:
+            existing = self.buckets[bucket]
+        except KeyError:
+            self.buckets[bucket] = [t, _bucketEntry(entry, self.resolution)]
+            self.order.append(bucket)
+            return
+        merged = mergeEntries(existing[0], existing[1], t, entry, self.resolution)
+        existing[0] = max(existing[0], t)
+        existing[1] = merged
+
+    # pop the buckets which have been here longer than the retention
+    def expired(self, now):
+        while self.retention is not None and self.order:
+            (t, entry) = self.buckets[self.order[0]]
+            if now - t <= self.retention:
+                return
+            del self.buckets[self.order.popleft()]
+            yield (t, entry)
+
+    def entries(self):
+        return [(t, entry) for (t, entry) in self.buckets.itervalues()]
+
+
+# Keeps byTime (the engine's own statisticsByTime dict) down to the recent
+# entries, and the older ones in tiers.  The latest entry always stays in
+# byTime, since the engine works its rates out from it
+class RollupSeries(object):
+    def __init__(self, byTime, recent=RECENT, tiers=TIERS):
+        self.byTime = byTime
+        self.recent = recent
+        self.tiers = [_Tier(resolution, retention) for (resolution, retention) in tiers]
+        self._order = deque(sorted(byTime.keys()))
+
+    def __len__(self):
+        return len(self.byTime) + sum([len(tier.buckets) for tier in self.tiers])
+
+    # call after adding an entry to byTime at time t
+    def added(self, t):
+        self._order.append(t)
+        while len(self._order) > 1 and t - self._order[0] > self.recent:
+            oldest = self._order.popleft()
+            self._push(0, oldest, self.byTime.pop(oldest), t)
+
+    def _push(self, i, t, entry, now):
+        if i >= len(self.tiers):
+            return
+        self.tiers[i].add(t, entry)
+        for (expiredTime, expiredEntry) in list(self.tiers[i].expired(now)):
+            self._push(i + 1, expiredTime, expiredEntry, now)
+
+    # every entry, full resolution and rolled up, as time -> entry
+    def entries(self):
+        result = dict(self.byTime)
+        for tier in self.tiers:
+            result.update(dict(tier.entries()))
+        return result
+
+    def query(self, start=None, end=None, resolution=None, maxPoints=MAX_POINTS):
+        return queryByTime(self.entries(), start, end, resolution, maxPoints, [tier.resolution for tier in self.tiers])
+
+
+# The entries of a results_byTime dict between start and end (seconds since
+# the job started), at no finer than resolution seconds.  Entries finer than
+# that are merged on the way out; coarser ones are returned as they are.
+# Without a resolution, the finest of resolutions which keeps the result to
+# about maxPoints entries is used
+def queryByTime(byTime, start=None, end=None, resolution=None, maxPoints=MAX_POINTS, resolutions=None):
+    selected = []
+    for (key, entry) in byTime.iteritems():
+        t = float(key)
+        if (start is None or t >= start) and (end is None or t <= end):
+            selected.append((t, entry))
+    if not selected:
+        return {}
+
+    if resolution is None and len(selected) > maxPoints:
+        times = [t for (t, entry) in selected]
+        span = max(times) - min(times)
+        if start is not None and end is not None:
+            span = end - start
+        for candidate in (resolutions or [tier[0] for tier in TIERS]):
+            resolution = candidate
+            if span / candidate <= maxPoints:
+                break
+
+    if not resolution:
+        return dict(selected)
+
+    result = {}
+    buckets = {}
+    for (t, entry) in sorted(selected):
+        if float(entry.get("resolution", 0)) > resolution:
+            result[t] = entry
+            continue
+        bucket = int(t // resolution)
+        if bucket in buckets:
+            (previous, merged) = buckets[bucket]
+            del result[previous]
+            merged = mergeEntries(previous, merged, t, entry, resolution)
+        else:
+            merged = _bucketEntry(entry, resolution)
+        buckets[bucket] = (t, merged)
+        result[t] = merged
+    return result
+
+
+# query arguments from a REST request's query args, or None if there are
+# none.  raises ValueError if they're malformed
+def queryArgs(args):
+    query = {}
+    for (arg, key) in (("from", "start"), ("to", "end"), ("resolution", "resolution")):
+        if args.has_key(arg):
+            query[key] = float(args[arg][0])
+    return query or None
@@ -0,0 +1,204 @@
+from array import array
+import simplejson as json
+import struct
+import mmap
+import os
+
+# Raw per-request samples, one fixed-width record per completed request,
+# appended to a memory-mapped file.  Writing a sample is a single pack_into
+# the map: no Python objects are kept per sample, and the file can be
+# streamed back or analyzed offline long after the engine has rolled the
+# interval up into its averages.
+#
+# File layout (little endian):
+#
+#     header   magic "TCSL", version, record size, job start time, length
+#              of the target table
+#     targets  JSON list of the job's URLs, padded to 8 bytes.  records refer
+#              to them by index
+#     records  RECORD, back to back
+#
+# The file is grown in chunks as it fills up and truncated to its real
+# length when it's closed.  A file whose writer died is zero-filled past the
+# last record
+MAGIC = "TCSL"
+VERSION = 1
+HEADER = struct.Struct("<4sHHdI4x")
+
+# request start time (epoch seconds), target index, status, timeToConnect,
+# timeToHandshake, timeToFirstByte, elapsedTime, bytes received
+RECORD = struct.Struct("<diiffffI")
+FIELDS = ("startTime", "target", "status", "timeToConnect", "timeToHandshake", "timeToFirstByte", "elapsedTime", "bytesTransferred")
+
+# successful requests record their HTTP status, HTTP errors their error
+# status.  other failures get a negative status
+ERROR_STATUSES = {
+    "connectionLost": -1,
+    "timeout": -2,
+    "unknown": -3,
+}
+
+# requests for URLs which aren't in the target table
+UNKNOWN_TARGET = -1
+
+GROW_BY = 4 * 1024**2
+MAX_BYTES = 1024**3
+
+
+class InvalidSampleLog(Exception):
+    pass
+
+
+def _targetTable(targets):
+    table = json.dumps([str(target) for target in targets])
+    return table + " " * (-len(table) % 8)
+
+
+class SampleLogWriter(object):
+    def __init__(self, path, targets, startTime=0.0, maxBytes=MAX_BYTES, growBy=GROW_BY):
+        self.path = path
+        self.maxBytes = maxBytes
+        self.growBy = growBy
+        self.dropped = 0
+
+        table = _targetTable(targets)
+        self.dataOffset = HEADER.size + len(table)
+        self._capacity = max(min(self.dataOffset + growBy, maxBytes), self.dataOffset)
+        self._file = open(path, "w+b")
+        self._file.truncate(self._capacity)
+        self._map = mmap.mmap(self._file.fileno(), self._capacity)
+        self._tableLength = len(table)
+        self.setStartTime(startTime)
+        self._map[HEADER.size:self.dataOffset] = table
+        self.length = self.dataOffset
+
+    # bytes of the file which hold the header and complete records
+    def __len__(self):
+        return self.length
+
+    def setStartTime(self, startTime):
+        HEADER.pack_into(self._map, 0, MAGIC, VERSION, RECORD.size, startTime, self._tableLength)
+
+    def append(self, startTime, target, status, timeToConnect, timeToHandshake, timeToFirstByte, elapsedTime, bytesTransferred):
+        end = self.length + RECORD.size
+        if end > self._capacity and not self._grow(end):
+            self.dropped = self.dropped + 1
+            return
+        RECORD.pack_into(self._map, self.length, startTime, target, status, timeToConnect,
+                         timeToHandshake, timeToFirstByte, elapsedTime, bytesTransferred)
+        self.length = end
+
+    # make room for at least end bytes.  false once the log is full or closed
+    def _grow(self, end):
+        if self._map is None:
+            return False
+        capacity = min(max(self._capacity + self.growBy, end), self.maxBytes)
+        if capacity < end:
+            return False
+        self._map.resize(capacity)
+        self._capacity = capacity
+        return True
+
+    # samples appended after the log is closed are dropped
+    def close(self):
+        if self._map is None:
+            return
+        self._map.flush()
+        self._map.close()
+        self._map = None
+        self._capacity = 0
+        self._file.truncate(self.length)
+        self._file.close()
+
+
+# Read-only view of a sample log file
+class SampleLog(object):
+    def __init__(self, path):
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        if size < HEADER.size:
+            self._file.close()
+            raise InvalidSampleLog("%s is too short to be a sample log" % path)
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, version, recordSize, self.startTime, tableLength) = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION or recordSize != RECORD.size:
+            self.close()
+            raise InvalidSampleLog("%s isn't a version %d sample log" % (path, VERSION))
+        self.targets = json.loads(self._map[HEADER.size:HEADER.size + tableLength])
+        self.dataOffset = HEADER.size + tableLength
+
+        # leave off a partial record and the zero-filled tail of a log whose
+        # writer never closed it
+        count = (size - self.dataOffset) / RECORD.size
+        while count and RECORD.unpack_from(self._map, self.dataOffset + (count - 1) * RECORD.size)[0] == 0:
+            count = count - 1
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        if i < 0 or i >= self.count:
+            raise IndexError(i)
+        return RECORD.unpack_from(self._map, self.dataOffset + i * RECORD.size)
+
+    def __iter__(self):
+        for i in xrange(0, self.count):
+            yield RECORD.unpack_from(self._map, self.dataOffset + i * RECORD.size)
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+def _percentile(values, p):
+    return values[min(int(p / 100.0 * len(values)), len(values) - 1)]
+
+# Percentiles of one of the record's timings over windows of the log.
+# window is in seconds from the job's start (None for the whole log),
+# target limits the results to one URL index.  Only successful requests'
+# timings are counted; failures are just counted.  Returns a list of
+#
+#     {"start": seconds, "count": n, "errors": n, "mean": s, "percentiles": {p: s}}
+#
+# for each window with requests in it
+def analyze(log, field="elapsedTime", percentiles=(50, 90, 99, 99.9), window=None, target=None, start=None, end=None):
+    column = FIELDS.index(field)
+    origin = log.startTime
+    windows = {}
+    for record in log:
+        if target is not None and record[1] != target:
+            continue
+        offset = record[0] - origin
+        if (start is not None and offset < start) or (end is not None and offset >= end):
+            continue
+
+        key = 0
+        if window is not None:
+            key = int(offset // window)
+        try:
+            (values, errors) = windows[key]
+        except KeyError:
+            (values, errors) = windows[key] = (array("d"), [0])
+        if record[2] < 0 or record[2] >= 400:
+            errors[0] = errors[0] + 1
+        else:
+            values.append(record[column])
+
+    results = []
+    for key in sorted(windows.keys()):
+        (values, errors) = windows[key]
+        values = sorted(values)
+        result = {
+            "start": key * (window or 0),
+            "count": len(values) + errors[0],
+            "errors": errors[0],
+            "mean": None,
+            "percentiles": {},
+        }
+        if values:
+            result["mean"] = sum(values) / len(values)
+            result["percentiles"] = dict([(p, _percentile(values, p)) for p in percentiles])
+        results.append(result)
+    return results
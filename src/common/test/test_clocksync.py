@@ -0,0 +1,36 @@
+from thundercloud.util.clocksync import ClockOffset
+
+from twisted.trial import unittest
+
+
+class Offset(unittest.TestCase):
+
+    def test_symmetric(self):
+        """A reply stamped halfway through the trip gives the exact offset"""
+        clock = ClockOffset()
+        clock.sample(100.0, 110.5, 101.0)
+        self.assertEquals(clock.offset(), 10.0)
+        self.assertEquals(clock.error(), 0.5)
+        self.assertEquals(clock.toRemote(200.0), 210.0)
+
+    def test_shortestTrip(self):
+        """The least delayed of the recent samples is the one used"""
+        clock = ClockOffset(samples=3)
+        clock.sample(0.0, 3.0, 2.0)
+        clock.sample(10.0, 8.05, 10.1)
+        clock.sample(20.0, 19.0, 21.0)
+        self.assertAlmostEquals(clock.offset(), -2.0)
+        self.assertAlmostEquals(clock.error(), 0.05)
+
+        # the good sample ages out
+        clock.sample(30.0, 28.0, 34.0)
+        clock.sample(40.0, 38.0, 44.0)
+        self.assertAlmostEquals(clock.offset(), -1.5)
+
+    def test_empty(self):
+        """Without samples the clocks are taken to agree"""
+        clock = ClockOffset()
+        clock.sample(5.0, 5.0, 4.0)
+        self.assertEquals(len(clock), 0)
+        self.assertEquals(clock.offset(), 0.0)
+        self.assertEquals(clock.error(), None)
@@ -0,0 +1,75 @@
+from thundercloud.util.compression import writeBody, decodeBody, negotiateEncoding, gunzipBytes, MIN_SIZE, STREAM_SIZE
+
+from twisted.web.test.requesthelper import DummyRequest
+from twisted.trial import unittest
+
+import zlib
+
+class CompressionTestMixin(object):
+    def request(self, acceptEncoding=None):
+        request = DummyRequest([])
+        if acceptEncoding is not None:
+            request.headers["accept-encoding"] = acceptEncoding
+        return request
+
+    def body(self, size):
+        return ("{\"requestsPerSec\": 100.0, \"throughput\": 1024}, " * (size / 40 + 1))[:size]
+
+
+class Negotiation(CompressionTestMixin, unittest.TestCase):
+
+    def test_preference(self):
+        """gzip is preferred over deflate"""
+        self.assertEquals(negotiateEncoding(self.request("deflate, gzip")), "gzip")
+        self.assertEquals(negotiateEncoding(self.request("deflate")), "deflate")
+        self.assertEquals(negotiateEncoding(self.request("gzip;q=0, deflate")), "deflate")
+        self.assertEquals(negotiateEncoding(self.request()), None)
+
+
+class Bodies(CompressionTestMixin, unittest.TestCase):
+
+    def test_uncompressed(self):
+        """Clients which don't ask for compression get the body as it is"""
+        request = self.request()
+        body = self.body(MIN_SIZE * 4)
+        writeBody(request, body)
+        self.assertEquals("".join(request.written), body)
+        self.assertEquals(request.finished, 1)
+        self.assertFalse("content-encoding" in request.outgoingHeaders)
+
+    def test_small(self):
+        """Small bodies aren't compressed"""
+        request = self.request("gzip")
+        writeBody(request, "true")
+        self.assertEquals(request.written, ["true"])
+
+    def test_gzip(self):
+        """Bodies are gzipped for clients that take it"""
+        request = self.request("gzip")
+        body = self.body(MIN_SIZE * 4)
+        writeBody(request, body)
+        self.assertEquals(request.outgoingHeaders["content-encoding"], "gzip")
+        self.assertEquals(gunzipBytes("".join(request.written)), body)
+
+    def test_deflate(self):
+        """Bodies are deflated for clients that take it"""
+        request = self.request("deflate")
+        body = self.body(MIN_SIZE * 4)
+        writeBody(request, body)
+        self.assertEquals(zlib.decompress("".join(request.written)), body)
+
+    def test_streamed(self):
+        """Large bodies are compressed a chunk at a time"""
+        request = self.request("gzip")
+        body = self.body(STREAM_SIZE * 3)
+        writeBody(request, body)
+        self.assertTrue(len(request.written) > 1)
+        self.assertEquals(request.finished, 1)
+        self.assertEquals(decodeBody("".join(request.written), "gzip"), body)
+
+    def test_decodeRawDeflate(self):
+        """Raw deflate bodies are decoded too"""
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+        data = compressor.compress("hello") + compressor.flush()
+        self.assertEquals(decodeBody(data, "deflate"), "hello")
+        self.assertEquals(decodeBody("hello", None), "hello")
@@ -0,0 +1,54 @@
+from thundercloud.util.looplag import _LoopLagMonitor
+
+from twisted.internet import task
+from twisted.trial import unittest
+
+class LoopLagTestMixin(object):
+    def setUp(self):
+        self.clock = task.Clock()
+        self.monitor = _LoopLagMonitor(interval=0.1, window=100, clock=self.clock)
+        self.monitor.start()
+
+    def tearDown(self):
+        self.monitor.stop()
+
+
+class Lag(LoopLagTestMixin, unittest.TestCase):
+
+    def test_onTime(self):
+        """Timers which fire on time show no lag"""
+        self.clock.pump([0.1] * 10)
+        (lag, cursor) = self.monitor.percentiles(0)
+        self.assertEquals(cursor, 10)
+        self.assertAlmostEquals(lag["max"], 0.0)
+
+    def test_late(self):
+        """A busy reactor shows up as lag"""
+        self.clock.pump([0.1] * 9)
+        self.clock.advance(0.6)
+        (lag, cursor) = self.monitor.percentiles(0)
+        self.assertAlmostEquals(lag["max"], 0.5)
+        self.assertAlmostEquals(lag["p50"], 0.0)
+
+    def test_cursor(self):
+        """Percentiles only cover samples since the cursor"""
+        self.clock.advance(0.6)
+        cursor = self.monitor.cursor()
+        self.clock.pump([0.1] * 5)
+        (lag, cursor) = self.monitor.percentiles(cursor)
+        self.assertAlmostEquals(lag["max"], 0.0)
+        (lag, cursor) = self.monitor.percentiles(cursor)
+        self.assertEquals(lag["max"], 0.0)
+
+    def test_window(self):
+        """Samples past the window are dropped"""
+        self.clock.pump([0.1] * 150)
+        self.assertEquals(len(self.monitor.samples), 100)
+        (lag, cursor) = self.monitor.percentiles(0)
+        self.assertEquals(cursor, 150)
+
+    def test_cpu(self):
+        """CPU use is a fraction of wall clock time"""
+        mark = self.monitor.cpuMark()
+        (cpu, mark) = self.monitor.cpu((mark[0], mark[1] - 1))
+        self.assertTrue(0 <= cpu < 1)
@@ -0,0 +1,85 @@
+from thundercloud.util.metrics import _Registry, MetricExists
+
+from twisted.trial import unittest
+
+class MetricsTestMixin(object):
+    def setUp(self):
+        self.registry = _Registry()
+
+    def lines(self):
+        return self.registry.expose().splitlines()
+
+
+class Exposition(MetricsTestMixin, unittest.TestCase):
+
+    def test_counter(self):
+        """Counters are exposed with their help and type"""
+        counter = self.registry.counter("requests_total", "Requests")
+        counter.inc()
+        counter.inc(2)
+        self.assertEquals(self.lines(), ["# HELP requests_total Requests",
+                                         "# TYPE requests_total counter",
+                                         "requests_total 3"])
+
+    def test_labels(self):
+        """Each set of label values is its own series"""
+        counter = self.registry.counter("errors_total", "Errors", ("error",))
+        counter.labels("timeout").inc()
+        counter.labels("connect").inc(2)
+        counter.labels("timeout").inc()
+        self.assertEquals(self.lines()[2:], ["errors_total{error=\"connect\"} 2",
+                                             "errors_total{error=\"timeout\"} 2"])
+
+    def test_escaping(self):
+        """Label values are escaped"""
+        self.registry.counter("errors_total", "Errors", ("error",)).labels("a \"b\"\n").inc()
+        self.assertEquals(self.lines()[2], "errors_total{error=\"a \\\"b\\\"\\n\"} 1")
+
+    def test_gauge(self):
+        """Gauges go up and down"""
+        gauge = self.registry.gauge("in_flight", "In flight")
+        gauge.inc(5)
+        gauge.dec(2)
+        self.assertEquals(self.lines()[2], "in_flight 3")
+        gauge.set(1.5)
+        self.assertEquals(self.lines()[2], "in_flight 1.5")
+
+    def test_functionGauge(self):
+        """Function gauges are read at scrape time"""
+        values = {("idle",): 1, ("running",): 2}
+        self.registry.gauge("slaves", "Slaves", ("state",), function=lambda: values)
+        self.assertEquals(self.lines()[2:], ["slaves{state=\"idle\"} 1", "slaves{state=\"running\"} 2"])
+        values[("idle",)] = 0
+        self.assertEquals(self.lines()[2], "slaves{state=\"idle\"} 0")
+
+    def test_histogram(self):
+        """Histogram buckets are cumulative"""
+        histogram = self.registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+        histogram.observe(0.05)
+        histogram.observe(0.1)
+        histogram.observe(0.5)
+        histogram.observe(2.0)
+        self.assertEquals(self.lines()[2:], ["latency_seconds_bucket{le=\"0.1\"} 2",
+                                             "latency_seconds_bucket{le=\"1.0\"} 3",
+                                             "latency_seconds_bucket{le=\"+Inf\"} 4",
+                                             "latency_seconds_sum 2.65",
+                                             "latency_seconds_count 4"])
+
+
+class Registry(MetricsTestMixin, unittest.TestCase):
+
+    def test_getOrCreate(self):
+        """Registering a metric twice returns the same one"""
+        counter = self.registry.counter("requests_total", "Requests")
+        self.assertIdentical(self.registry.counter("requests_total", "Requests"), counter)
+
+    def test_kindMismatch(self):
+        """A name can't be reused for a different kind of metric"""
+        self.registry.counter("requests_total", "Requests")
+        self.assertRaises(MetricExists, self.registry.histogram, "requests_total", "Requests")
+
+    def test_sorted(self):
+        """Metrics are exposed in name order"""
+        self.registry.counter("b_total", "B")
+        self.registry.counter("a_total", "A")
+        self.assertEquals([line for line in self.lines() if not line.startswith("#")], ["a_total 0", "b_total 0"])
@@ -0,0 +1,72 @@
+from thundercloud.util.profiler import _Profiler, ProfilerBusy, ProfilerUnavailable, objectCounts, startArgs, CPROFILE, SAMPLING
+from thundercloud.spec.dataobject import DataObject
+
+from twisted.internet import task
+from twisted.trial import unittest
+
+import signal
+import time
+
+def busy(seconds):
+    end = time.time() + seconds
+    while time.time() < end:
+        pass
+
+class ProfilerTestMixin(object):
+    def setUp(self):
+        self.clock = task.Clock()
+        self.profiler = _Profiler(clock=self.clock)
+
+    def tearDown(self):
+        self.profiler.stop()
+
+    def functions(self, results):
+        return [stat["function"] for stat in results["stats"]]
+
+
+class Profiling(ProfilerTestMixin, unittest.TestCase):
+
+    def test_cprofile(self):
+        """cProfile stats include functions run while profiling"""
+        self.profiler.start(10, CPROFILE)
+        busy(0.01)
+        self.profiler.stop()
+        results = self.profiler.results()
+        self.assertFalse(results["running"])
+        self.assertTrue("busy" in self.functions(results))
+
+    def test_sampling(self):
+        """The sampling profiler counts the stacks it interrupts"""
+        if not hasattr(signal, "setitimer"):
+            raise unittest.SkipTest("No interval timers on this platform")
+        self.profiler.start(10, SAMPLING, interval=0.001)
+        busy(0.2)
+        self.profiler.stop()
+        results = self.profiler.results(sort="self")
+        self.assertTrue("busy" in self.functions(results))
+        self.assertTrue(results["stats"][0]["selfFraction"] > 0)
+
+    def test_timeBounded(self):
+        """Profiles stop on their own once the duration is up"""
+        self.profiler.start(5, CPROFILE)
+        self.assertTrue(self.profiler.running())
+        self.assertRaises(ProfilerBusy, self.profiler.start)
+        self.clock.advance(5)
+        self.assertFalse(self.profiler.running())
+
+    def test_badArgs(self):
+        """Unknown profilers and malformed arguments are rejected"""
+        self.assertRaises(ProfilerUnavailable, self.profiler.start, 5, "foo")
+        self.assertRaises(ValueError, startArgs, {"duration": ["soon"]})
+        self.assertFalse(self.profiler.running())
+
+
+class Objects(unittest.TestCase):
+
+    def test_categories(self):
+        """Live objects are counted by type and by category"""
+        objects = [DataObject() for i in range(0, 10)]
+        counts = objectCounts({"dataObjects": DataObject})
+        self.assertTrue(counts["categories"]["dataObjects"] >= 10)
+        self.assertTrue(counts["total"] >= 10)
+        self.assertTrue(len(counts["types"]) <= 50)
@@ -0,0 +1,118 @@
+from thundercloud.util.rollup import RollupSeries, mergeEntries, queryByTime, queryArgs, bucketTime, bucketIndex
+
+from twisted.trial import unittest
+
+# a stats entry the way an engine takes them, one a second at 10 requests/sec
+def entry(t):
+    return {
+        "iterations_total": t * 10,
+        "requestsPerSec": 10.0,
+        "loopLagMax": t == 5 and 0.5 or 0.01,
+        "interval": 1,
+        "responseTimes": [10, 0],
+    }
+
+class RollupTestMixin(object):
+    def setUp(self):
+        self.byTime = {}
+        self.series = RollupSeries(self.byTime, recent=20, tiers=((10, 60), (60, None)))
+
+    def fill(self, seconds):
+        for t in range(1, seconds + 1):
+            self.byTime[t] = entry(t)
+            self.series.added(t)
+
+
+class Merge(unittest.TestCase):
+
+    def test_merge(self):
+        """Totals come from the later entry, rates are weighted, histograms add"""
+        a = {"iterations_total": 10, "requestsPerSec": 10.0, "loopLagP99": 0.2, "interval": 1, "responseTimes": [1, 2]}
+        b = {"iterations_total": 40, "requestsPerSec": 15.0, "loopLagP99": 0.1, "interval": 2, "responseTimes": [3, 4]}
+        merged = mergeEntries(1, a, 3, b, 10)
+        self.assertEquals(merged["iterations_total"], 40)
+        self.assertAlmostEquals(merged["requestsPerSec"], 40 / 3.0)
+        self.assertEquals(merged["loopLagP99"], 0.2)
+        self.assertEquals(merged["interval"], 3)
+        self.assertEquals(merged["responseTimes"], [4, 6])
+        self.assertEquals(merged["resolution"], 10)
+        self.assertEquals(mergeEntries(3, b, 1, a, 10), merged)
+
+
+class Buckets(unittest.TestCase):
+
+    def test_grid(self):
+        """Bucket keys come out the same however they're worked out"""
+        self.assertEquals(bucketTime(3, 0.1), 0.3)
+        self.assertEquals(bucketTime(3, 0.1), bucketTime(bucketIndex(0.1 + 0.2, 0.1), 0.1))
+        self.assertEquals(bucketTime(7, 5), 35)
+        self.assertEquals(bucketIndex(0.3, 0.1), 3)
+        self.assertEquals(bucketIndex(0.39, 0.1), 3)
+        self.assertEquals(bucketIndex(35, 5), 7)
+
+
+class Series(RollupTestMixin, unittest.TestCase):
+
+    def test_recent(self):
+        """Recent entries stay at full resolution"""
+        self.fill(15)
+        self.assertEquals(len(self.series), 15)
+        self.assertEquals(sorted(self.byTime.keys()), range(1, 16))
+
+    def test_rolledUp(self):
+        """Older entries are merged into coarser intervals"""
+        self.fill(45)
+        entries = self.series.entries()
+        # 25..45 at full resolution, 1..24 in 10 second buckets
+        self.assertEquals(len(self.byTime), 21)
+        self.assertEquals(sorted([t for t in entries if t < 25]), [9, 19, 24])
+        self.assertEquals(entries[19]["iterations_total"], 190)
+        self.assertEquals(entries[19]["interval"], 10)
+        self.assertEquals(entries[19]["responseTimes"], [100, 0])
+        self.assertEquals(entries[9]["loopLagMax"], 0.5)
+
+    def test_bounded(self):
+        """Entries past the tier's retention move to the next tier"""
+        self.fill(3600)
+        # 20 full resolution, 60 seconds of 10s buckets and a minute apiece
+        # before that
+        self.assertTrue(len(self.series) < 20 + 8 + 61)
+        total = sum([e["interval"] for e in self.series.entries().values()])
+        self.assertEquals(total, 3600)
+        self.assertEquals(self.series.entries()[3600]["iterations_total"], 36000)
+
+
+class Query(RollupTestMixin, unittest.TestCase):
+
+    def test_range(self):
+        """Queries return the entries in a time range"""
+        self.fill(45)
+        self.assertEquals(sorted(self.series.query(30, 35).keys()), range(30, 36))
+
+    def test_resolution(self):
+        """Finer entries are merged up to the asked for resolution"""
+        self.fill(45)
+        result = self.series.query(resolution=10)
+        # the rolled up 20..24 bucket and full resolution 25..29 are one
+        self.assertEquals(sorted(result.keys()), [9, 19, 29, 39, 45])
+        self.assertEquals(result[29]["interval"], 10)
+        self.assertEquals(result[29]["iterations_total"], 290)
+        self.assertEquals(result[39]["responseTimes"], [100, 0])
+
+    def test_automatic(self):
+        """Without a resolution, one is picked to keep the result small"""
+        self.fill(45)
+        self.assertEquals(len(self.series.query(maxPoints=10)), 5)
+
+    def test_strings(self):
+        """Queries work on decoded JSON results"""
+        byTime = {"1.5": {"requestsPerSec": "10.0", "interval": 1}, "2.5": {"requestsPerSec": "20.0", "interval": 1}}
+        result = queryByTime(byTime, resolution=10)
+        self.assertEquals(result.keys(), [2.5])
+        self.assertAlmostEquals(result[2.5]["requestsPerSec"], 15.0)
+
+    def test_args(self):
+        """Query arguments come from the request's args"""
+        self.assertEquals(queryArgs({}), None)
+        self.assertEquals(queryArgs({"from": ["10"], "resolution": ["60"]}), {"start": 10.0, "resolution": 60.0})
+        self.assertRaises(ValueError, queryArgs, {"to": ["soon"]})
@@ -0,0 +1,110 @@
+from thundercloud.util.samplelog import SampleLogWriter, SampleLog, InvalidSampleLog, analyze, RECORD, UNKNOWN_TARGET
+
+from twisted.trial import unittest
+
+import os
+
+class SampleLogTestMixin(object):
+    def setUp(self):
+        self.path = self.mktemp()
+        self.writer = SampleLogWriter(self.path, ["http://a/", "http://b/"], startTime=1000.0, growBy=RECORD.size * 4)
+
+    def tearDown(self):
+        self.writer.close()
+
+    # one request every 100ms for the first second, then one a second
+    def fill(self):
+        for i in range(0, 10):
+            self.writer.append(1000.0 + i * 0.1, 0, 200, 0.001, 0, 0.002, (i + 1) * 0.01, 100)
+        for i in range(0, 5):
+            self.writer.append(1001.0 + i, 1, -2, 0.001, 0, 0, 10.0, 0)
+
+
+class Log(SampleLogTestMixin, unittest.TestCase):
+
+    def test_roundTrip(self):
+        """Records read back the way they were written"""
+        self.fill()
+        self.writer.close()
+        log = SampleLog(self.path)
+        self.assertEquals(len(log), 15)
+        self.assertEquals(log.targets, ["http://a/", "http://b/"])
+        self.assertEquals(log.startTime, 1000.0)
+        record = log[9]
+        self.assertAlmostEquals(record[0], 1000.9)
+        self.assertEquals(record[1:3], (0, 200))
+        self.assertAlmostEquals(record[6], 0.1, places=6)
+        self.assertEquals(record[7], 100)
+        log.close()
+
+    def test_truncatedOnClose(self):
+        """A closed log is exactly as long as what was written"""
+        self.fill()
+        self.writer.close()
+        self.assertEquals(os.path.getsize(self.path), len(self.writer))
+        self.assertEquals(len(self.writer), self.writer.dataOffset + 15 * RECORD.size)
+
+    def test_unclosed(self):
+        """The zero-filled tail of a log that was never closed is ignored"""
+        self.fill()
+        self.writer._map.flush()
+        self.assertTrue(os.path.getsize(self.path) > len(self.writer))
+        log = SampleLog(self.path)
+        self.assertEquals(len(log), 15)
+        log.close()
+
+    def test_full(self):
+        """Samples past the size limit are dropped"""
+        self.writer.close()
+        writer = SampleLogWriter(self.path, [], maxBytes=100, growBy=10)
+        for i in range(0, 5):
+            writer.append(1.0, UNKNOWN_TARGET, 200, 0, 0, 0, 0, 0)
+        self.assertEquals(writer.dropped, 5 - (100 - writer.dataOffset) / RECORD.size)
+        writer.close()
+
+    def test_appendAfterClose(self):
+        """Samples of requests that finish after the log is closed are dropped"""
+        self.writer.close()
+        self.writer.append(1.0, 0, 200, 0, 0, 0, 0, 0)
+        self.assertEquals(self.writer.dropped, 1)
+
+    def test_invalid(self):
+        """Files which aren't sample logs are refused"""
+        f = open(self.path + ".bad", "wb")
+        f.write("x" * 100)
+        f.close()
+        self.assertRaises(InvalidSampleLog, SampleLog, self.path + ".bad")
+
+
+class Analysis(SampleLogTestMixin, unittest.TestCase):
+
+    def setUp(self):
+        SampleLogTestMixin.setUp(self)
+        self.fill()
+        self.writer.close()
+        self.log = SampleLog(self.path)
+
+    def tearDown(self):
+        self.log.close()
+        SampleLogTestMixin.tearDown(self)
+
+    def test_whole(self):
+        """Without a window the whole log is one result"""
+        results = analyze(self.log, percentiles=(50, 100))
+        self.assertEquals(len(results), 1)
+        self.assertEquals(results[0]["count"], 15)
+        self.assertEquals(results[0]["errors"], 5)
+        self.assertAlmostEquals(results[0]["percentiles"][50], 0.06, places=6)
+        self.assertAlmostEquals(results[0]["percentiles"][100], 0.1, places=6)
+
+    def test_windows(self):
+        """Windows are counted from the job's start"""
+        results = analyze(self.log, window=2)
+        self.assertEquals([r["start"] for r in results], [0, 2, 4])
+        self.assertEquals([r["count"] for r in results], [11, 2, 2])
+        self.assertEquals(results[1]["mean"], None)
+
+    def test_filters(self):
+        """Samples can be limited to a target and a time range"""
+        self.assertEquals(analyze(self.log, target=1)[0]["count"], 5)
+        self.assertEquals(analyze(self.log, start=0.5, end=2)[0]["count"], 6)
@@ -0,0 +1,14 @@
+from twisted.internet import reactor
+from thundercloud import config
+from thunderserver.relay.server import startServer
+import sys
+
+if __name__ == "__main__":
+    try:
+        config.readConfig(sys.argv[1])
+    except:
+        print "No config file specified, exiting"
+        sys.exit(1)
+        
+    reactor.callWhenRunning(startServer, config.parameter("network", "port", type=int))
+    reactor.run()
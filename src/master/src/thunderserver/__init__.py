@@ -2,6 +2,7 @@ from twisted.internet import reactor
 from thunderserver.restApi import createRestApi
 from thundercloud import config
 from thunderserver.orchestrator import Orchestrator
+from thunderserver.orchestrator.archive import ResultsArchive
 from thundercloud.spec.slave import SlaveSpec
 from twisted.internet.defer import DeferredList, inlineCallbacks, returnValue
 import logging
@@ -9,6 +10,8 @@ import sys
 
 from thundercloud.spec.user import UserSpec
 from thunderserver.orchestrator.user import UserManager
+from thundercloud.authentication.cache import credentialCache
+from thundercloud.util.looplag import LoopLag
 
 from twisted.python import log as twistedLog
 
@@ -17,6 +20,12 @@ def startServer(port):
     logging.basicConfig(level=eval("logging.%s" % config.parameter("log", "level")))
     log = logging.getLogger("main")
     twistedLog.startLogging(sys.stderr)
+
+    credentialCache.configure(maxSize=config.parameter("auth", "cache.size", type=int, default=4096),
+                              ttl=config.parameter("auth", "cache.ttl", type=int, default=300),
+                              tokenTtl=config.parameter("auth", "token.ttl", type=int, default=3600))
+    ResultsArchive.configure(config.parameter("cache", "results.size", type=int, default=64))
+    LoopLag.start(config.parameter("monitor", "lag.interval", type=float, default=0.05))
     
     # add slaves in the INI file if they're around and add-able
     slaves = {}
@@ -23,6 +23,10 @@ class JobNodeDBChecker(DBChecker):
     def __init__(self, db, jobId):
         super(JobNodeDBChecker, self).__init__(db)
         self.jobId = jobId
+
+    # cache job ownership along with the password
+    def cacheScope(self):
+        return ("JobNodeDBChecker", self.jobId)
     
     def getUserAndPassword(self, username):
         results = self.db.execute("SELECT users.id, username, password FROM users INNER JOIN jobs ON users.id = jobs.user WHERE username = ? AND deleted = 'f' AND jobs.id = ?", (username, self.jobId)).fetchone()
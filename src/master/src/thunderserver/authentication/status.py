@@ -0,0 +1,31 @@
+from zope.interface import implements
+
+from twisted.web.resource import IResource
+from twisted.cred.portal import IRealm
+
+from thundercloud.authentication.dbchecker import DBChecker, IDBChecker, UserNotFound
+from thundercloud.authentication.cache import credentialCache
+from thundercloud import config
+    
+    
+# the status tree can profile and inspect the running master, so only the
+# administrators named in the config ([status] admins, comma-separated) get
+# in, and nobody does until some are named.  the slave account (user 0) is
+# shared by every slave and relay, so it never gets in
+class StatusDBChecker(DBChecker):
+    implements(IDBChecker)
+    
+    def __init__(self, dbHandle, cache=credentialCache, admins=None):
+        DBChecker.__init__(self, dbHandle, cache)
+        if admins is None:
+            admins = config.parameter("status", "admins", default="").split(",")
+        self.admins = set([username.strip() for username in admins if username.strip()])
+    
+    def getUserAndPassword(self, username):
+        if username not in self.admins:
+            raise UserNotFound
+        results = self.db.execute("SELECT username, password FROM users WHERE username = ? AND deleted = 'f' AND id <> 0", (username,)).fetchone()
+        if results is None:
+            raise UserNotFound
+        else:
+            return (results["username"], results["password"])
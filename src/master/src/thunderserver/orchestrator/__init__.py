@@ -1,5 +1,6 @@
 from orchestrator import _Orchestrator, NoSlavesAvailable
+from job import JobNotFound
 
 Orchestrator = _Orchestrator()
 
-__all__ = [Orchestrator, NoSlavesAvailable]
\ No newline at end of file
+__all__ = [Orchestrator, NoSlavesAvailable, JobNotFound]
\ No newline at end of file
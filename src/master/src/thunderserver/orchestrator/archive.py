@@ -0,0 +1,93 @@
+from thundercloud.spec.job import JobState
+from thundercloud.util.lru import LRUCache
+from thundercloud.util.compression import gzipBytes
+
+from ..db import dbConnection as db
+
+import simplejson as json
+
+import logging
+import datetime
+
+log = logging.getLogger("orchestrator.archive")
+
+class JobNotFound(Exception):
+    pass
+
+# Final results of a finished job, encoded once and kept ready to be written
+# out.  Gzipped variants are only built the first time someone asks for them
+class ArchivedResults(object):
+    def __init__(self, jobId, results):
+        self.jobId = jobId
+        self.jobState = results.get("job_state", JobState.UNKNOWN)
+        self.full = json.dumps(results)
+        results.pop("results_byTime", None)
+        self.short = json.dumps(results)
+        self._compressed = {}
+
+    def encoded(self, short, compressed=False):
+        if short == True:
+            body = self.short
+        else:
+            body = self.full
+
+        if not compressed:
+            return body
+
+        try:
+            return self._compressed[short == True]
+        except KeyError:
+            self._compressed[short == True] = gzipBytes(body)
+            return self._compressed[short == True]
+
+
+# Aggregated results for finished jobs are written to the jobs table once, and
+# every slave's own results to jobdata, so they can be read back without
+# asking the slaves for them again.  The most recently used ones are kept
+# encoded in memory
+class _ResultsArchive(object):
+    def __init__(self, maxSize=64):
+        self._cache = LRUCache(maxSize)
+
+    def configure(self, maxSize):
+        self._cache.maxSize = maxSize
+
+    # the only place a job's final results get written.  a job's results are
+    # only ever archived once; storing them again hands back what's there
+    def store(self, jobId, aggregateResults, slaveResults):
+        log.info("Archiving results for job %d" % jobId)
+        updated = db.execute("UPDATE jobs SET endTime = ?, results = ? WHERE id = ? AND results IS NULL",
+                             (datetime.datetime.now(), aggregateResults, jobId)).rowcount
+        if updated == 0:
+            log.warn("Job %d's results are already archived" % jobId)
+            return self.get(jobId)
+        for (slaveId, jobResults) in slaveResults:
+            db.execute("INSERT INTO jobdata (job, slave, results) VALUES (?, ?, ?)",
+                       (jobId, slaveId, jobResults))
+
+        entry = ArchivedResults(jobId, aggregateResults.toJson())
+        self._cache.put(jobId, entry)
+        return entry
+
+    def get(self, jobId):
+        entry = self._cache.get(jobId)
+        if entry is not None:
+            return entry
+
+        row = db.execute("SELECT results FROM jobs WHERE id = ?", (jobId,)).fetchone()
+        if row is None or row["results"] is None:
+            raise JobNotFound
+
+        entry = ArchivedResults(jobId, row["results"].toJson())
+        self._cache.put(jobId, entry)
+        return entry
+
+    # per-slave results as they were when the job finished
+    def slaveResults(self, jobId):
+        return [(row["slave"], row["results"]) for row in
+                db.execute("SELECT slave, results FROM jobdata WHERE job = ?", (jobId,)).fetchall()]
+
+    def clear(self):
+        self._cache.clear()
+
+ResultsArchive = _ResultsArchive()
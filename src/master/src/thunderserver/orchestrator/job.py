@@ -1,16 +1,25 @@
-from thundercloud.spec.job import JobResults, JobState
+from thundercloud.spec.job import JobSpec, JobResults, JobState
+from thundercloud.util.metrics import Metrics
+from thundercloud.util.rollup import queryByTime, bucketTime, bucketIndex
+from thundercloud import config
 
-from twisted.internet.defer import DeferredList, inlineCallbacks, returnValue
+from twisted.internet.defer import Deferred, DeferredList, inlineCallbacks, returnValue, succeed
 from twisted.internet.task import LoopingCall
 
-from slave import SlaveAllocator
+from slave import SlaveAllocator, SlaveNotFound
+from archive import ResultsArchive, JobNotFound
 
 import simplejson as json
 
 import logging
+import math
+import time
 
 log = logging.getLogger("orchestrator.perspectives")
 
+_fanout = Metrics.histogram("thundercloud_fanout_seconds", "Time for all of a job's slaves to answer an operation, by operation", ("operation",))
+_slaveErrors = Metrics.counter("thundercloud_slave_errors_total", "Failed requests to slaves")
+
 def _mergeDict(lhs, rhs, merge=lambda l, r: l):
     if type(lhs) != type(rhs) != dict:
         raise AttributeError
@@ -68,39 +77,69 @@ def AggregateJobResults_aggregateResultsByTimeSort(cls, a, b):
     return int(float(a)-float(b))
 
 
-def AggregateJobResults_aggregateResultsByTime(cls, statsList, statsInterval):
+# add one slave's stats entry into an aggregate interval, scaled by weight
+def _aggregateEntry(result, entry, weight):
+    for v in ["iterations_total", "iterations_success", "iterations_fail", "requestsPerSec", "bytesTransferred", "throughput"]:
+        try:
+            result[v] += entry[v] * weight
+        except KeyError:
+            result[v] = entry[v] * weight
+
+    for v in ["requestsRequested", "requestsIssued"]:
+        result[v] = result.get(v, 0) + entry.get(v, 0) * weight
+
+    # the busiest slave is the one that skews the results
+    for m in ["loopLagP50", "loopLagP90", "loopLagP99", "loopLagMax", "cpu"]:
+        result[m] = max(result.get(m, 0), entry.get(m, 0))
+
+    # XXX this is summing when it really should be averaging
+    for u in ["timeToConnect", "timeToHandshake", "timeToFirstByte", "responseTime"]:
+        try:
+            result[u] += entry[u]
+        except KeyError:
+            result[u] = 0
+    
+    for d in ["errors"]:
+        try:
+            result[d] = _mergeDict(result[d], entry[d], lambda l, r: l+r)
+        except:
+            result[d] = entry[d]
+
+    # histogram counts add up like the totals
+    if entry.get("responseTimes"):
+        counts = result.get("responseTimes") or [0] * len(entry["responseTimes"])
+        result["responseTimes"] = [c + n * weight for (c, n) in zip(counts, entry["responseTimes"])]
+
+
+# Slaves key their entries by the end of stats buckets on a grid shared by
+# the whole job, so each entry lands in exactly one interval.  Entries off
+# the grid are shared between the two intervals either side of them,
+# weighted by how close they are to each.  Entries the slaves have rolled up
+# are binned at their own, coarser, resolution, so the work done here only
+# grows with the number of entries the slaves send.  Results which are
+# going to be aggregated again (by a relay's master) keep full precision
+def AggregateJobResults_aggregateResultsByTime(cls, statsList, statsInterval, reducePrecision=True):
     result = {}
     for stat in statsList:
-        sortedKeys = sorted(stat.keys(), AggregateJobResults._aggregateResultsByTimeSort)
-        for i in range(0, int(float(sortedKeys[-1]))+1, statsInterval):
-            try:
-                result[i]
-            except KeyError:
-                result[i] = {}
-                    
-            for k in sortedKeys:
-                if i - statsInterval <= float(k) < i + statsInterval:
-                    distance = (statsInterval - abs(float(k) - i))
-                    weight = distance / statsInterval
-                    for v in ["iterations_total", "iterations_success", "iterations_fail", "requestsPerSec", "bytesTransferred", "throughput"]:
-                        try:
-                            result[i][v] += stat[k][v] * weight
-                        except KeyError:
-                            result[i][v] = stat[k][v] * weight
-
-                    # XXX this is summing when it really should be averaging
-                    for u in ["timeToConnect", "timeToFirstByte", "responseTime"]:
-                        try:
-                            result[i][u] += stat[k][u]
-                        except KeyError:
-                            result[i][u] = 0
-                    
-                    for d in ["errors"]:
-                        try:
-                            result[i][d] = _mergeDict(result[i][d], stat[k][d], lambda l, r: l+r)
-                        except:
-                            result[i][d] = stat[k][d]
-                        
+        for k in stat.keys():
+            step = max(statsInterval, int(math.ceil(float(stat[k].get("resolution", 0)))))
+            index = bucketIndex(k, step)
+            fraction = float(k) / step - index
+            if fraction < 1e-6:
+                fraction = 0
+            for (i, weight) in [(bucketTime(index, step), 1 - fraction), (bucketTime(index + 1, step), fraction)]:
+                if weight <= 0:
+                    continue
+                try:
+                    result[i]
+                except KeyError:
+                    result[i] = {}
+                _aggregateEntry(result[i], stat[k], weight)
+                if step > statsInterval:
+                    result[i]["resolution"] = max(result[i].get("resolution", 0), step)
+
+    if not reducePrecision:
+        return result
 
     # go through and change float values to reduced precision values
     # hopefully this shitty use of CPU time saves some network time and bandwidth
@@ -121,11 +160,11 @@ class AggregateJobResults(JobResults):
     _aggregateResultsByTimeSort = classmethod(AggregateJobResults_aggregateResultsByTimeSort)
     _aggregateResultsByTime = classmethod(AggregateJobResults_aggregateResultsByTime)   
     
-    _manuallyAggregate = ["job_id", "job_state", "results_byTime"]
+    _manuallyAggregate = ["job_id", "job_state", "results_byTime", "search"]
     _aggregateByAdding = ["job_nodes", "iterations_total", "iterations_complete", "iterations_fail", "transfer_total",  "results_errors"]
     _aggregateByAveraging = ["time_elapsed", "time_paused", "limits_transfer", "limits_duration"]
     
-    def aggregate(self, jobResults, statsInterval, shortResults):
+    def aggregate(self, jobResults, statsInterval, shortResults, reducePrecision=True):
         for attr in self._attributes:                
             # don't change the job ID, since we want the job ID in the
             # master server and not the slave servers
@@ -158,7 +197,7 @@ class AggregateJobResults(JobResults):
         
         # results_byTime might not exist if the results are shortResults. if it's there, aggregate some results
         if shortResults != True:
-            self.results_byTime = AggregateJobResults._aggregateResultsByTime([jobResult.results_byTime for jobResult in jobResults], statsInterval)
+            self.results_byTime = AggregateJobResults._aggregateResultsByTime([jobResult.results_byTime for jobResult in jobResults], statsInterval, reducePrecision)
         
         
 # Job perspective: local job ID corresponds to multiple remote job IDs on
@@ -170,13 +209,29 @@ class JobHealth(object):
     OK = 0
     ERROR = 1
 
+# the job spec each of a job's slaves runs: the client function and transfer
+# limit spread evenly over slaveCount slaves
+def slaveJobSpec(jobSpec, slaveCount):
+    modifiedJobSpec = JobSpec(jobSpec.toJson())
+    modifiedJobSpec.clientFunction = "(%s)/%s" % (jobSpec.clientFunction, slaveCount)
+    modifiedJobSpec.transferLimit = jobSpec.transferLimit / slaveCount
+    return modifiedJobSpec
+
+
 class JobPerspective(object):
+    # round off results_byTime for the client
+    reducePrecision = True
+
     def __init__(self, jobId, jobSpec):
         self.jobId = jobId
         self.jobSpec = jobSpec
         self.mapping = {}
         self.health = JobHealth.OK
         self.task = LoopingCall(self.state)
+        self.finished = Deferred()
+        self.archived = False
+        self.search = None          # a SEARCH job's ThroughputSearch
+        self.startTime = None       # when the slaves start, on this host's clock
         
         self._started = False
         self._finished = False
@@ -202,10 +257,11 @@ class JobPerspective(object):
         # we should probably mark the job state as unknown and cancel
         # the whole thing, since it couldn't be completed as asked
         yield self._jobOp("stopJob", ignoreHealth=True)
+        self._jobIsFinished()
         returnValue(True)
    
     def _jobIsStarted(self):
-        if self._started == False:
+        if self._started == False and self._finished == False:
             log.debug("Starting job %d" % self.jobId)
             for slave in self.mapping.iterkeys():
                 SlaveAllocator.markAsRunning(slave)
@@ -215,10 +271,13 @@ class JobPerspective(object):
     def _jobIsFinished(self):
         if self._finished == False:
             log.debug("Finishing job %d" % self.jobId)
-            for slave in self.mapping.iterkeys():
-                SlaveAllocator.markAsFinished(slave)
-            self.task.stop()
+            if self._started:
+                for slave in self.mapping.iterkeys():
+                    SlaveAllocator.markAsFinished(slave)
+            if self.task.running:
+                self.task.stop()
             self._finished = True
+            self._collectFinalResults()
 
     # this is just a pass-through to the DeferredList callback
     def _jobOpSlaveCallback(self, value):
@@ -226,6 +285,7 @@ class JobPerspective(object):
     
     # though here we want to intercept errors
     def _jobOpSlaveErrback(self, error, slave):
+        _slaveErrors.inc()
         self.handleSlaveError(slave, error)
         return error
    
@@ -240,6 +300,7 @@ class JobPerspective(object):
             if self.health == JobHealth.ERROR:
                 returnValue(False)
 
+        startTime = time.time()
         requests = []
         for slave, remoteId in self.mapping.iteritems():
             request = getattr(slave, "%s" % operation)(remoteId, *args)
@@ -247,14 +308,40 @@ class JobPerspective(object):
             request.addErrback(self._jobOpSlaveErrback, slave)
             requests.append(request)
 
-        deferredList = DeferredList(requests, consumeErrors=True)
-        yield deferredList
+        results = yield DeferredList(requests, consumeErrors=True)
+        _fanout.labels(operation).observe(time.time() - startTime)
         
-        returnValue(deferredList.result)
+        returnValue(results)
     
+    # a few rounds of heartbeats to every slave, so their clock offsets are
+    # fresh.  slaves which don't answer are left to the health checks
     @inlineCallbacks
-    def start(self):
-        request = self._jobOp("startJob")
+    def syncClocks(self, rounds):
+        for i in range(0, rounds):
+            yield DeferredList([slave.heartbeat() for slave in self.mapping.iterkeys()], consumeErrors=True)
+
+    # how far ahead to schedule the start, so the start request has reached
+    # every slave by then: the configured lead, or a few of the slowest
+    # round trips if that's longer
+    def _startLead(self):
+        lead = config.parameter("jobs", "start.lead", type=float, default=0.5)
+        errors = [slave.clock.error() for slave in self.mapping.iterkeys() if slave.clock.error() is not None]
+        if errors:
+            lead = max(lead, 8 * max(errors))
+        return lead
+
+    # every slave starts at startAt (epoch seconds, on this host's clock),
+    # translated to the slave's own clock, so all of them count the job's
+    # time from the same moment.  without a startAt, the start is scheduled
+    # just far enough ahead for the request to get to all of them
+    @inlineCallbacks
+    def start(self, startAt=None):
+        if startAt is None:
+            yield self.syncClocks(config.parameter("jobs", "start.sync", type=int, default=3))
+            startAt = time.time() + self._startLead()
+        if self.startTime is None:
+            self.startTime = startAt
+        request = self._jobOp("startJob", startAt)
         yield request        
         self._jobIsStarted()
         returnValue(request.result)
@@ -268,13 +355,19 @@ class JobPerspective(object):
     def stop(self):
         return self._jobOp("stopJob")
     
+    # run a SEARCH job at rate requests/sec, shared evenly over its slaves
+    def setRate(self, rate):
+        return self._jobOp("setJobRate", float(rate) / max(len(self.mapping), 1))
+    
     @inlineCallbacks
     def state(self):
         
         # this line is repeated twice: once at the beginning for
         # new calls to state(), and once after checking the DeferredList
-        # in case the health has suffered during the call
+        # in case the health has suffered during the call.  a job in error
+        # is as finished as it's going to get
         if self.health == JobHealth.ERROR:
+            self._jobIsFinished()
             returnValue(JobState.ERROR)
             
         request = self._jobOp("jobState")
@@ -282,6 +375,7 @@ class JobPerspective(object):
 
         # see above
         if self.health == JobHealth.ERROR:
+            self._jobIsFinished()
             returnValue(JobState.ERROR)
 
         states = []
@@ -296,37 +390,52 @@ class JobPerspective(object):
         returnValue(jobState)
         
   
+    # query narrows down results_byTime; see RollupSeries.query
     @inlineCallbacks
-    def results(self, shortResults):
-        request = self._jobOp("jobResults", shortResults)
+    def results(self, shortResults, query=None):
+        request = self._aggregateResults(shortResults, query)
         yield request
+        if request.result is False:
+            returnValue(False)
         
-        if self.health == JobHealth.ERROR:
+        (aggregateResults, slaveResults) = request.result
+        
+        # if the job is done, cancel the timer
+        if aggregateResults.job_state == JobState.COMPLETE:
+            self._jobIsFinished()
+        
+        returnValue(aggregateResults)
+
+    # fetch results from all slaves and combine them.  returns the aggregate
+    # along with the (slave, JobResults) pairs it was built from.  with
+    # ignoreHealth, a job in error gets what its remaining slaves have
+    @inlineCallbacks
+    def _aggregateResults(self, shortResults, query=None, ignoreHealth=False):
+        # _jobOp fires off requests in mapping order
+        slaves = self.mapping.keys()
+        results = yield self._jobOp("jobResults", shortResults, query, ignoreHealth=ignoreHealth)
+        
+        if self.health == JobHealth.ERROR and not ignoreHealth:
             returnValue(False)
         
-        results = request.result
         aggregateResults = AggregateJobResults()
         
-        # decode all json.  for speed's sake, try once as a list comprehension, but if one is
-        # false then the list comprehension will fail -- fall back to a for loop,
-        # rejecting failed responses
+        # decode all json, rejecting failed responses
         decodedResults = []
-        try:
-            decodedResults = \
-                [(status, JobResults(json.loads(result))) for (status, result) in results]
-        except:
-            log.debug("Could not decode all results. results: %s" % results)
-       
-            for (status, result) in results:
-                if status == True:
-                    decodedResults.append((status, JobResults(json.loads(result))))
+        for (slave, (status, result)) in zip(slaves, results):
+            if status == True:
+                decodedResults.append((slave, JobResults(json.loads(result))))
+            else:
+                log.debug("Could not decode all results. results: %s" % results)
            
         # set the job ID to the master's job ID
         aggregateResults.job_id = self.jobId
         
         # combine and add results from all the slave servers.  this 
         # aggregates things like bytes transferred, requests completed, etc.
-        aggregateResults.aggregate([result for (status, result) in decodedResults], self.jobSpec.statsInterval, shortResults)
+        # a job which lost all of its slaves has nothing to combine
+        if decodedResults:
+            aggregateResults.aggregate([result for (slave, result) in decodedResults], self.jobSpec.statsInterval, shortResults, self.reducePrecision)
         
         # if we're doing no stats, cut out results_byTime complete
         if shortResults == True:
@@ -335,14 +444,81 @@ class JobPerspective(object):
             except AttributeError:
                 pass
         
+        if self.search is not None:
+            aggregateResults.search = self.search.report()
+        
         # if the job is unhealthy, stop the whole thing, and overwrite whatever the
         # merged state was
         if self.health == JobHealth.ERROR:
             aggregateResults.job_state = JobState.ERROR
         
-        # if the job is done, cancel the timer
-        if aggregateResults.job_state == JobState.COMPLETE:
-            self._jobIsFinished()
+        returnValue((aggregateResults, decodedResults))
+
+    # once the job is done, pull the full results one last time and hand
+    # them to whoever is waiting on self.finished, as the aggregate results
+    # and a list of (slave ID, JobResults).  a job which ended in error is
+    # archived with whatever its remaining slaves have
+    @inlineCallbacks
+    def _collectFinalResults(self):
+        try:
+            result = yield self._aggregateResults(False, ignoreHealth=True)
+        except Exception, ex:
+            log.error("Could not collect final results for job %d: %s" % (self.jobId, ex))
+            self.finished.callback(False)
+            return
         
-        returnValue(aggregateResults)       
+        if result is False:
+            self.finished.callback(False)
+            return
         
+        (aggregateResults, decodedResults) = result
+        slaveResults = []
+        for (slave, jobResults) in decodedResults:
+            try:
+                slaveId = SlaveAllocator._getSlaveIdByObject(slave)
+            except SlaveNotFound:
+                slaveId = None
+            slaveResults.append((slaveId, jobResults))
+        self.finished.callback((aggregateResults, slaveResults))
+
+    # drop references to the job's timers so the job can be garbage collected
+    def release(self):
+        if self.task.running:
+            self.task.stop()
+        self.mapping = {}
+
+
+# A finished job.  Its final aggregated results come out of the archive, so
+# nothing here talks to the slaves
+class ArchivedJob(object):
+    def __init__(self, jobId):
+        self.jobId = jobId
+        self.archive = ResultsArchive.get(jobId)
+        self.mapping = {}
+
+    # normal job operations don't do anything on an archived job
+    def start(self):
+        return succeed(False)
+
+    def pause(self):
+        return succeed(False)
+
+    def resume(self):
+        return succeed(False)
+
+    def stop(self):
+        return succeed(False)
+
+    def state(self):
+        return succeed(self.archive.jobState)
+
+    def results(self, shortResults, query=None):
+        results = AggregateJobResults(json.loads(self.archive.encoded(shortResults)))
+        if shortResults == True:
+            try:
+                del(results.results_byTime)
+            except AttributeError:
+                pass
+        elif query is not None:
+            results.results_byTime = queryByTime(results.results_byTime, **query)
+        return succeed(results)
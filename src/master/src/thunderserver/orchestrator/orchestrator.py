@@ -1,14 +1,20 @@
-from thundercloud.spec.job import JobSpec
+from thundercloud.spec.job import JobSpec, JobState
 
 from twisted.internet.defer import Deferred, DeferredList
 from twisted.internet.defer import inlineCallbacks
 from twisted.internet.defer import returnValue
+from twisted.internet import reactor
 
 from ..db import dbConnection as db
-from job import JobPerspective
+from job import JobPerspective, ArchivedJob, slaveJobSpec
+from search import ThroughputSearch
+from archive import ResultsArchive, JobNotFound
 from slave import SlaveAllocator, SlaveAlreadyConnected, NoSlavesAvailable, InsufficientSlaveCapacity
 from user import UserPerspective, UserManager
 
+from thundercloud import config
+from thundercloud.util.metrics import Metrics
+
 import simplejson as json
 
 import logging
@@ -19,11 +25,77 @@ log = logging.getLogger("orchestrator")
 class NoSlavesAvailable(Exception):
     pass
 
-# Handle the multitude of jobs and slaves in the system
+# Handle the multitude of jobs and slaves in the system.  Only jobs which
+# haven't finished yet (plus finished jobs inside the retention window) are
+# kept in memory; everything else is looked up in the DB on demand
 class _Orchestrator(object):
     def __init__(self):
         self.jobs = {}
-         
+        Metrics.gauge("thundercloud_jobs", "Jobs in memory, by state", ("state",), function=self._jobsByState)
+
+    def _jobsByState(self):
+        counts = {("new",): 0, ("running",): 0, ("finished",): 0}
+        for job in self.jobs.itervalues():
+            if job._finished:
+                counts[("finished",)] += 1
+            elif job._started:
+                counts[("running",)] += 1
+            else:
+                counts[("new",)] += 1
+        return counts
+
+    # seconds a finished job stays in memory before it's evicted
+    def _retention(self):
+        return config.parameter("jobs", "retention", type=int, default=600)
+
+    # once a job's results are archived, it's served from the archive even
+    # if it's still in memory
+    def _getJob(self, jobId):
+        try:
+            job = self.jobs[jobId]
+        except KeyError:
+            return ArchivedJob(jobId)
+        
+        if job.archived:
+            return ArchivedJob(jobId)
+        return job
+
+    # jobs which complete or end in error are archived, then evicted once
+    # the retention window is up
+    def _jobFinished(self, results, jobId):
+        if results is not False:
+            (aggregateResults, slaveResults) = results
+            ResultsArchive.store(jobId, aggregateResults, slaveResults)
+            if aggregateResults.job_state == JobState.ERROR:
+                self._logToDb(jobId, "error")
+            else:
+                self._logToDb(jobId, "complete")
+            try:
+                self.jobs[jobId].archived = True
+            except KeyError:
+                pass
+        reactor.callLater(self._retention(), self._evictJob, jobId)
+
+    # a job which still hasn't been started once the retention window is up
+    # is removed, here and on its slaves
+    def _expireJob(self, jobId):
+        job = self.jobs.get(jobId)
+        if job is None or job._started or job._finished:
+            return
+        log.info("Removing job %d, which was never started" % jobId)
+        self._logToDb(jobId, "expire")
+        deferred = job._jobOp("removeJob", ignoreHealth=True)
+        deferred.addBoth(lambda result: self._evictJob(jobId))
+        return deferred
+
+    def _evictJob(self, jobId):
+        try:
+            job = self.jobs.pop(jobId)
+        except KeyError:
+            return
+        log.debug("Evicting job %d from memory" % jobId)
+        job.release()
+
     def _getJobNo(self):
         jobNo = db.execute("SELECT jobNo FROM jobno").fetchone()["jobNo"]
         db.execute("UPDATE jobno SET jobNo = ?", (jobNo + 1,))
@@ -65,18 +137,21 @@ class _Orchestrator(object):
                 remoteJobId = int(json.loads(remoteJobId))
                 self.jobs[jobId].addSlave(slave, remoteJobId)
             else:
+                self.jobs.pop(jobId).release()
                 deferred.errback(jobId)
                 return
         log.info("Created job %d" % jobId)
             
         self._logToDb(jobId, "create")
         db.execute("INSERT INTO jobs (id, user, spec) VALUES (?, ?, ?)", (jobId, user.userId, self.jobs[jobId].jobSpec))
+        reactor.callLater(self._retention(), self._expireJob, jobId)
         deferred.callback(jobId)
     
     @inlineCallbacks
     def createJob(self, username, jobSpec):
         jobNo = self._getJobNo()
         job = JobPerspective(jobNo, jobSpec)
+        job.finished.addCallback(self._jobFinished, jobNo)
         self.jobs[jobNo] = job
         
         user = yield UserManager.get(username)
@@ -87,11 +162,7 @@ class _Orchestrator(object):
         log.debug("Using slaves: %s" % slaves)
         
         # divide the client function to spread the load over all slaves in the set
-        clientFunctionPerSlave = "(%s)/%s" % (jobSpec.clientFunction, len(slaves))
-        transferLimitPerSlave = jobSpec.transferLimit / len(slaves)
-        modifiedJobSpec = JobSpec(jobSpec.toJson())
-        modifiedJobSpec.clientFunction = clientFunctionPerSlave
-        modifiedJobSpec.transferLimit = transferLimitPerSlave
+        modifiedJobSpec = slaveJobSpec(jobSpec, len(slaves))
         
         deferred = Deferred()
         slaveRequests = []
@@ -105,24 +176,42 @@ class _Orchestrator(object):
         yield deferredList
         returnValue(jobNo)    
     
+    # a SEARCH job starts with its search, which then runs it until it's
+    # found the knee.  only the first start does; the job only starts once
     def startJob(self, jobId):
+        job = self._getJob(jobId)
         self._logToDb(jobId, "start")
-        return self.jobs[jobId].start()
+        if isinstance(job, JobPerspective) and job.jobSpec.profile == JobSpec.JobProfile.SEARCH:
+            if job.search is None and not job._started:
+                job.search = ThroughputSearch(job)
+                return job.search.begin()
+        return job.start()
     
     def pauseJob(self, jobId):
+        job = self._getJob(jobId)
         self._logToDb(jobId, "pause")
-        return self.jobs[jobId].pause()
+        return job.pause()
     
     def resumeJob(self, jobId):
+        job = self._getJob(jobId)
         self._logToDb(jobId, "resume")
-        return self.jobs[jobId].resume()
+        return job.resume()
     
     def stopJob(self, jobId):
+        job = self._getJob(jobId)
         self._logToDb(jobId, "stop")
-        return self.jobs[jobId].stop()
+        return job.stop()
 
     def jobState(self, jobId):
-        return self.jobs[jobId].state()
+        return self._getJob(jobId).state()
     
-    def jobResults(self, jobId, short):
-        return self.jobs[jobId].results(short)
+    def jobResults(self, jobId, short, query=None):
+        return self._getJob(jobId).results(short, query)
+
+    # the archived results of a finished job, or None if the job hasn't
+    # been archived yet
+    def archivedResults(self, jobId):
+        job = self.jobs.get(jobId)
+        if job is not None and not job.archived:
+            return None
+        return ResultsArchive.get(jobId)
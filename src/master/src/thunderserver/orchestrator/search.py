@@ -0,0 +1,195 @@
+from thundercloud.spec.job import JobState, SEARCH_DEFAULTS
+from thundercloud.util.metrics import LATENCY_BUCKETS
+
+from twisted.internet import reactor, task
+from twisted.internet.defer import inlineCallbacks, returnValue
+
+import logging
+
+log = logging.getLogger("orchestrator.search")
+
+# fraction of the rate asked for a step has to actually get answered at.
+# past the knee, a target falls behind before its latency shows it
+ACHIEVED = 0.95
+
+class SearchPhase:
+    RAMP = "ramp"
+    BISECT = "bisect"
+    DONE = "done"
+    INTERRUPTED = "interrupted"
+
+
+# the response time under which fraction p of the responses counted in a
+# LATENCY_BUCKETS histogram came back.  it's the upper edge of the bucket
+# the percentile falls in, so it errs on the slow side
+def histogramPercentile(counts, p):
+    total = sum(counts)
+    if total == 0:
+        return None
+    seen = 0
+    for (i, count) in enumerate(counts):
+        seen = seen + count
+        if seen >= p * total and i < len(LATENCY_BUCKETS):
+            return LATENCY_BUCKETS[i]
+    return float("inf")
+
+
+# How the target did between start and end (seconds into the job), from a
+# job's aggregated results_byTime.  Running totals are taken from the last
+# entry in the window less the last one before it; the response time
+# histograms of the entries in the window add up.  None if there are no
+# entries in the window yet
+def measureWindow(byTime, start, end):
+    entries = sorted([(float(t), entry) for (t, entry) in byTime.iteritems() if float(t) <= end + 1e-6])
+    before = [(t, entry) for (t, entry) in entries if t <= start + 1e-6]
+    inside = [(t, entry) for (t, entry) in entries if t > start + 1e-6]
+    if not inside:
+        return None
+
+    (lastTime, last) = inside[-1]
+    (baseTime, base) = (start, None)
+    if before:
+        (baseTime, base) = before[-1]
+    def delta(key):
+        if base is None:
+            return float(last[key])
+        return float(last[key]) - float(base[key])
+
+    answered = delta("iterations_success") + delta("iterations_fail")
+    histogram = [0.0] * (len(LATENCY_BUCKETS) + 1)
+    for (t, entry) in inside:
+        for (i, count) in enumerate(entry.get("responseTimes") or []):
+            histogram[i] = histogram[i] + float(count)
+    return {
+        "from": baseTime,
+        "to": lastTime,
+        "requestsPerSec": answered / max(lastTime - baseTime, 1e-6),
+        "errorRate": answered and delta("iterations_fail") / answered or 0.0,
+        "p99": histogramPercentile(histogram, 0.99),
+    }
+
+
+# Looks for the highest rate a SEARCH job's target takes while meeting the
+# job's SLO.  The rate goes up a step at a time from the search's start
+# until a step misses the SLO, then the gap between the last step which met
+# it and the first which didn't is halved until it's within the search's
+# precision.  The last rate which met the SLO is the knee.
+#
+# Each rate runs for stepDuration seconds across all of the job's slaves,
+# and is judged on the job's aggregated stats once its warmup is over.  A
+# job which stops running some other way (paused, stopped, lost a slave)
+# ends the search, with whatever it had found so far
+class ThroughputSearch(object):
+    def __init__(self, job, clock=reactor):
+        self.job = job
+        self.clock = clock
+
+        search = dict(SEARCH_DEFAULTS)
+        search.update(job.jobSpec.search)
+        self.p99 = search.get("p99")
+        self.errorRate = search.get("errorRate")
+        self.start = float(search["start"])
+        self.step = float(search.get("step", self.start))
+        self.precision = float(search.get("precision", self.step / 8))
+        self.stepDuration = search["stepDuration"]
+        self.warmup = search["warmup"]
+        self.ceiling = float(search["max"])
+
+        self.phase = SearchPhase.RAMP
+        self.rate = min(self.start, self.ceiling)
+        self.passed = None          # highest rate which met the SLO
+        self.failed = None          # lowest rate which didn't
+        self.steps = []
+
+    # set the first rate and start the job.  the search carries on in the
+    # background; what's found so far is in report()
+    @inlineCallbacks
+    def begin(self):
+        yield self.job.setRate(self.rate)
+        started = yield self.job.start()
+        self._search().addErrback(self._searchFailed)
+        returnValue(started)
+
+    def _elapsed(self):
+        return max(self.clock.seconds() - self.job.startTime, 0)
+
+    @inlineCallbacks
+    def _search(self):
+        while self.phase in (SearchPhase.RAMP, SearchPhase.BISECT):
+            stepStart = self._elapsed()
+            yield task.deferLater(self.clock, self.stepDuration, lambda: None)
+
+            state = yield self.job.state()
+            if state != JobState.RUNNING:
+                self.phase = SearchPhase.INTERRUPTED
+                break
+            windowStart = stepStart + self.warmup
+            results = yield self.job._aggregateResults(False, {"start": max(windowStart - self.job.jobSpec.statsInterval, 0)})
+            if results is False:
+                self.phase = SearchPhase.INTERRUPTED
+                break
+
+            measured = measureWindow(results[0].results_byTime, windowStart, self._elapsed())
+            missed = self._judge(self.rate, measured)
+            self.steps.append({"phase": self.phase, "rate": self.rate, "measured": measured, "passed": missed is None, "missed": missed})
+            log.info("Job %d: %.2f requests/sec %s" % (self.job.jobId, self.rate, missed is None and "met the SLO" or "missed the SLO on %s" % missed))
+
+            self.rate = self._next(self.rate, missed is None)
+            if self.rate is not None:
+                yield self.job.setRate(self.rate)
+
+        if self.phase == SearchPhase.DONE:
+            log.info("Job %d: knee at %s requests/sec" % (self.job.jobId, self.passed))
+            yield self.job.stop()
+
+    def _searchFailed(self, failure):
+        log.error("Job %d's search failed: %s" % (self.job.jobId, failure))
+        self.phase = SearchPhase.INTERRUPTED
+
+    # what about the step missed the SLO, or None if it met it
+    def _judge(self, rate, measured):
+        if measured is None:
+            return "results"
+        if self.p99 is not None and (measured["p99"] is None or measured["p99"] > self.p99):
+            return "p99"
+        if self.errorRate is not None and measured["errorRate"] > self.errorRate:
+            return "errorRate"
+        if measured["requestsPerSec"] < ACHIEVED * rate:
+            return "requestsPerSec"
+        return None
+
+    # the next rate to try, or None once the search is done
+    def _next(self, rate, passed):
+        if passed:
+            self.passed = rate
+        else:
+            self.failed = rate
+
+        if self.phase == SearchPhase.RAMP:
+            if passed:
+                if rate >= self.ceiling:
+                    self.phase = SearchPhase.DONE
+                    return None
+                return min(rate + self.step, self.ceiling)
+            self.phase = SearchPhase.BISECT
+
+        low = self.passed or 0.0
+        if self.failed - low <= self.precision:
+            self.phase = SearchPhase.DONE
+            return None
+        return (low + self.failed) / 2.0
+
+    def report(self):
+        knee = None
+        for step in self.steps:
+            if step["passed"] and step["rate"] == self.passed:
+                knee = step["measured"]
+        return {
+            "phase": self.phase,
+            "knee": self.passed,
+            "kneeMeasured": knee,
+            "firstMissed": self.failed,
+            "ceiling": self.ceiling,
+            "slo": {"p99": self.p99, "errorRate": self.errorRate},
+            "steps": self.steps,
+        }
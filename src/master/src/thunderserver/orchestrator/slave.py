@@ -2,13 +2,19 @@ from ..db import dbConnection as db
 from thundercloud.util.restApiClient import RestApiClient
 from thundercloud.spec.slave import SlaveState
 from thundercloud import config
+from thundercloud.util.metrics import Metrics
+from thundercloud.util.clocksync import ClockOffset
 
 from twisted.internet.defer import inlineCallbacks
 from twisted.internet.defer import returnValue
 
 from twisted.internet.task import LoopingCall
 
+import simplejson as json
+
 import logging
+import urllib
+import time
 import copy
 import math
 
@@ -18,6 +24,7 @@ log = logging.getLogger("orchestrator.slave")
 class SlavePerspective(object):
     def __init__(self, slaveSpec):
         self.slaveSpec = slaveSpec
+        self.clock = ClockOffset()
     
     def url(self, path=None):
         if path is None:
@@ -31,8 +38,11 @@ class SlavePerspective(object):
         log.debug("Creating job with spec %s" % jobSpec)
         return RestApiClient.POST(self.url("/job"), postdata=jobSpec.toJson())
            
-    def startJob(self, jobId):
-        return RestApiClient.POST(self.url("/job/%d/start" % jobId))
+    # startAt is on the master's clock, and is sent on the slave's
+    def startJob(self, jobId, startAt=None):
+        if startAt is None:
+            return RestApiClient.POST(self.url("/job/%d/start" % jobId))
+        return RestApiClient.POST(self.url("/job/%d/start?at=%.6f" % (jobId, self.clock.toRemote(startAt))))
 
     def pauseJob(self, jobId):
         return RestApiClient.POST(self.url("/job/%d/pause" % jobId))
@@ -43,17 +53,42 @@ class SlavePerspective(object):
     def stopJob(self, jobId):
         return RestApiClient.POST(self.url("/job/%d/stop" % jobId))
     
+    # rate is this slave's share, in requests/sec
+    def setJobRate(self, jobId, rate):
+        return RestApiClient.POST(self.url("/job/%d/rate?rps=%.4f" % (jobId, rate)))
+    
+    def removeJob(self, jobId):
+        return RestApiClient.POST(self.url("/job/%d/remove" % jobId))
+    
     def jobState(self, jobId):
         return RestApiClient.GET(self.url("/job/%d/state" % jobId))
     
-    def jobResults(self, jobId, shortResults):
+    # query narrows down results_byTime; see RollupSeries.query
+    def jobResults(self, jobId, shortResults, query=None):
         if shortResults == True:
             return RestApiClient.GET(self.url("/job/%d/results?short=true" % jobId))
+        elif query:
+            args = [(arg, query[key]) for (arg, key) in (("from", "start"), ("to", "end"), ("resolution", "resolution")) if query.get(key) is not None]
+            return RestApiClient.GET(self.url("/job/%d/results?%s" % (jobId, urllib.urlencode(args))))
         else:
             return RestApiClient.GET(self.url("/job/%d/results" % jobId))
     
     def heartbeat(self):
-        return RestApiClient.GET(self.url("/status/heartbeat"))
+        sent = time.time()
+        request = RestApiClient.GET(self.url("/status/heartbeat"))
+        request.addCallback(self._heartbeatCallback, sent)
+        return request
+
+    # heartbeats carry the slave's clock, which is how its offset from ours
+    # is worked out
+    def _heartbeatCallback(self, result, sent):
+        received = time.time()
+        try:
+            remoteTime = float(json.loads(result)["time"])
+        except (ValueError, TypeError, KeyError):
+            return result
+        self.clock.sample(sent, remoteTime, received)
+        return result
 
 class NoSlavesAvailable(Exception):
     pass
@@ -74,6 +109,16 @@ class SlaveConnectionError(Exception):
 class _SlaveAllocator(object):
     def __init__(self):
         self.slaves = {}
+        Metrics.gauge("thundercloud_slaves", "Connected slaves, by allocator state", ("state",), function=self._slavesByState)
+
+    # number of slaves in each state, keyed by (state name,)
+    def _slavesByState(self):
+        names = dict([(getattr(SlaveState, name), name.lower()) for name in ("CONNECTED", "IDLE", "ALLOCATED", "RUNNING", "DISCONNECTED")])
+        counts = dict([((name,), 0) for name in names.itervalues()])
+        for (slave, status, task) in self.slaves.itervalues():
+            name = names.get(status.state, "unknown")
+            counts[(name,)] = counts.get((name,), 0) + 1
+        return counts
 
     def _getSlaveNo(self):
         slaveNo = db.execute("SELECT slaveNo FROM slaveno").fetchone()["slaveNo"]
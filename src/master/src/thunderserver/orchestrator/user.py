@@ -1,10 +1,11 @@
 from ..db import dbConnection as db
 from thundercloud.spec.user import UserSpec
+from thundercloud.authentication.cache import credentialCache
+from thundercloud.authentication.dbchecker import hashPassword
 
 from twisted.internet.defer import Deferred, inlineCallbacks, returnValue
 from twisted.internet import reactor
 
-import crypt
 import random
 
 import logging
@@ -56,7 +57,7 @@ class _UserManager(object):
             raise UserAlreadyExists
         
         # XXX fix salt, perhaps even the double-query
-        db.execute("INSERT INTO users (username, password, spec) VALUES (?, ?, ?)", (userSpec.username, crypt.crypt(userSpec.password, "ab"), userSpec))
+        db.execute("INSERT INTO users (username, password, spec) VALUES (?, ?, ?)", (userSpec.username, hashPassword(userSpec.password), userSpec))
         userId = int(db.execute("SELECT id FROM users WHERE username = ? AND deleted = 'f'", (userSpec.username,)).fetchall()[0]["id"])
 
         log.info("Creating user %s. User ID is %d" % (userSpec.username, userId))
@@ -71,6 +72,19 @@ class _UserManager(object):
             raise NoSuchUser
 
         db.execute("UPDATE users SET deleted = 't' WHERE username = ? AND deleted = 'f'", (username,))
+        credentialCache.invalidate(username)
+
+        returnValue(True)
+
+    @inlineCallbacks
+    def changePassword(self, username, password):
+        request = self._checkUser(username)
+        yield request
+        if request.result is False:
+            raise NoSuchUser
+
+        db.execute("UPDATE users SET password = ? WHERE username = ? AND deleted = 'f'", (hashPassword(password), username))
+        credentialCache.invalidate(username)
 
         returnValue(True)
 
@@ -0,0 +1,5 @@
+from relay import _Relay, RelayedJob, JobNotFound
+
+Relay = _Relay()
+
+__all__ = [Relay, RelayedJob, JobNotFound]
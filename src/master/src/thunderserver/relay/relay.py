@@ -0,0 +1,204 @@
+from thundercloud.spec.job import JobResults, JobState
+from thundercloud.spec.slave import SlaveSpec, SlaveState
+from thundercloud.util.lru import LRUCache
+from thundercloud.util.metrics import Metrics
+from thundercloud.util.restApiClient import RestApiClient
+from thundercloud.util.rollup import queryByTime
+
+from twisted.internet.defer import DeferredList, inlineCallbacks, returnValue, succeed
+
+from ..orchestrator.job import JobPerspective, slaveJobSpec
+from ..orchestrator.slave import SlaveAllocator
+from ..orchestrator.archive import JobNotFound
+
+import simplejson as json
+
+import logging
+
+log = logging.getLogger("relay")
+
+class JobCreationError(Exception):
+    pass
+
+# A job as a relay runs it: fanned out over the relay's slaves like the
+# master does, but the aggregate goes upstream to be aggregated again, so
+# it isn't rounded off
+class RelayedJob(JobPerspective):
+    reducePrecision = False
+
+
+# A relay sits between the master and a sub-fleet of slaves.  To the master
+# it's one slave with the capacity of its whole sub-fleet; to the slaves
+# it's a master.  Job operations from upstream are fanned out to the
+# slaves, and their results aggregated with AggregateJobResults before
+# they're passed back up, so the master only ever talks to its relays
+class _Relay(object):
+    def __init__(self):
+        self.jobs = {}
+        self.completedJobs = LRUCache(64)
+        self.slaveId = None
+        self.slaveSpec = None
+        self.masterUrl = None
+        self.minSlaves = 1
+        self.capacity = None
+        self._jobNo = 1
+        self._registering = False
+        Metrics.gauge("thundercloud_relay_jobs", "Jobs the relay is running for its master", function=lambda: len(self.jobs))
+
+    # slaveSpec is how the master reaches this relay; its capacity is filled
+    # in from the sub-fleet unless capacity is given
+    def configure(self, masterUrl=None, slaveSpec=None, minSlaves=1, capacity=None, resultsSize=64):
+        self.masterUrl = masterUrl
+        self.slaveSpec = slaveSpec
+        self.minSlaves = minSlaves
+        self.capacity = capacity
+        self.completedJobs.maxSize = resultsSize
+
+    def _getJob(self, jobId):
+        try:
+            return self.jobs[jobId]
+        except KeyError:
+            raise JobNotFound
+
+    def _connectedSlaves(self):
+        return [slave for (slave, status, task) in SlaveAllocator.slaves.itervalues() if status.state != SlaveState.DISCONNECTED]
+
+    # requests per second and sockets the connected sub-fleet can take.  the
+    # socket count is None if any slave doesn't say what its budget is
+    def fleetCapacity(self):
+        slaves = self._connectedSlaves()
+        requests = sum([int(slave.slaveSpec.maxRequestsPerSec or 0) for slave in slaves])
+        sockets = [slave.slaveSpec.maxSockets for slave in slaves]
+        if None in sockets:
+            return (requests, None)
+        return (requests, sum(sockets))
+
+    @inlineCallbacks
+    def registerSlave(self, slaveSpec):
+        log.debug("Connecting slave.  Spec: %s" % slaveSpec)
+        slaveId = yield SlaveAllocator.addSlave(slaveSpec)
+        log.debug("Slave %d connected" % slaveId)
+        self.registerUpstream()
+        returnValue(slaveId)
+
+    def _postUpstream(self, slaveSpec):
+        return RestApiClient.POST(self.masterUrl, slaveSpec.toJson(), timeout=10, credentials=("slave", "slave"))
+
+    # show up at the master once minSlaves slaves have connected, as a single
+    # slave with their combined capacity.  slaves which connect later take
+    # their share of the relay's jobs, but the master isn't told about the
+    # extra capacity
+    @inlineCallbacks
+    def registerUpstream(self):
+        if self.masterUrl is None or self.slaveId is not None or self._registering:
+            return
+        if len(self._connectedSlaves()) < self.minSlaves:
+            return
+
+        slaveSpec = SlaveSpec(self.slaveSpec.toJson())
+        (slaveSpec.maxRequestsPerSec, slaveSpec.maxSockets) = self.fleetCapacity()
+        if self.capacity is not None:
+            slaveSpec.maxRequestsPerSec = self.capacity
+
+        log.info("Connecting to master: %s" % self.masterUrl)
+        self._registering = True
+        try:
+            slaveId = yield self._postUpstream(slaveSpec)
+            self.slaveId = int(slaveId)
+            log.info("Connected to master.  This relay is slave ID %d, capacity %d" % (self.slaveId, slaveSpec.maxRequestsPerSec))
+        except Exception, ex:
+            log.error("Could not connect to master: %s" % ex)
+        self._registering = False
+
+    # allocate slaves from the sub-fleet and create the job on all of them.
+    # if any of them fails, the ones which succeeded drop their part of it
+    @inlineCallbacks
+    def createJob(self, jobSpec):
+        slaves = yield SlaveAllocator.allocate(jobSpec)
+        log.debug("Using slaves: %s" % slaves)
+
+        jobNo = self._jobNo
+        self._jobNo += 1
+        job = RelayedJob(jobNo, jobSpec)
+
+        modifiedJobSpec = slaveJobSpec(jobSpec, len(slaves))
+        created = yield DeferredList([slave.createJob(modifiedJobSpec) for slave in slaves], consumeErrors=True)
+
+        failed = False
+        for (slave, (success, result)) in zip(slaves, created):
+            if success == True:
+                job.addSlave(slave, int(json.loads(result)))
+            else:
+                failed = True
+        if failed:
+            yield job._jobOp("removeJob", ignoreHealth=True)
+            job.release()
+            raise JobCreationError
+
+        job.finished.addCallback(self._jobFinished, jobNo)
+        self.jobs[jobNo] = job
+        log.info("Created job %d on %d slaves" % (jobNo, len(slaves)))
+        returnValue(jobNo)
+
+    # keep the final aggregate for the master's last requests, and let go of
+    # the job itself
+    def _jobFinished(self, results, jobId):
+        job = self.jobs.pop(jobId, None)
+        if results is not False:
+            (aggregateResults, slaveResults) = results
+            self.completedJobs.put(jobId, aggregateResults)
+        if job is not None:
+            job.release()
+
+    # startAt is on the relay's clock, already translated by the master
+    def startJob(self, jobId, startAt=None):
+        return self._getJob(jobId).start(startAt)
+
+    def pauseJob(self, jobId):
+        return self._getJob(jobId).pause()
+
+    def resumeJob(self, jobId):
+        return self._getJob(jobId).resume()
+
+    def stopJob(self, jobId):
+        return self._getJob(jobId).stop()
+
+    # the master's already worked out this relay's share of a SEARCH job's rate
+    def setJobRate(self, jobId, rate):
+        return self._getJob(jobId).setRate(rate)
+
+    def removeJob(self, jobId):
+        self.completedJobs.pop(jobId)
+        try:
+            job = self.jobs.pop(jobId)
+        except KeyError:
+            return succeed(False)
+        deferred = job._jobOp("removeJob", ignoreHealth=True)
+        deferred.addCallback(lambda result: job.release())
+        return deferred
+
+    def jobState(self, jobId):
+        completed = self.completedJobs.get(jobId)
+        if completed is not None:
+            return succeed(completed.job_state)
+        return self._getJob(jobId).state()
+
+    # a job's aggregated results, as JobResults.  query narrows down
+    # results_byTime; see RollupSeries.query
+    @inlineCallbacks
+    def jobResults(self, jobId, short, query=None):
+        completed = self.completedJobs.get(jobId)
+        if completed is None:
+            results = yield self._getJob(jobId).results(short, query)
+            if results is False:
+                results = JobResults()
+                results.job_id = jobId
+                results.job_state = JobState.ERROR
+            returnValue(results)
+
+        results = JobResults(completed.toJson())
+        if short == True:
+            del(results.results_byTime)
+        elif query is not None:
+            results.results_byTime = queryByTime(results.results_byTime, **query)
+        returnValue(results)
@@ -0,0 +1,204 @@
+from zope.interface import implements
+from twisted.web import server, guard
+from twisted.web.server import NOT_DONE_YET
+from twisted.web.resource import IResource
+from twisted.cred.portal import IRealm, Portal
+import simplejson as json
+import logging
+import time
+
+from ..restApi.nodes import RootNode, LeafNode
+from ..restApi.nodes import Http400, Http404
+from ..restApi.status import MetricsNode
+from ..authentication.slave import SlaveDBChecker
+from ..db import dbConnection as db
+
+from thundercloud.spec.job import IJob, JobSpec
+from thundercloud.spec.slave import SlaveSpec
+from thundercloud.util.compression import writeBody
+from thundercloud.util.looplag import LoopLag
+from thundercloud.util.rollup import queryArgs
+
+from relay import JobNotFound
+from . import Relay
+
+log = logging.getLogger("relay.restApi")
+
+# The relay's API is two-faced: the master sees the slave API under /job
+# and /status, and the relay's own slaves register under /slave as they
+# would with a master
+
+def _failed(error, request):
+    log.debug("Relay request failed: %s" % error)
+    if error.check(JobNotFound):
+        request.setResponseCode(404)
+    else:
+        request.setResponseCode(500)
+    writeBody(request, json.dumps(False))
+
+
+class SlaveRealm(object):
+    implements(IRealm)
+
+    def requestAvatar(self, avatarId, mind, *interfaces):
+        if IResource in interfaces:
+            return IResource, Slave, lambda: None
+        raise NotImplementedError()
+
+# Handle slaves connecting to /slave
+class _Slave(RootNode):
+    def postCallback(self, slaveId, request):
+        self.writeJson(request, slaveId)
+
+    def postErrback(self, error, request):
+        log.debug("Slave POST failed: %s" % error)
+        self.writeJson(request, False)
+
+    def POST(self, request):
+        request.content.seek(0, 0)
+        slaveSpecObj = SlaveSpec(json.loads(request.content.read()))
+        if not slaveSpecObj.validate():
+            raise Http400, "Invalid request"
+
+        deferred = Relay.registerSlave(slaveSpecObj)
+        deferred.addCallback(self.postCallback, request)
+        deferred.addErrback(self.postErrback, request)
+        return NOT_DONE_YET
+
+Slave = _Slave()
+
+
+# Handle the master creating jobs at /job
+class Job(RootNode):
+    def getChild(self, path, request):
+        try:
+            int(path)
+        except ValueError:
+            return RootNode.getChild(self, path, request)
+        return jobNode
+
+    def postCallback(self, jobId, request):
+        self.writeJson(request, jobId)
+
+    def POST(self, request):
+        request.content.seek(0, 0)
+        jobSpecObj = JobSpec(json.loads(request.content.read()))
+        if not jobSpecObj.validate():
+            raise Http400, "Invalid request"
+
+        deferred = Relay.createJob(jobSpecObj)
+        deferred.addCallback(self.postCallback, request)
+        deferred.addErrback(_failed, request)
+        return NOT_DONE_YET
+
+
+# Handle /job/n[/operation] from the master.  answers are encoded the way a
+# slave encodes them, since the master decodes them the same way
+class JobNode(LeafNode):
+    implements(IJob)
+    getCommands = ["results", "state"]
+    postCommands = ["start", "pause", "resume", "stop", "remove", "rate"]
+
+    def GET(self, request):
+        jobId = int(request.prepath[-1])
+        try:
+            if request.postpath and request.postpath[0].lower() in self.getCommands:
+                return getattr(self, request.postpath[0].lower())(jobId, request)
+            else:
+                return self.results(jobId, request)
+        except JobNotFound:
+            raise Http404
+
+    def POST(self, request):
+        if request.postpath and request.postpath[0].lower() in self.postCommands:
+            jobId = int(request.prepath[-1])
+            try:
+                if request.postpath[0].lower() == "start":
+                    startAt = None
+                    if request.args.has_key("at"):
+                        startAt = float(request.args["at"][0])
+                    deferred = Relay.startJob(jobId, startAt)
+                elif request.postpath[0].lower() == "rate":
+                    deferred = Relay.setJobRate(jobId, float(request.args["rps"][0]))
+                else:
+                    deferred = getattr(Relay, "%sJob" % request.postpath[0].lower())(jobId)
+            except (KeyError, ValueError):
+                raise Http400
+            except JobNotFound:
+                raise Http404
+            deferred.addCallback(lambda value: self.writeJson(request, True))
+            deferred.addErrback(_failed, request)
+            return NOT_DONE_YET
+        else:
+            raise Http400
+
+    def state(self, jobId, request):
+        deferred = Relay.jobState(jobId)
+        deferred.addCallback(lambda value: self.writeJson(request, value))
+        deferred.addErrback(_failed, request)
+        return NOT_DONE_YET
+
+    def resultsCallback(self, value, request):
+        self.writeJson(request, value.toJson())
+
+    # from, to and resolution (all in seconds) narrow down results_byTime
+    def results(self, jobId, request):
+        short = None
+        query = None
+        try:
+            if request.args.has_key("short"):
+                short = json.loads(request.args["short"][0])
+            query = queryArgs(request.args)
+        except AttributeError:
+            pass
+        except ValueError:
+            raise Http400
+
+        deferred = Relay.jobResults(jobId, short, query)
+        deferred.addCallback(self.resultsCallback, request)
+        deferred.addErrback(_failed, request)
+        return NOT_DONE_YET
+
+jobNode = JobNode()
+
+
+# heartbeats carry the relay's clock, for the master's offset estimate
+class HeartBeat(LeafNode):
+    def GET(self, request):
+        self.writeJson(request, {"time": time.time()})
+        return NOT_DONE_YET
+
+# the relay's sub-fleet, for operators
+class Fleet(LeafNode):
+    def GET(self, request):
+        (requests, sockets) = Relay.fleetCapacity()
+        self.writeJson(request, {
+            "slaveId": Relay.slaveId,
+            "slaves": len(Relay._connectedSlaves()),
+            "maxRequestsPerSec": requests,
+            "maxSockets": sockets,
+            "jobs": len(Relay.jobs),
+        })
+        return NOT_DONE_YET
+
+class Lag(LeafNode):
+    def GET(self, request):
+        self.writeJson(request, LoopLag.status())
+        return NOT_DONE_YET
+
+
+def createRestApi():
+    siteRoot = RootNode()
+    siteRoot.putChild("job", Job())
+
+    status = RootNode()
+    status.putChild("heartbeat", HeartBeat())
+    status.putChild("fleet", Fleet())
+    status.putChild("lag", Lag())
+    status.putChild("metrics", MetricsNode())
+    siteRoot.putChild("status", status)
+
+    slaveWrapper = guard.HTTPAuthSessionWrapper(Portal(SlaveRealm(), [SlaveDBChecker(db)]), [guard.BasicCredentialFactory("thundercloud slave management")])
+    siteRoot.putChild("slave", slaveWrapper)
+
+    return server.Site(siteRoot)
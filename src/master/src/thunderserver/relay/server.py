@@ -0,0 +1,57 @@
+from twisted.internet import reactor
+from twisted.internet.defer import DeferredList, inlineCallbacks
+from twisted.python import log as twistedLog
+
+from thundercloud import config
+from thundercloud.spec.slave import SlaveSpec
+from thundercloud.util.looplag import LoopLag
+
+from . import Relay
+from restApi import createRestApi
+
+import logging
+import socket
+import sys
+
+@inlineCallbacks
+def startServer(port):
+    logging.basicConfig(level=eval("logging.%s" % config.parameter("log", "level")))
+    log = logging.getLogger("main")
+    twistedLog.startLogging(sys.stderr)
+
+    LoopLag.start(config.parameter("monitor", "lag.interval", type=float, default=0.05))
+
+    slaveSpec = SlaveSpec()
+    slaveSpec.host = config.parameter("relay", "host", default=socket.gethostname())
+    slaveSpec.port = port
+    slaveSpec.path = ""
+    masterUrl = "%s://%s:%d/%s/slave" % (config.parameter("master", "scheme"), config.parameter("master", "host"),
+                                        config.parameter("master", "port", type=int), config.parameter("master", "path"))
+    Relay.configure(masterUrl=masterUrl,
+                    slaveSpec=slaveSpec,
+                    minSlaves=config.parameter("relay", "slaves.min", type=int, default=1),
+                    capacity=config.parameter("relay", "capacity", type=int, default=None),
+                    resultsSize=config.parameter("cache", "results.size", type=int, default=64))
+
+    # slaves ping back once they've registered, and the master pings the
+    # relay once it has enough of them, so listen first
+    log.debug("Listening on port %s", port)
+    reactor.listenTCP(port, createRestApi())
+
+    # slaves in the INI file, as the master takes them
+    slaves = {}
+    for (key, val) in config.section("slave"):
+        slaveNo = key[:key.find(".")]
+        attr = key[key.find(".")+1:]
+
+        try:
+            setattr(slaves[slaveNo], attr, val)
+        except KeyError:
+            slaves[slaveNo] = SlaveSpec()
+            setattr(slaves[slaveNo], attr, val)
+
+    deferredList = DeferredList([Relay.registerSlave(slaveSpec) for slaveSpec in slaves.itervalues()])
+    yield deferredList
+    for (success, slaveId) in deferredList.result:
+        if success == False:
+            log.error("Error adding slave")
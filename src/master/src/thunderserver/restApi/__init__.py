@@ -10,8 +10,11 @@ from thundercloud import config
 
 from ..authentication.slave import SlaveDBChecker
 from ..authentication.job import JobDBChecker
+from ..authentication.status import StatusDBChecker
 from ..restApi.job import JobRealm
 from ..restApi.slave import SlaveRealm
+from ..restApi.status import StatusRealm
+from thundercloud.authentication.token import SessionTokenCredentialFactory
 
 from ..db import dbConnection as db
 
@@ -36,11 +39,15 @@ def createRestApi():
     """Create the REST API URL hierarchy"""
     siteRoot = RootNode()
 
-    jobWrapper = guard.HTTPAuthSessionWrapper(Portal(JobRealm(), [JobDBChecker(db)]), [guard.BasicCredentialFactory("thundercloud job management")])
+    jobWrapper = guard.HTTPAuthSessionWrapper(Portal(JobRealm(), [JobDBChecker(db)]), [guard.BasicCredentialFactory("thundercloud job management"), SessionTokenCredentialFactory("thundercloud job management")])
     siteRoot.putChild("job", jobWrapper)
   
     # slave tree needs specific authentication
     slaveWrapper = guard.HTTPAuthSessionWrapper(Portal(SlaveRealm(), [SlaveDBChecker(db)]), [guard.BasicCredentialFactory("thundercloud slave management")])
     siteRoot.putChild("slave", slaveWrapper)
 
+    # profiling and object counts for the master itself
+    statusWrapper = guard.HTTPAuthSessionWrapper(Portal(StatusRealm(), [StatusDBChecker(db)]), [guard.BasicCredentialFactory("thundercloud status")])
+    siteRoot.putChild("status", statusWrapper)
+
     return server.Site(siteRoot)
\ No newline at end of file
@@ -16,15 +16,19 @@ from twisted.web.resource import IResource
 from twisted.cred.portal import IRealm, Portal
 
 from thunderserver.authentication.job import JobNodeDBChecker
+from thundercloud.authentication.token import SessionTokenCredentialFactory
+from thundercloud.authentication.cache import credentialCache
 
 from ..db import dbConnection as db
 
 from nodes import RootNode
 from nodes import LeafNode
 from nodes import Http400, Http404
+from nodes import requestUser
 
-from ..orchestrator import Orchestrator
+from ..orchestrator import Orchestrator, JobNotFound
 from thundercloud.spec.job import IJob, JobSpec, JobResults
+from thundercloud.util.rollup import queryArgs
 
 log = logging.getLogger("restApi.job")
 
@@ -41,14 +45,25 @@ class JobNodeRealm(object):
  
     def requestAvatar(self, avatarId, mind, *interfaces):
         if IResource in interfaces:
-            return IResource, JobNode(), lambda: None
+            return IResource, jobNode, lambda: None
         raise NotImplementedError()
 
 # Handle requests sent to /job
 class _Job(RootNode):
+    # /job/n resources are built on demand rather than registered with
+    # putChild, so the resource tree doesn't grow with every job created.
+    # each job gets its own auth wrapper since only the job's owner is
+    # allowed at it
+    def getChild(self, path, request):
+        try:
+            jobId = int(path)
+        except ValueError:
+            return RootNode.getChild(self, path, request)
+        
+        realm = "thundercloud job #%d" % jobId
+        return guard.HTTPAuthSessionWrapper(Portal(JobNodeRealm(), [JobNodeDBChecker(db, jobId)]), [guard.BasicCredentialFactory(realm), SessionTokenCredentialFactory(realm)])
+
     def postCallback(self, jobId, request):
-        jobNodeWrapper = guard.HTTPAuthSessionWrapper(Portal(JobNodeRealm(), [JobNodeDBChecker(db, jobId)]), [guard.BasicCredentialFactory("thundercloud job #%d" % jobId)])
-        self.putChild("%d" % jobId, jobNodeWrapper)
         self.writeJson(request, jobId)
     
     def postErrback(self, error, request):
@@ -62,13 +77,23 @@ class _Job(RootNode):
         if not jobSpecObj.validate():
             raise Http400, "Invalid request"
         
-        log.debug("Creating job, user: %s" % request.getUser())
-        deferred = Orchestrator.createJob(request.getUser(), jobSpecObj)
+        log.debug("Creating job, user: %s" % requestUser(request))
+        deferred = Orchestrator.createJob(requestUser(request), jobSpecObj)
         deferred.addCallback(self.postCallback, request)
         deferred.addErrback(self.postErrback, request)
         return NOT_DONE_YET
     
+# Handle requests sent to /job/session: hand out a session token which
+# polling clients can use in place of HTTP basic auth
+class Session(LeafNode):
+    def POST(self, request):
+        username = requestUser(request)
+        log.debug("Issuing session token, user: %s" % username)
+        self.writeJson(request, credentialCache.issueToken(username))
+        return NOT_DONE_YET
+
 Job = _Job()
+Job.putChild("session", Session())
 
 # Handle requests for /job/n[/operation] URLs
 class JobNode(LeafNode):
@@ -79,17 +104,23 @@ class JobNode(LeafNode):
     # handle GET /job/n
     def GET(self, request):
         jobId = int(request.prepath[-1])
-        if request.postpath and request.postpath[0].lower() in self.getCommands:
-            return getattr(self, request.postpath[0].lower())(jobId, request)
-        else:
-            return self.results(jobId, None)
+        try:
+            if request.postpath and request.postpath[0].lower() in self.getCommands:
+                return getattr(self, request.postpath[0].lower())(jobId, request)
+            else:
+                return self.results(jobId, request)
+        except JobNotFound:
+            raise Http404
 
     # handle POST /job/n/operation -- call the appropriate method
     # for the given job ID
     def POST(self, request):
         if request.postpath and request.postpath[0].lower() in self.postCommands:
             jobId = int(request.prepath[-1])
-            return getattr(self, request.postpath[0].lower())(jobId, request)
+            try:
+                return getattr(self, request.postpath[0].lower())(jobId, request)
+            except JobNotFound:
+                raise Http404
         else:
             raise Http400
     
@@ -149,14 +180,28 @@ class JobNode(LeafNode):
     def resultsCallback(self, value, request):
         self.writeJson(request, value.toJson())
         
+    # from, to and resolution (all in seconds) narrow down results_byTime
     def results(self, jobId, request):
         short = None
+        query = None
         try:
             if request.args.has_key("short"):
                 short = json.loads(request.args["short"][0])
+            query = queryArgs(request.args)
         except AttributeError:
             pass      
+        except ValueError:
+            raise Http400
         
-        deferred = Orchestrator.jobResults(jobId, short)
+        # finished jobs are served straight from the archive, unless only
+        # part of it was asked for
+        archive = Orchestrator.archivedResults(jobId)
+        if archive is not None and (query is None or short == True):
+            self.writeArchivedResults(request, archive, short)
+            return NOT_DONE_YET
+        
+        deferred = Orchestrator.jobResults(jobId, short, query)
         deferred.addCallback(self.resultsCallback, request)
         return NOT_DONE_YET
+
+jobNode = JobNode()
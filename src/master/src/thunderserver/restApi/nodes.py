@@ -4,6 +4,9 @@ from zope.interface import Interface, implements
 import simplejson as json
 import logging
 
+from thundercloud.authentication.cache import credentialCache
+from thundercloud.util.compression import negotiateEncoding, writeBody
+
 log = logging.getLogger("restApi.node")
 
 class Http400(Exception):
@@ -31,14 +34,14 @@ class Node(Resource):
     # will need to dump their own json, as these methods are just pass-through.
     # this is so job requests can return NOT_DONE_YET and return data on 
     # a callback so that the API doesn't just return True even if there's
-    # an error somewhere along the way
+    # an error somewhere along the way.
+    #
+    # bodies are compressed if the client asks for it and they're big enough
+    # to be worth it
 
     def render_GET(self, request):
         try:
-            response = self.GET(request)
-            if response != NOT_DONE_YET:
-                request.setHeader("Content-Type", "text/plain")
-            return response
+            return self._respond(request, self.GET(request))
         except Http400:
             request.setResponseCode(400)
         except Http404:
@@ -46,15 +49,21 @@ class Node(Resource):
         
     def render_POST(self, request):
         try:
-            response = self.POST(request)
-            if response != NOT_DONE_YET:
-                request.setHeader("Content-Type", "text/plain")
-            return response
+            return self._respond(request, self.POST(request))
         except Http400:
             request.setResponseCode(400)
         except Http404:
             request.setResponseCode(404)
     
+    def _respond(self, request, response):
+        if response == NOT_DONE_YET:
+            return response
+        request.setHeader("Content-Type", "text/plain")
+        if isinstance(response, str):
+            writeBody(request, response)
+            return NOT_DONE_YET
+        return response
+    
     def render_PUT(self, request):
         pass
     
@@ -65,8 +74,30 @@ class Node(Resource):
         raise NotImplementedError
     
     def writeJson(self, request, data):
-        request.write(json.dumps(data))
-        request.finish()
+        writeBody(request, json.dumps(data))
+
+    # write out archived job results, which are already encoded (and
+    # gzipped, so clients which take gzip don't cost any compression)
+    def writeArchivedResults(self, request, archive, short):
+        request.setHeader("Content-Type", "text/plain")
+        if negotiateEncoding(request) == "gzip":
+            request.setHeader("Content-Encoding", "gzip")
+            request.setHeader("Vary", "Accept-Encoding")
+            request.write(archive.encoded(short, compressed=True))
+            request.finish()
+        else:
+            writeBody(request, archive.encoded(short))
+
+    
+# the authenticated username for a request.  request.getUser() only knows
+# about HTTP basic auth, so look up session tokens separately
+def requestUser(request):
+    authHeader = request.getHeader("authorization")
+    if authHeader is not None:
+        parts = authHeader.split(" ", 1)
+        if len(parts) == 2 and parts[0].lower() == "token":
+            return credentialCache.lookupToken(parts[1].strip())
+    return request.getUser()
 
     
 class RootNode(Node):
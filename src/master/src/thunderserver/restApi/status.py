@@ -0,0 +1,92 @@
+from zope.interface import implements
+import simplejson as json
+import logging
+
+from twisted.internet.protocol import Factory, Protocol
+from twisted.web.server import NOT_DONE_YET
+from twisted.web.resource import IResource
+from twisted.cred.portal import IRealm
+
+from nodes import RootNode
+from nodes import LeafNode
+from nodes import Http400
+
+from ..orchestrator.job import JobPerspective
+from ..orchestrator.slave import SlavePerspective
+from thundercloud.spec.dataobject import DataObject
+from thundercloud.util.looplag import LoopLag
+from thundercloud.util.metrics import Metrics
+from thundercloud.util.compression import writeBody
+from thundercloud.util.profiler import Profiler, ProfilerBusy, ProfilerUnavailable, objectCounts, startArgs, resultArgs
+
+log = logging.getLogger("restApi.status")
+
+class StatusRealm(object):
+    implements(IRealm)
+
+    def requestAvatar(self, avatarId, mind, *interfaces):
+        if IResource in interfaces:
+            return IResource, Status, lambda: None
+        raise NotImplementedError()
+
+
+# every metric in the registry, in the Prometheus text format, for the
+# monitoring scraper
+class MetricsNode(LeafNode):
+    def render_GET(self, request):
+        request.setHeader("Content-Type", "text/plain; version=0.0.4")
+        writeBody(request, Metrics.expose())
+        return NOT_DONE_YET
+
+
+# event loop lag percentiles over the last ten seconds
+class Lag(LeafNode):
+    def GET(self, request):
+        return json.dumps(LoopLag.status())
+
+
+# GET /status/profile returns the stats of the running or last profile.
+# POST /status/profile[?duration=30&mode=cprofile|sampling] starts one and
+# POST /status/profile/stop ends it early
+class Profile(LeafNode):
+    def GET(self, request):
+        try:
+            return json.dumps(Profiler.results(**resultArgs(request.args)))
+        except ValueError:
+            raise Http400, "Invalid arguments"
+
+    def POST(self, request):
+        try:
+            if request.postpath and request.postpath[0] == "stop":
+                Profiler.stop()
+                return json.dumps(Profiler.results(**resultArgs(request.args)))
+            Profiler.start(**startArgs(request.args))
+        except (ValueError, ProfilerBusy, ProfilerUnavailable), ex:
+            log.debug("Couldn't start profile: %s" % ex)
+            raise Http400, str(ex)
+        return json.dumps(Profiler.status())
+
+# counts of live objects, by type
+class Objects(LeafNode):
+    categories = {
+        "jobs": JobPerspective,
+        "slaves": SlavePerspective,
+        "factories": Factory,
+        "protocols": Protocol,
+        "dataObjects": DataObject,
+    }
+
+    def GET(self, request):
+        try:
+            limit = int(request.args.get("limit", [50])[0])
+        except ValueError:
+            raise Http400, "Invalid arguments"
+        return json.dumps(objectCounts(self.categories, limit))
+
+
+Status = RootNode()
+Status.putChild("", RootNode())
+Status.putChild("lag", Lag())
+Status.putChild("metrics", MetricsNode())
+Status.putChild("profile", Profile())
+Status.putChild("objects", Objects())
@@ -2,18 +2,163 @@ from thunderserver.db import dbConnection as db
 from thunderserver.orchestrator.user import UserManager, UserPerspective, UserAlreadyExists, NoSuchUser
 from thundercloud.spec.user import UserSpec
 
-from thunderserver.authentication.job import JobDBChecker
+from thunderserver.authentication.job import JobDBChecker, JobNodeDBChecker
 from thunderserver.authentication.slave import SlaveDBChecker
+from thunderserver.authentication.status import StatusDBChecker
 
+from thundercloud.authentication.cache import CredentialCache, credentialCache
+from thundercloud.authentication.token import SessionToken
+
+from twisted.cred import error, credentials
 from twisted.internet import reactor
 from twisted.trial import unittest
 from twisted.internet.defer import DeferredList, Deferred, inlineCallbacks, returnValue
 
 import crypt
 
+# count how many times the checker has to go to the DB
+class CountingJobDBChecker(JobDBChecker):
+    lookups = 0
+
+    def getUserAndPassword(self, username):
+        self.lookups += 1
+        return super(CountingJobDBChecker, self).getUserAndPassword(username)
+
 class HttpAuthTestMixin(object):
     def setUp(self):
-        pass
-    
+        self.cache = CredentialCache()
+        self.checker = CountingJobDBChecker(db, cache=self.cache)
+        userSpec = UserSpec()
+        userSpec.username = "test_httpAuth"
+        userSpec.password = "foo"
+        return UserManager.create(userSpec)
+
     def tearDown(self):
-        pass
\ No newline at end of file
+        credentialCache.clear()
+        db.execute("DELETE FROM users WHERE username <> 'SLAVE'")
+
+    def login(self, password="foo"):
+        return self.checker.requestAvatarId(credentials.UsernamePassword("test_httpAuth", password))
+
+
+class CredentialCaching(HttpAuthTestMixin, unittest.TestCase):
+
+    @inlineCallbacks
+    def test_cachedLogin(self):
+        """Repeated logins only hit the DB once"""
+        for i in range(0, 5):
+            avatarId = yield self.login()
+            self.assertEquals(avatarId, "test_httpAuth")
+        self.assertEquals(self.checker.lookups, 1)
+
+    @inlineCallbacks
+    def test_wrongPassword(self):
+        """A cached login doesn't let a different password through"""
+        yield self.login()
+        yield self.failUnlessFailure(self.login("bar"), error.UnauthorizedLogin)
+
+    @inlineCallbacks
+    def test_scope(self):
+        """Checkers with different scopes don't share cache entries"""
+        yield self.login()
+        nodeChecker = JobNodeDBChecker(db, 12345)
+        nodeChecker.cache = self.cache
+        yield self.failUnlessFailure(nodeChecker.requestAvatarId(credentials.UsernamePassword("test_httpAuth", "foo")), error.UnauthorizedLogin)
+
+    @inlineCallbacks
+    def test_invalidateOnDelete(self):
+        """Deleting a user drops their cached credentials"""
+        self.checker.cache = credentialCache
+        yield self.login()
+        yield UserManager.delete("test_httpAuth")
+        yield self.failUnlessFailure(self.login(), error.UnauthorizedLogin)
+
+    @inlineCallbacks
+    def test_invalidateOnPasswordChange(self):
+        """Changing a password drops cached credentials"""
+        self.checker.cache = credentialCache
+        yield self.login()
+        yield UserManager.changePassword("test_httpAuth", "bar")
+        yield self.failUnlessFailure(self.login(), error.UnauthorizedLogin)
+        avatarId = yield self.login("bar")
+        self.assertEquals(avatarId, "test_httpAuth")
+
+    def test_expiry(self):
+        """Cached credentials expire after their TTL"""
+        now = [0]
+        cache = CredentialCache(ttl=10)
+        cache._entries.clock = lambda: now[0]
+        cache.remember("scope", "user", "password")
+        self.assertTrue(cache.verify("scope", "user", "password"))
+        now[0] = 11
+        self.assertFalse(cache.verify("scope", "user", "password"))
+
+    def test_generations(self):
+        """A user's generation is only kept while they have something cached"""
+        cache = CredentialCache(maxSize=2)
+        cache.remember("scope", "user", "password")
+        cache.invalidate("user")
+        token = cache.issueToken("user")
+        self.assertEquals(cache._generations, {"user": 1})
+        cache.remember("scope", "other", "password")
+        cache.remember("scope2", "other", "password")
+        self.assertEquals(cache._generations, {"user": 1})
+        cache.revokeToken(token)
+        self.assertEquals(cache._generations, {})
+        cache.invalidate("nobody")
+        self.assertEquals(cache._generations, {})
+        self.assertTrue(cache.verify("scope", "other", "password"))
+
+    def test_staleEntries(self):
+        """Entries from before an invalidation stay invalid while any are cached"""
+        cache = CredentialCache()
+        cache.remember("scope", "user", "password")
+        cache.invalidate("user")
+        self.assertFalse(cache.verify("scope", "user", "password"))
+        self.assertFalse(cache.known("scope", "user"))
+        cache.remember("scope", "user", "password")
+        self.assertTrue(cache.verify("scope", "user", "password"))
+
+
+class SessionTokens(HttpAuthTestMixin, unittest.TestCase):
+
+    @inlineCallbacks
+    def test_token(self):
+        """A session token authenticates without a password check"""
+        token = self.cache.issueToken("test_httpAuth")
+        avatarId = yield self.checker.requestAvatarId(SessionToken(token))
+        self.assertEquals(avatarId, "test_httpAuth")
+        avatarId = yield self.checker.requestAvatarId(SessionToken(token))
+        self.assertEquals(self.checker.lookups, 1)
+
+    def test_invalidToken(self):
+        """Unknown tokens are rejected"""
+        return self.failUnlessFailure(self.checker.requestAvatarId(SessionToken("foo")), error.UnauthorizedLogin)
+
+    @inlineCallbacks
+    def test_revokedOnDelete(self):
+        """Deleting a user revokes their session tokens"""
+        self.checker.cache = credentialCache
+        token = credentialCache.issueToken("test_httpAuth")
+        yield UserManager.delete("test_httpAuth")
+        yield self.failUnlessFailure(self.checker.requestAvatarId(SessionToken(token)), error.UnauthorizedLogin)
+
+
+class StatusAccess(HttpAuthTestMixin, unittest.TestCase):
+
+    def test_ordinaryUser(self):
+        """Ordinary users can't get into the status tree"""
+        checker = StatusDBChecker(db, cache=self.cache)
+        return self.failUnlessFailure(checker.requestAvatarId(credentials.UsernamePassword("test_httpAuth", "foo")), error.UnauthorizedLogin)
+
+    @inlineCallbacks
+    def test_admin(self):
+        """Configured administrators get into the status tree"""
+        checker = StatusDBChecker(db, cache=self.cache, admins=["test_httpAuth"])
+        avatarId = yield checker.requestAvatarId(credentials.UsernamePassword("test_httpAuth", "foo"))
+        self.assertEquals(avatarId, "test_httpAuth")
+
+    def test_slaveAccount(self):
+        """The shared slave account can't get into the status tree"""
+        checker = StatusDBChecker(db, cache=self.cache, admins=["slave"])
+        return self.failUnlessFailure(checker.requestAvatarId(credentials.UsernamePassword("slave", "slave")), error.UnauthorizedLogin)
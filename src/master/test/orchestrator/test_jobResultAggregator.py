@@ -127,4 +127,36 @@ class Calculations(AggregateJobResultsTestMixin, unittest.TestCase):
             TestJobResults({ "manual": 20 }),
         ]
         self.aggregateResults.aggregate(jobResults, 1, True)
-        self.assertEquals(self.aggregateResults.manual, self.aggregateResults._attributes["manual"])
\ No newline at end of file
+        self.assertEquals(self.aggregateResults.manual, self.aggregateResults._attributes["manual"])
+
+# a slave's stats entry, with iterations requests over one interval
+def entry(iterations, requestsPerSec=0.0):
+    return {
+        "iterations_total": iterations,
+        "iterations_success": iterations,
+        "iterations_fail": 0,
+        "requestsPerSec": requestsPerSec,
+        "bytesTransferred": 0,
+        "throughput": 0.0,
+        "errors": {},
+    }
+
+class ByTime(unittest.TestCase):
+
+    def test_aligned(self):
+        """Entries on the stats grid land in one interval each"""
+        statsList = [
+            { 0.1: entry(2, 20.0), 0.2: entry(3, 10.0) },
+            { 0.1: entry(1, 10.0), 0.1 + 0.2: entry(4, 30.0) },
+        ]
+        result = AggregateJobResults._aggregateResultsByTime(statsList, 0.1, False)
+        self.assertEquals(sorted(result.keys()), [0.1, 0.2, 0.3])
+        self.assertEquals(result[0.1]["iterations_total"], 3)
+        self.assertEquals(result[0.1]["requestsPerSec"], 30.0)
+        self.assertEquals(result[0.3]["requestsPerSec"], 30.0)
+
+    def test_offGrid(self):
+        """Entries off the grid are shared between the intervals either side"""
+        result = AggregateJobResults._aggregateResultsByTime([{ 1.25: entry(4) }], 1, False)
+        self.assertEquals(result[1]["iterations_total"], 3)
+        self.assertEquals(result[2]["iterations_total"], 1)
@@ -0,0 +1,207 @@
+from thunderserver.orchestrator.orchestrator import _Orchestrator
+from thunderserver.orchestrator.job import JobPerspective, ArchivedJob, JobNotFound, AggregateJobResults, JobHealth
+from thunderserver.orchestrator.archive import ResultsArchive
+from thunderserver.orchestrator.slave import SlavePerspective, SlaveAllocator
+from thundercloud.spec.slave import SlaveSpec, SlaveState
+from thundercloud.spec.job import JobSpec, JobState, JobResults
+from thundercloud.util.compression import gunzipBytes
+
+from thunderserver.db import dbConnection as db
+
+from twisted.internet import reactor, task
+from twisted.trial import unittest
+from twisted.internet.defer import inlineCallbacks
+
+import simplejson as json
+import time
+
+# evict jobs as soon as they're finished
+class TestOrchestrator(_Orchestrator):
+    def _retention(self):
+        return 0
+
+class OrchestratorTestMixin(object):
+    def setUp(self):
+        self.orchestrator = TestOrchestrator()
+
+    def tearDown(self):
+        ResultsArchive.clear()
+        db.execute("DELETE FROM jobs")
+        db.execute("DELETE FROM jobdata")
+        db.execute("DELETE FROM orchestrator")
+
+    def createJob(self, jobId):
+        jobSpec = JobSpec()
+        jobSpec.requests = { "http://localhost:80/foo": { "method": "GET", "postdata": None, "cookies": {}} }
+        jobSpec.duration = 60
+        jobSpec.statsInterval = 1
+        job = JobPerspective(jobId, jobSpec)
+        job.finished.addCallback(self.orchestrator._jobFinished, jobId)
+        self.orchestrator.jobs[jobId] = job
+        db.execute("INSERT INTO jobs (id, user, spec) VALUES (?, ?, ?)", (jobId, 0, jobSpec))
+        return job
+
+    def createResults(self, jobId):
+        results = AggregateJobResults()
+        results.job_id = jobId
+        results.job_state = JobState.COMPLETE
+        results.iterations_total = 42
+        
+        slaveResults = []
+        for slaveId in range(0, 2):
+            jobResults = JobResults()
+            jobResults.job_state = JobState.COMPLETE
+            jobResults.iterations_total = 21
+            slaveResults.append((slaveId, jobResults))
+        return (results, slaveResults)
+
+
+class Eviction(OrchestratorTestMixin, unittest.TestCase):
+
+    @inlineCallbacks
+    def test_evict(self):
+        """Finished jobs are archived and evicted from memory"""
+        job = self.createJob(1)
+        job.finished.callback(self.createResults(1))
+        yield task.deferLater(reactor, 0, lambda: None)
+
+        self.assertEquals(self.orchestrator.jobs, {})
+        results = yield self.orchestrator.jobResults(1, False)
+        self.assertEquals(results.iterations_total, 42)
+        state = yield self.orchestrator.jobState(1)
+        self.assertEquals(state, JobState.COMPLETE)
+
+    @inlineCallbacks
+    def test_shortResults(self):
+        """Archived short results don't carry results_byTime"""
+        job = self.createJob(2)
+        job.finished.callback(self.createResults(2))
+        yield task.deferLater(reactor, 0, lambda: None)
+
+        results = yield self.orchestrator.jobResults(2, True)
+        self.assertFalse(hasattr(results, "results_byTime"))
+
+    @inlineCallbacks
+    def test_error(self):
+        """Jobs which end in error are archived and evicted too"""
+        job = self.createJob(8)
+        job.health = JobHealth.ERROR
+        state = yield job.state()
+        self.assertEquals(state, JobState.ERROR)
+        yield task.deferLater(reactor, 0, lambda: None)
+
+        self.assertEquals(self.orchestrator.jobs, {})
+        state = yield self.orchestrator.jobState(8)
+        self.assertEquals(state, JobState.ERROR)
+
+    @inlineCallbacks
+    def test_neverStarted(self):
+        """Jobs which are never started are dropped after the retention window"""
+        job = self.createJob(9)
+        yield self.orchestrator._expireJob(9)
+        self.assertEquals(self.orchestrator.jobs, {})
+        self.assertFalse(job.task.running)
+
+    def test_unknownOperation(self):
+        """Operations on jobs that don't exist aren't logged"""
+        for operation in ("startJob", "pauseJob", "resumeJob", "stopJob"):
+            self.failUnlessRaises(JobNotFound, getattr(self.orchestrator, operation), 10)
+        self.assertEquals(db.execute("SELECT COUNT(*) AS n FROM orchestrator WHERE job = 10").fetchone()["n"], 0)
+
+    def test_unknownJob(self):
+        """Looking up a job that was never archived fails"""
+        self.createJob(3)
+        self.failUnlessRaises(JobNotFound, self.orchestrator._getJob, 4)
+        self.failUnlessRaises(JobNotFound, ArchivedJob, 3)
+
+
+class Archive(OrchestratorTestMixin, unittest.TestCase):
+
+    def test_store(self):
+        """Final results are archived along with every slave's results"""
+        job = self.createJob(5)
+        job.finished.callback(self.createResults(5))
+        
+        archive = self.orchestrator.archivedResults(5)
+        self.assertEquals(archive.jobState, JobState.COMPLETE)
+        self.assertEquals(len(ResultsArchive.slaveResults(5)), 2)
+        
+        ResultsArchive.clear()
+        self.assertEquals(self.orchestrator.archivedResults(5).full, archive.full)
+
+    def test_storedOnce(self):
+        """Archiving a job's results again doesn't write them twice"""
+        self.createJob(8)
+        (aggregateResults, slaveResults) = self.createResults(8)
+        ResultsArchive.store(8, aggregateResults, slaveResults)
+        ResultsArchive.store(8, aggregateResults, slaveResults)
+        self.assertEquals(len(ResultsArchive.slaveResults(8)), 2)
+
+    def test_compressed(self):
+        """Archived results are gzipped on demand"""
+        job = self.createJob(6)
+        job.finished.callback(self.createResults(6))
+        
+        archive = self.orchestrator.archivedResults(6)
+        self.assertEquals(gunzipBytes(archive.encoded(True, compressed=True)), archive.short)
+        self.assertIdentical(archive.encoded(True, compressed=True), archive.encoded(True, compressed=True))
+
+    def test_running(self):
+        """Jobs which haven't finished aren't served from the archive"""
+        self.createJob(7)
+        self.assertEquals(self.orchestrator.archivedResults(7), None)
+
+
+# a slave whose clock is offset seconds ahead of this host's
+class ClockedSlave(SlavePerspective):
+    def __init__(self, port, offset):
+        slaveSpec = SlaveSpec()
+        slaveSpec.host = "localhost"
+        slaveSpec.port = port
+        slaveSpec.path = "/"
+        SlavePerspective.__init__(self, slaveSpec)
+        self.offset = offset
+        self.started = []
+
+    def heartbeat(self):
+        request = task.deferLater(reactor, 0, lambda: json.dumps({"time": time.time() + self.offset}))
+        request.addCallback(self._heartbeatCallback, time.time())
+        return request
+
+    def startJob(self, jobId, startAt=None):
+        self.started.append(self.clock.toRemote(startAt))
+        return task.deferLater(reactor, 0, lambda: "true")
+
+    def jobState(self, jobId):
+        return task.deferLater(reactor, 0, lambda: json.dumps(JobState.RUNNING))
+
+
+class ScheduledStart(OrchestratorTestMixin, unittest.TestCase):
+
+    def setUp(self):
+        OrchestratorTestMixin.setUp(self)
+        self.saved = SlaveAllocator.slaves
+        SlaveAllocator.slaves = {}
+
+    def tearDown(self):
+        SlaveAllocator.slaves = self.saved
+        return OrchestratorTestMixin.tearDown(self)
+
+    @inlineCallbacks
+    def test_sharedStart(self):
+        """Every slave is told the same start time, on its own clock"""
+        job = self.createJob(8)
+        slaves = [ClockedSlave(7000, 30.0), ClockedSlave(7001, -12.5)]
+        for (i, slave) in enumerate(slaves):
+            SlaveAllocator.slaves[i] = (slave, SlaveState(), None)
+            job.addSlave(slave, i)
+
+        before = time.time()
+        yield job.start()
+        job.release()
+
+        startTimes = [slave.started[0] - slave.offset for slave in slaves]
+        self.assertApproximates(startTimes[0], startTimes[1], 0.05)
+        self.assertTrue(startTimes[0] >= before + 0.5)
+        for slave in slaves:
+            self.assertEquals(len(slave.clock), 3)
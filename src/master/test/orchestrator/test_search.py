@@ -0,0 +1,136 @@
+from thunderserver.orchestrator.search import ThroughputSearch, SearchPhase, measureWindow, histogramPercentile
+from thundercloud.spec.job import JobSpec, JobState, JobResults
+from thundercloud.util.metrics import LATENCY_BUCKETS
+
+from twisted.internet import task
+from twisted.internet.defer import succeed
+from twisted.trial import unittest
+
+
+# a response time histogram with count responses in the bucket for seconds
+def histogram(seconds, count):
+    counts = [0] * (len(LATENCY_BUCKETS) + 1)
+    counts[LATENCY_BUCKETS.index(seconds)] = count
+    return counts
+
+
+# A job on a target which answers anything up to capacity requests/sec in
+# 50ms, and anything more in a second.  Its results are worked out from the
+# rates it's been set to, a second at a time
+class FakeJob(object):
+    def __init__(self, clock, search, capacity=100):
+        self.jobId = 1
+        self.jobSpec = JobSpec()
+        self.jobSpec.profile = JobSpec.JobProfile.SEARCH
+        self.jobSpec.statsInterval = 1
+        self.jobSpec.search = search
+        self.clock = clock
+        self.capacity = capacity
+        self.jobState = JobState.NEW
+        self.startTime = None
+        self.rates = []             # (seconds into the job, requests/sec)
+
+    def setRate(self, rate):
+        elapsed = 0
+        if self.startTime is not None:
+            elapsed = self.clock.seconds() - self.startTime
+        self.rates.append((elapsed, rate))
+        return succeed(True)
+
+    def start(self):
+        self.startTime = self.clock.seconds()
+        self.jobState = JobState.RUNNING
+        return succeed(True)
+
+    def stop(self):
+        self.jobState = JobState.COMPLETE
+        return succeed(True)
+
+    def state(self):
+        return succeed(self.jobState)
+
+    def _rateAt(self, second):
+        return [rate for (elapsed, rate) in self.rates if elapsed < second][-1]
+
+    def _aggregateResults(self, shortResults, query):
+        byTime = {0: {"iterations_success": 0, "iterations_fail": 0, "responseTimes": histogram(0.05, 0)}}
+        total = 0
+        for second in range(1, int(self.clock.seconds() - self.startTime) + 1):
+            rate = self._rateAt(second)
+            total = total + rate
+            latency = rate <= self.capacity and 0.05 or 1.0
+            byTime[second] = {"iterations_success": total, "iterations_fail": 0, "responseTimes": histogram(latency, rate)}
+        results = JobResults()
+        results.results_byTime = byTime
+        return succeed((results, []))
+
+
+class Measure(unittest.TestCase):
+
+    def test_percentile(self):
+        """The percentile is the upper edge of the bucket it falls in"""
+        counts = histogram(0.05, 98)
+        counts[LATENCY_BUCKETS.index(0.5)] = 2
+        self.assertEquals(histogramPercentile(counts, 0.98), 0.05)
+        self.assertEquals(histogramPercentile(counts, 0.99), 0.5)
+        counts[-1] = 50
+        self.assertEquals(histogramPercentile(counts, 0.99), float("inf"))
+        self.assertEquals(histogramPercentile([0] * len(counts), 0.99), None)
+
+    def test_window(self):
+        """Totals are measured from the last entry before the window"""
+        byTime = {}
+        for second in range(0, 11):
+            byTime[str(second)] = {"iterations_success": "%.4f" % (second * 90), "iterations_fail": second * 10, "responseTimes": histogram(0.01, 100)}
+        measured = measureWindow(byTime, 4, 8.5)
+        self.assertEquals((measured["from"], measured["to"]), (4, 8))
+        self.assertAlmostEquals(measured["requestsPerSec"], 100)
+        self.assertAlmostEquals(measured["errorRate"], 0.1)
+        self.assertEquals(measured["p99"], 0.01)
+        self.assertEquals(measureWindow(byTime, 10, 12), None)
+
+
+class Search(unittest.TestCase):
+    def setUp(self):
+        self.clock = task.Clock()
+        self.clock.advance(1000)
+
+    def runSearch(self, job):
+        search = ThroughputSearch(job, self.clock)
+        search.begin()
+        while search.phase in (SearchPhase.RAMP, SearchPhase.BISECT):
+            self.clock.advance(1)
+        return search
+
+    def test_knee(self):
+        """The rate goes up in steps, then halves the gap to the first which misses the SLO"""
+        job = FakeJob(self.clock, {"p99": 0.1, "max": 1000, "start": 20, "stepDuration": 10, "warmup": 2})
+        search = self.runSearch(job)
+        self.assertEquals(search.phase, SearchPhase.DONE)
+        self.assertEquals([step["rate"] for step in search.steps], [20, 40, 60, 80, 100, 120, 110, 105, 102.5])
+        self.assertEquals([step["missed"] for step in search.steps][4:6], [None, "p99"])
+        self.assertEquals(job.jobState, JobState.COMPLETE)
+
+        report = search.report()
+        self.assertEquals(report["knee"], 100)
+        self.assertEquals(report["firstMissed"], 102.5)
+        self.assertAlmostEquals(report["kneeMeasured"]["requestsPerSec"], 100)
+
+    def test_ceiling(self):
+        """The search goes no higher than its max"""
+        job = FakeJob(self.clock, {"p99": 0.1, "max": 50, "start": 20, "stepDuration": 10, "warmup": 2})
+        search = self.runSearch(job)
+        self.assertEquals([step["rate"] for step in search.steps], [20, 40, 50])
+        self.assertEquals(search.report()["knee"], 50)
+
+    def test_interrupted(self):
+        """A job which stops running some other way ends the search"""
+        job = FakeJob(self.clock, {"errorRate": 0.01, "max": 1000, "start": 20, "stepDuration": 10, "warmup": 2})
+        search = ThroughputSearch(job, self.clock)
+        search.begin()
+        self.clock.advance(10)
+        job.jobState = JobState.PAUSED
+        self.clock.advance(10)
+        self.assertEquals(search.phase, SearchPhase.INTERRUPTED)
+        self.assertEquals(search.report()["knee"], 20)
+        self.assertEquals(job.jobState, JobState.PAUSED)
@@ -52,6 +52,17 @@ class LifeCycle(UserManagerTestMixin, unittest.TestCase):
         deferred.addCallback(self._verifyUser, userSpec)
         return deferred
     
+    @inlineCallbacks
+    def test_salted(self):
+        """Every password is hashed with a salt of its own"""
+        for username in ["test_salted1", "test_salted2"]:
+            yield UserManager.create(self._createUserSpec(username, "foo"))
+        yield UserManager.changePassword("test_salted2", "foo")
+        rows = db.execute("SELECT password FROM users WHERE username IN ('test_salted1', 'test_salted2')").fetchall()
+        self.assertNotEquals(rows[0]["password"], rows[1]["password"])
+        for row in rows:
+            self.assertEquals(crypt.crypt("foo", row["password"]), row["password"])
+
     @inlineCallbacks
     def test_createDuplicate(self):
         """Create a duplicate user"""
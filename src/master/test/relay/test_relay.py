@@ -0,0 +1,197 @@
+from thunderserver.relay.relay import _Relay, JobNotFound
+from thunderserver.orchestrator.job import AggregateJobResults
+from thunderserver.orchestrator.slave import SlaveAllocator
+from thundercloud.spec.slave import SlaveSpec, SlaveState
+from thundercloud.spec.job import JobSpec, JobState, JobResults
+from thundercloud.util.clocksync import ClockOffset
+
+from twisted.internet import reactor, task
+from twisted.internet.defer import succeed, inlineCallbacks
+from twisted.trial import unittest
+
+import simplejson as json
+
+
+# answers come back on a later reactor turn, as they would over HTTP
+def later(value):
+    return task.deferLater(reactor, 0, lambda: value)
+
+# stands in for a SlavePerspective, answering from canned results
+class FakeSlave(object):
+    def __init__(self, port, maxRequestsPerSec, results):
+        self.slaveSpec = SlaveSpec()
+        self.slaveSpec.host = "localhost"
+        self.slaveSpec.port = port
+        self.slaveSpec.path = "/"
+        self.slaveSpec.maxRequestsPerSec = maxRequestsPerSec
+        self.slaveSpec.maxSockets = maxRequestsPerSec * 2
+        self.results = results
+        self.clock = ClockOffset()
+        self.jobSpecs = []
+        self.ops = []
+
+    def createJob(self, jobSpec):
+        self.jobSpecs.append(jobSpec)
+        return later(json.dumps(len(self.jobSpecs)))
+
+    def _op(self, operation, jobId):
+        self.ops.append((operation, jobId))
+        return later(json.dumps(True))
+
+    def startJob(self, jobId, startAt=None):
+        return self._op("start", jobId)
+
+    def stopJob(self, jobId):
+        return self._op("stop", jobId)
+
+    def removeJob(self, jobId):
+        return self._op("remove", jobId)
+
+    def jobState(self, jobId):
+        return later(json.dumps(self.results.job_state))
+
+    def jobResults(self, jobId, shortResults, query=None):
+        return later(json.dumps(self.results.toJson()))
+
+    def heartbeat(self):
+        return later(True)
+
+
+def slaveResults(scale, state=JobState.RUNNING):
+    results = JobResults()
+    results.job_state = state
+    results.job_nodes = 1
+    results.iterations_total = 30 * scale
+    results.results_byTime = {}
+    for (t, iterations) in [(0.5, 10), (1.25, 20)]:
+        results.results_byTime[t] = {
+            "iterations_total": iterations * scale,
+            "iterations_success": iterations * scale,
+            "iterations_fail": 0,
+            "requestsPerSec": 2.5 * scale,
+            "bytesTransferred": 1024 * scale,
+            "throughput": 0.75 * scale,
+            "cpu": 0.25,
+            "errors": {},
+        }
+    return results
+
+
+class RelayTestMixin(object):
+    def setUp(self):
+        self.relay = _Relay()
+        self.relay.configure(masterUrl="http://localhost:6001/slave", slaveSpec=self.createSlaveSpec(), minSlaves=2)
+        self.upstream = []
+        self.relay._postUpstream = lambda slaveSpec: self.upstream.append(slaveSpec) or succeed("7")
+        self.saved = SlaveAllocator.slaves
+        SlaveAllocator.slaves = {}
+
+    def tearDown(self):
+        for job in self.relay.jobs.itervalues():
+            job.release()
+        SlaveAllocator.slaves = self.saved
+
+    def createSlaveSpec(self):
+        slaveSpec = SlaveSpec()
+        slaveSpec.host = "relay"
+        slaveSpec.port = 6101
+        slaveSpec.path = ""
+        return slaveSpec
+
+    def createJobSpec(self, clientFunction="200"):
+        jobSpec = JobSpec()
+        jobSpec.requests = { "http://localhost:80/foo": { "method": "GET", "postdata": None, "cookies": {}} }
+        jobSpec.duration = 60
+        jobSpec.transferLimit = 1024**3
+        jobSpec.statsInterval = 1
+        jobSpec.clientFunction = clientFunction
+        return jobSpec
+
+    def addSlaves(self, *scales):
+        slaves = []
+        for (i, scale) in enumerate(scales):
+            slave = FakeSlave(7000 + i, 100, slaveResults(scale))
+            status = SlaveState()
+            SlaveAllocator.slaves[len(SlaveAllocator.slaves) + 1] = (slave, status, None)
+            slaves.append(slave)
+            self.relay.registerUpstream()
+        return slaves
+
+
+class Registration(RelayTestMixin, unittest.TestCase):
+
+    def test_capacity(self):
+        """The relay registers once enough slaves connect, with their combined capacity"""
+        self.addSlaves(1)
+        self.assertEquals(self.upstream, [])
+        self.addSlaves(1, 1)
+        self.assertEquals(len(self.upstream), 1)
+        self.assertEquals(self.upstream[0].maxRequestsPerSec, 200)
+        self.assertEquals(self.upstream[0].maxSockets, 400)
+        self.assertEquals(self.upstream[0].host, "relay")
+        self.assertEquals(self.relay.slaveId, 7)
+        self.assertEquals(self.relay.fleetCapacity(), (300, 600))
+
+    def test_disconnected(self):
+        """Disconnected slaves don't count towards the relay's capacity"""
+        self.addSlaves(1, 1)
+        SlaveAllocator.slaves[1][1].state = SlaveState.DISCONNECTED
+        self.assertEquals(self.relay.fleetCapacity(), (100, 200))
+
+
+class Jobs(RelayTestMixin, unittest.TestCase):
+
+    @inlineCallbacks
+    def test_fanOut(self):
+        """Jobs are split over the sub-fleet and operations fanned out to it"""
+        slaves = self.addSlaves(1, 1)
+        jobId = yield self.relay.createJob(self.createJobSpec())
+        for slave in slaves:
+            self.assertEquals(slave.jobSpecs[0].clientFunction, "(200)/2")
+
+        yield self.relay.startJob(jobId)
+        for slave in slaves:
+            self.assertEquals(slave.ops, [("start", 1)])
+        self.failUnlessRaises(JobNotFound, self.relay.startJob, jobId + 1)
+
+    @inlineCallbacks
+    def test_preAggregated(self):
+        """A master aggregating relays gets what it would from the slaves themselves"""
+        slaves = self.addSlaves(1, 2, 3, 4)
+        jobId = yield self.relay.createJob(self.createJobSpec("400"))
+        relayed = yield self.relay.jobResults(jobId, False)
+        for entry in relayed.results_byTime.itervalues():
+            self.assertEquals(type(entry["requestsPerSec"]), float)
+
+        direct = AggregateJobResults()
+        direct.aggregate([slave.results for slave in slaves], 1, False)
+        master = AggregateJobResults()
+        master.aggregate([JobResults(json.loads(json.dumps(relayed.toJson())))], 1, False)
+        self.assertEquals(master.iterations_total, direct.iterations_total)
+        self.assertEquals(master.job_nodes, 4)
+        self.assertEquals(sorted(master.results_byTime.keys()), sorted(direct.results_byTime.keys()))
+        for (t, entry) in direct.results_byTime.iteritems():
+            for key in ["iterations_total", "requestsPerSec", "throughput", "bytesTransferred", "cpu"]:
+                self.assertEquals(master.results_byTime[t][key], entry[key])
+
+    @inlineCallbacks
+    def test_completed(self):
+        """Finished jobs are answered from the relay's own copy of the results"""
+        slaves = self.addSlaves(1, 1)
+        jobId = yield self.relay.createJob(self.createJobSpec())
+        yield self.relay.startJob(jobId)
+        job = self.relay.jobs[jobId]
+        for slave in slaves:
+            slave.results.job_state = JobState.COMPLETE
+        state = yield self.relay.jobState(jobId)
+        self.assertEquals(state, JobState.COMPLETE)
+        yield job.finished
+        self.assertEquals(self.relay.jobs, {})
+
+        for slave in slaves:
+            slave.results = None
+        results = yield self.relay.jobResults(jobId, True)
+        self.assertEquals(results.iterations_total, 60)
+        self.assertFalse(hasattr(results, "results_byTime"))
+        state = yield self.relay.jobState(jobId)
+        self.assertEquals(state, JobState.COMPLETE)
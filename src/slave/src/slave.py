@@ -1,3 +1,11 @@
+# select() can only watch FD_SETSIZE sockets, so use epoll where there is one.
+# this has to happen before anything imports the reactor
+try:
+    from twisted.internet import epollreactor
+    epollreactor.install()
+except ImportError:
+    pass
+
 from twisted.internet import reactor
 from thundercloud import config
 import thunderslave
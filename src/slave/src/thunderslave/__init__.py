@@ -4,6 +4,9 @@ from thunderslave.restApi import createRestApi
 from thundercloud import config
 from thundercloud.util.restApiClient import RestApiClient
 from thundercloud.spec.slave import SlaveSpec
+from thunderslave.controller import Controller
+from thunderslave.capacity import SocketBudget, Governor
+from thundercloud.util.looplag import LoopLag
 import simplejson as json
 import logging
 import sys
@@ -17,6 +20,15 @@ def startServer(port):
     log = logging.getLogger("main")
     twistedLog.startLogging(sys.stderr)
     
+    Controller.completedJobs.maxSize = config.parameter("cache", "results.size", type=int, default=64)
+    
+    bindAddresses = config.parameter("network", "bind.addresses", default="")
+    SocketBudget.configure(maxSockets=config.parameter("network", "sockets.max", type=int, default=None),
+                           bindAddresses=[address.strip() for address in bindAddresses.split(",") if address.strip()],
+                           linger=config.parameter("network", "linger", type=bool, default=False))
+    Governor.configure(config.parameter("network", "clients.max", type=int))
+    LoopLag.start(config.parameter("monitor", "lag.interval", type=float, default=0.05))
+    
     # since master servers will ping back to the slave upon connection,
     # start listening for HTTP requests before trying to connect up to the master
     log.debug("Listening on port %s, starting reactor" % config.parameter("network", "port"))
@@ -33,7 +45,8 @@ def startServer(port):
         slaveSpec.host = socket.gethostname()
         slaveSpec.port = config.parameter("network", "port", type=int)
         slaveSpec.path = ""
-        slaveSpec.maxRequestsPerSec = config.parameter("network", "clients.max", type=int)
+        slaveSpec.maxRequestsPerSec = Governor.limit
+        slaveSpec.maxSockets = SocketBudget.budget
         
         masterUrl = "%s://%s:%d/%s/slave" % (scheme, host, port, path)
         
@@ -0,0 +1,17 @@
+from budget import _SocketBudget
+from governor import _Governor
+from thundercloud.util.metrics import Metrics
+
+SocketBudget = _SocketBudget()
+Governor = _Governor()
+
+Metrics.gauge("thundercloud_sockets", "Outgoing sockets, by state", ("state",),
+              function=lambda: {("inUse",): SocketBudget.inUse,
+                                ("waiting",): SocketBudget.waiting(),
+                                ("budget",): SocketBudget.budget})
+Metrics.gauge("thundercloud_clients", "Clients the slave's jobs want and are given, by state", ("state",),
+              function=lambda: {("limit",): Governor.limit,
+                                ("demand",): Governor.demand(),
+                                ("granted",): Governor.granted()})
+Metrics.gauge("thundercloud_clients_throttled", "Clients jobs want but aren't given, by job", ("job",),
+              function=lambda: dict([((str(jobId),), clients) for (jobId, clients) in Governor.throttled().iteritems()]))
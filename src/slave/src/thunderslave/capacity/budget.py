@@ -0,0 +1,183 @@
+from twisted.internet import tcp
+from twisted.internet.defer import CancelledError
+from twisted.python.failure import Failure
+
+from collections import deque
+import socket
+import struct
+import time
+import logging
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+log = logging.getLogger("capacity")
+
+# descriptors held back from the budget for listening sockets, the DB, logs...
+RESERVED_DESCRIPTORS = 64
+
+# select() can't watch descriptors past FD_SETSIZE
+FD_SETSIZE = 1024
+
+# never ask for more than this when the hard limit is unlimited
+MAX_DESCRIPTORS = 1048576
+
+
+# raise the soft open file limit as far as the hard limit allows, or to
+# wanted if that's lower.  returns the resulting soft limit
+def raiseDescriptorLimit(wanted=None):
+    if resource is None:
+        return FD_SETSIZE
+
+    (soft, hard) = resource.getrlimit(resource.RLIMIT_NOFILE)
+    target = hard
+    if target == resource.RLIM_INFINITY:
+        target = MAX_DESCRIPTORS
+    if wanted is not None:
+        target = min(target, wanted)
+
+    if target > soft:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+            soft = target
+        except (ValueError, OSError), e:
+            log.warning("Couldn't raise open file limit to %d: %s" % (target, e))
+    return soft
+
+
+# A TCP connector which hands its socket back to the budget when it's done
+# with it, whatever the factory on the other end does
+class _BudgetedConnector(tcp.Connector):
+    def __init__(self, budget, host, port, factory, timeout, bindAddress, reactor):
+        tcp.Connector.__init__(self, host, port, factory, timeout, bindAddress, reactor)
+        self.budget = budget
+        self.held = True
+
+    def connect(self):
+        if not self.held:
+            self.budget.inUse = self.budget.inUse + 1
+            self.held = True
+        tcp.Connector.connect(self)
+
+    def _release(self):
+        if self.held:
+            self.held = False
+            self.budget.release()
+
+    # closing with SO_LINGER 0 resets the connection instead of leaving the
+    # local port in TIME_WAIT
+    def buildProtocol(self, addr):
+        if self.budget.linger:
+            try:
+                self.transport.socket.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+            except (AttributeError, socket.error):
+                pass
+        return tcp.Connector.buildProtocol(self, addr)
+
+    def connectionFailed(self, reason):
+        self._release()
+        tcp.Connector.connectionFailed(self, reason)
+
+    def connectionLost(self, reason):
+        self._release()
+        tcp.Connector.connectionLost(self, reason)
+
+
+# Keeps track of how many sockets the slave can have open at once and how many
+# are open now.  Outgoing connections made through connectTCP past the budget
+# wait in line until a socket is freed, rather than failing with EMFILE or
+# running out of local ports.  Connections are spread across the configured
+# local addresses, each of which has its own range of ephemeral ports
+class _SocketBudget(object):
+    def __init__(self, reactor=None):
+        if reactor is None:
+            from twisted.internet import reactor
+        self.reactor = reactor
+        self.budget = FD_SETSIZE - RESERVED_DESCRIPTORS
+        self.inUse = 0
+        self.linger = False
+        self.bindAddresses = []
+        self.timeout = 30
+        self._nextAddress = 0
+        self._waiting = deque()
+
+    def configure(self, maxSockets=None, bindAddresses=None, linger=False, timeout=30):
+        wanted = None
+        if maxSockets is not None:
+            wanted = maxSockets + RESERVED_DESCRIPTORS
+        budget = raiseDescriptorLimit(wanted) - RESERVED_DESCRIPTORS
+
+        if self.reactor.__class__.__name__ == "SelectReactor":
+            log.warning("select() reactor in use, socket budget is limited to %d" % (FD_SETSIZE - RESERVED_DESCRIPTORS))
+            budget = min(budget, FD_SETSIZE - RESERVED_DESCRIPTORS)
+        if maxSockets is not None:
+            budget = min(budget, maxSockets)
+
+        self.budget = max(budget, 1)
+        self.bindAddresses = [(address, 0) for address in (bindAddresses or [])]
+        self.linger = linger
+        self.timeout = timeout
+        log.info("Socket budget is %d" % self.budget)
+
+    def available(self):
+        return max(self.budget - self.inUse, 0)
+
+    def waiting(self):
+        return len(self._waiting)
+
+    # true if connections are already waiting for a socket; engines use this
+    # to hold off on issuing more work
+    def saturated(self):
+        return len(self._waiting) > 0
+
+    # owner is whatever made the request (its engine), so its waiting
+    # requests can be dropped with discard() when it stops
+    def connectTCP(self, host, port, factory, owner=None):
+        if self.inUse >= self.budget:
+            self._waiting.append((host, port, factory, owner))
+            return None
+        return self._connect(host, port, factory)
+
+    def _connect(self, host, port, factory):
+        bindAddress = None
+        if self.bindAddresses:
+            bindAddress = self.bindAddresses[self._nextAddress]
+            self._nextAddress = (self._nextAddress + 1) % len(self.bindAddresses)
+
+        self.inUse = self.inUse + 1
+        connector = _BudgetedConnector(self, host, port, factory, self.timeout, bindAddress, self.reactor)
+        connector.connect()
+        return connector
+
+    # requests which timed out while they were waiting are skipped.  the
+    # time the others spent waiting is the slave's, not the target's, so
+    # their clocks start again now
+    def release(self):
+        self.inUse = self.inUse - 1
+        while self._waiting and self.inUse < self.budget:
+            (host, port, factory, owner) = self._waiting.popleft()
+            request = getattr(factory, "wrappedFactory", factory)
+            if not getattr(request, "expired", False):
+                value = getattr(request, "value", None)
+                if value is not None:
+                    value["startTime"] = time.time()
+                self._connect(host, port, factory)
+
+    # fail and forget the requests owner still has waiting for a socket
+    def discard(self, owner):
+        waiting = [entry for entry in self._waiting if entry[3] is owner]
+        if not waiting:
+            return
+        self._waiting = deque([entry for entry in self._waiting if entry[3] is not owner])
+        for (host, port, factory, owner) in waiting:
+            factory.clientConnectionFailed(None, Failure(CancelledError("Request dropped, its job stopped")))
+
+    def status(self):
+        return {
+            "budget": self.budget,
+            "inUse": self.inUse,
+            "waiting": len(self._waiting),
+            "bindAddresses": [address for (address, port) in self.bindAddresses],
+        }
@@ -0,0 +1,90 @@
+import logging
+
+log = logging.getLogger("capacity.governor")
+
+# clients a slave runs at once if it isn't configured
+DEFAULT_LIMIT = 200
+
+
+# Shares the slave's clients (network clients.max) out between the jobs
+# running on it, so however many jobs there are, together they stay within
+# what the master's allocator thinks the slave can do.  Each job asks for
+# what its client function wants every time it works out how many clients
+# to run, and gets its share of the limit:
+#
+#   - jobs asking for less than their share get all of it
+#   - what's left is split between the rest in proportion to their weights
+#
+# What jobs want beyond what they're given is the contention, reported by
+# job, so it shows up in the metrics as well as in results lower than the
+# client functions asked for
+class _Governor(object):
+    def __init__(self, limit=DEFAULT_LIMIT):
+        self.limit = limit
+        self.jobs = {}              # jobId -> [weight, demand, granted]
+
+    def configure(self, limit):
+        self.limit = max(int(limit), 0)
+        log.info("Slave runs at most %d clients" % self.limit)
+        self._allocate()
+
+    def register(self, jobId, weight=1):
+        self.jobs[jobId] = [float(weight), 0, 0]
+
+    def unregister(self, jobId):
+        self.jobs.pop(jobId, None)
+        self._allocate()
+
+    # jobId wants this many clients; returns how many it may have
+    def share(self, jobId, wanted):
+        try:
+            job = self.jobs[jobId]
+        except KeyError:
+            return min(wanted, self.limit)
+        job[1] = wanted
+        self._allocate()
+        return job[2]
+
+    # weighted max-min fair shares of the limit
+    def _allocate(self):
+        unsatisfied = [job for job in self.jobs.itervalues() if job[1] > 0]
+        remaining = self.limit
+        for job in self.jobs.itervalues():
+            job[2] = 0
+        while unsatisfied:
+            weights = sum([job[0] for job in unsatisfied])
+            satisfied = [job for job in unsatisfied if job[1] <= remaining * job[0] / weights]
+            if not satisfied:
+                break
+            for job in satisfied:
+                job[2] = job[1]
+                remaining = remaining - job[1]
+                unsatisfied.remove(job)
+        if unsatisfied:
+            weights = sum([job[0] for job in unsatisfied])
+            for job in unsatisfied:
+                job[2] = int(remaining * job[0] / weights)
+
+    def demand(self):
+        return sum([job[1] for job in self.jobs.itervalues()])
+
+    def granted(self):
+        return sum([job[2] for job in self.jobs.itervalues()])
+
+    # clients each job wants but isn't given, as jobId -> clients
+    def throttled(self):
+        return dict([(jobId, demand - granted) for (jobId, (weight, demand, granted)) in self.jobs.iteritems()])
+
+    # true if the jobs want more clients than the slave runs
+    def contended(self):
+        return self.demand() > self.limit
+
+    def status(self):
+        return {
+            "limit": self.limit,
+            "demand": self.demand(),
+            "granted": self.granted(),
+            "contended": self.contended(),
+            "jobs": dict([(str(jobId), {"weight": weight, "demand": demand, "granted": granted, "throttled": demand - granted})
+                          for (jobId, (weight, demand, granted)) in self.jobs.iteritems()]),
+        }
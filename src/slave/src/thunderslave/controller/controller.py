@@ -1,24 +1,53 @@
 from thundercloud.spec.job import JobSpec, JobState
 from ..engine import EngineFactory
+from ..engine.base import sampleLogPath
 from ..db import dbConnection as db
+from thundercloud.util.lru import LRUCache
+from thundercloud.util.metrics import Metrics
+from thundercloud.util.rollup import queryByTime
 
 from twisted.internet.defer import deferredGenerator
 from twisted.internet.defer import inlineCallbacks
 
+import simplejson as json
 import logging
 import datetime
+import os
 
 log = logging.getLogger("controller")
 
 class InvalidJob(Exception):
     pass
 
+class NoSampleLog(Exception):
+    pass
+
 # Tracks and operates on jobs in the system, maintaining an instance
 # of Engine for each job
 class _Controller(object):
     
     def __init__(self):
         self.jobs = {}
+        
+        # completed jobs never change, so their final results are kept here
+        # as (state, short results JSON, full results JSON).  results requests
+        # for them can then be answered without touching the DB, re-parsing
+        # the stored results, or re-serializing anything
+        self.completedJobs = LRUCache(64)
+        
+        Metrics.gauge("thundercloud_jobs", "Jobs in memory, by state", ("state",), function=self._jobsByState)
+    
+    # number of jobs in memory in each state, keyed by (state name,)
+    def _jobsByState(self):
+        names = dict([(getattr(JobState, name), name.lower()) for name in ("NEW", "RUNNING", "PAUSED", "COMPLETE", "ERROR")])
+        counts = dict([((name,), 0) for name in names.itervalues()])
+        for engine in self.jobs.itervalues():
+            name = names.get(engine.state(), "unknown")
+            counts[(name,)] = counts.get((name,), 0) + 1
+        return counts
+    
+    def jobCounts(self):
+        return dict([(name, count) for ((name,), count) in self._jobsByState().iteritems()])
     
     def _getJobNo(self):
         jobNo = db.execute("SELECT jobNo FROM jobno").fetchone()["jobNo"]
@@ -27,9 +56,37 @@ class _Controller(object):
     
     def _kick(self, jobId):
         try:
-            self.jobs.pop(jobId)
+            engine = self.jobs.pop(jobId)
         except KeyError:
             pass
+        else:
+            self._cacheCompletedJob(jobId, engine)
+    
+    def _cacheCompletedJob(self, jobId, engine):
+        results = engine.results(False).toJson()
+        full = json.dumps(results)
+        results.pop("results_byTime", None)
+        short = json.dumps(results)
+        
+        entry = (engine.state(), short, full)
+        self.completedJobs.put(jobId, entry)
+        return entry
+    
+    # cache entry for a completed job, or None if the job is still going
+    def _getCompletedJob(self, jobId):
+        entry = self.completedJobs.get(jobId)
+        if entry is not None:
+            return entry
+        
+        engine = self._getJob(jobId)
+        if engine.state() != JobState.COMPLETE:
+            return None
+        
+        if self.jobs.has_key(jobId):
+            self._kick(jobId)
+            return self.completedJobs.get(jobId)
+        else:
+            return self._cacheCompletedJob(jobId, engine)
     
     def _getJob(self, jobId):
         # if job is in memory
@@ -58,10 +115,11 @@ class _Controller(object):
         self._logToDb(jobNo, "create")
         return jobNo
 
-    def startJob(self, jobId):
+    # startAt is when to start, in epoch seconds; now if it's not given
+    def startJob(self, jobId, startAt=None):
         log.info("Starting job %d" % jobId)
         self._logToDb(jobId, "start")
-        self._getJob(jobId).start()
+        self._getJob(jobId).start(startAt)
 
     def pauseJob(self, jobId):
         log.info("Pausing job %d" % jobId)
@@ -73,6 +131,11 @@ class _Controller(object):
         self._logToDb(jobId, "resume")
         self._getJob(jobId).resume()
     
+    # the rate a SEARCH job runs at, in requests/sec
+    def setJobRate(self, jobId, rate):
+        log.info("Setting job %d's rate to %.2f requests/sec" % (jobId, rate))
+        self._getJob(jobId).setRate(rate)
+    
     def stopJob(self, jobId):
         log.info("Stopping job %d" % jobId)
         self._logToDb(jobId, "stop")
@@ -86,20 +149,56 @@ class _Controller(object):
             self._getJob(jobId).stop()
         except:
             pass
+        self.jobs.pop(jobId, None)
+        self.completedJobs.pop(jobId)
+        try:
+            os.unlink(sampleLogPath(jobId))
+        except OSError:
+            pass
     
     def jobState(self, jobId):
-        state = self._getJob(jobId).state()
+        # if the job is done, this also kicks the engine out from memory
+        entry = self._getCompletedJob(jobId)
+        if entry is not None:
+            return entry[0]
         
-        # if the job is done, kick the engine out from memory
-        if state == JobState.COMPLETE:
-            self._kick(jobId)
-            
-        return state
+        return self._getJob(jobId).state()
     
-    def jobResults(self, jobId, short):
-        results = self._getJob(jobId).results(short)
+    def jobResults(self, jobId, short, query=None):
+        results = self._getJob(jobId).results(short, query)
         
         if results.job_state == JobState.COMPLETE:
             self._kick(jobId)
         
-        return results
\ No newline at end of file
+        return results
+    
+    # path and readable length of a job's sample log.  while the job's
+    # running, the file is longer than what's been written to it
+    def sampleLog(self, jobId):
+        path = sampleLogPath(jobId)
+        engine = self.jobs.get(jobId)
+        if engine is not None:
+            if engine.samples is None:
+                raise NoSampleLog("Job %d isn't recording samples" % jobId)
+            if engine.state() != JobState.COMPLETE:
+                return path, len(engine.samples)
+        try:
+            return path, os.path.getsize(path)
+        except OSError:
+            raise NoSampleLog("Job %d has no sample log" % jobId)
+    
+    # job results as a JSON string, ready to be written out.  query picks out
+    # part of results_byTime; see RollupSeries.query
+    def encodedJobResults(self, jobId, short, query=None):
+        entry = self._getCompletedJob(jobId)
+        if entry is None:
+            return json.dumps(self._getJob(jobId).results(short, query).toJson())
+        
+        if query is not None and short != True:
+            results = json.loads(entry[2])
+            results["results_byTime"] = queryByTime(results["results_byTime"], **query)
+            return json.dumps(results)
+        elif short == True:
+            return entry[1]
+        else:
+            return entry[2]
\ No newline at end of file
@@ -1,5 +1,7 @@
 from benchmark import BenchmarkEngine
 from hammer import HammerEngine
+from session import SessionEngine
+from search import SearchEngine
 from dummy import DummyEngine
 from thundercloud.spec.job import JobSpec
 
@@ -10,5 +12,9 @@ class EngineFactory(object):
             return BenchmarkEngine(jobId, jobSpec)
         elif jobSpec.profile == JobSpec.JobProfile.HAMMER:
             return HammerEngine(jobId, jobSpec)
+        elif jobSpec.profile == JobSpec.JobProfile.SESSION:
+            return SessionEngine(jobId, jobSpec)
+        elif jobSpec.profile == JobSpec.JobProfile.SEARCH:
+            return SearchEngine(jobId, jobSpec)
         elif jobSpec.profile == JobSpec.JobProfile.DUMMY:
             return DummyEngine(jobId, jobSpec)
\ No newline at end of file
@@ -1,54 +1,50 @@
-from Queue import Queue
 from zope.interface import Interface, Attribute, implements
 import time
 import math
 import logging
 import datetime
+from bisect import bisect_left
+import tempfile
 import copy
+import os
 
-from twisted.web.client import HTTPDownloader, _parse
+from twisted.web import error
 from twisted.internet import reactor
+from twisted.internet.error import TimeoutError
+from twisted.python.failure import Failure
 
 from thundercloud import constants
 from thundercloud import config
+from thundercloud.util.looplag import LoopLag
+from thundercloud.util.metrics import Metrics, LATENCY_BUCKETS
+from thundercloud.util.rollup import RollupSeries, RECENT, bucketTime, bucketIndex
+from thundercloud.util.clocksync import monotonic
+from thundercloud.util.samplelog import SampleLogWriter, ERROR_STATUSES, UNKNOWN_TARGET, MAX_BYTES
 from thundercloud.spec.job import IJob, JobState, JobResults
 
 from ..db import dbConnection as db
+from ..capacity import SocketBudget, Governor
+from requestmix import RequestMix
+from rawhttp import RawHTTPClientFactory, encodeRequest
+from resolver import HostCache
+from tls import TLSContext
+from timerwheel import TimerWheel
+from thinktime import ThinkTime
 
 log = logging.getLogger("engine")
 
-# This is our custom HTTP client factory.  Note that it's an old-style class.
-class StatisticalHTTPDownloader(HTTPDownloader):        
-    def __init__(self, url, fileOrName, method="GET", postdata=None, cookies={}, headers=None, agent=None, timeout=None):
-        # XXX re-add support for cookies and timeout to HTTPDownloader call
-        HTTPDownloader.__init__(self, url, fileOrName, method=method, postdata=postdata, headers=headers, agent=agent)
-        self.value = {
-            "startTime": time.time(),
-            "timeToConnect": 0,
-            "timeToFirstByte": 0,
-            "elapsedTime": 0,
-            "bytesTransferred": 0,
-        }
-        self.cookies = cookies
-        self.timeout = timeout
-    
-    def buildProtocol(self, addr):
-        self.value["timeToConnect"] = time.time() - self.value["startTime"]
-        return HTTPDownloader.buildProtocol(self, addr)
-        
-    def pageStart(self, partialContent):
-        self.value["timeToFirstByte"] = time.time() - self.value["startTime"]
-        return HTTPDownloader.pageStart(self, partialContent)
-        
-    def pagePart(self, data):
-        self.value["bytesTransferred"] += len(data)
-        return HTTPDownloader.pagePart(self, data)
-            
-    def pageEnd(self):
-        self.value["elapsedTime"] = time.time() - self.value["startTime"]
-        return HTTPDownloader.pageEnd(self)
-
+# slave-wide counters, summed over every job
+_requestsIssued = Metrics.counter("thundercloud_requests_issued_total", "Requests sent to targets")
+_responses = Metrics.counter("thundercloud_responses_total", "Successful responses from targets")
+_requestErrors = Metrics.counter("thundercloud_request_errors_total", "Failed requests, by error", ("error",))
+_inFlight = Metrics.gauge("thundercloud_requests_in_flight", "Requests sent and waiting on a response")
+_bytesReceived = Metrics.counter("thundercloud_bytes_received_total", "Response body bytes received")
+_responseTime = Metrics.histogram("thundercloud_response_seconds", "Response time of successful requests")
 
+# where a job's raw samples are kept
+def sampleLogPath(jobId):
+    directory = config.parameter("samples", "directory", default=tempfile.gettempdir())
+    return os.path.join(directory, "thundercloud-job-%d.samples" % jobId)
 
 class IEngine(Interface):
     clients = Attribute("""(Theoretical) clients in the system""")
@@ -72,13 +68,14 @@ class EngineBase(object):
         self.requests = {"":{}}
         self.userAgent = str("thundercloud client/%s" % constants.VERSION)
         self.iterator = lambda: True
-        self.httpClientRequestQueue = Queue()
+        self.requestMix = None
         self.jobState = JobState.NEW
         self.timeout = 10
     
         # attributes for time management
         self.duration = float("inf") #60
         self.startTime = None
+        self._startCall = None
         self.endTime = None
         self.elapsedTime = 0.00000001    # so clientFunction(0) != 0
         self.pausedTime = 0.0
@@ -92,14 +89,28 @@ class EngineBase(object):
         self.iterations = 0
         self.requestsCompleted = 0
         self.requestsFailed = 0
+        self.requestsRequested = 0       # what the job asked for...
+        self.requestsIssued = 0          # ...and what actually went out
         self.errors = copy.deepcopy(JobResults().results_errors)
         self.statisticsByTime = copy.deepcopy(JobResults().results_byTime)
         self._averageTimeToConnect = 0
+        self._averageTimeToHandshake = 0
+        self._handshakes = 0
         self._averageTimeToFirstByte = 0
         self._averageResponseTime = 0
         self.statsInterval = 60
         self._statsBookmark = 0          # shortcut to last time stats were generated.
                                          # avoids listing/sorting statisticsByTime keys
+        self._bucket = 0                 # index of the stats bucket being filled
+        self._bucketCall = None
+        self._clockStart = None          # monotonic() at the job's start time
+        self._lagCursor = LoopLag.cursor()
+        self._cpuMark = LoopLag.cpuMark()
+        self._responseTimes = [0] * (len(LATENCY_BUCKETS) + 1)
+        
+        # older stats are rolled up into coarser and coarser intervals, so
+        # long jobs don't keep piling them up
+        self.rollups = RollupSeries(self.statisticsByTime, config.parameter("stats", "rollup.recent", type=int, default=RECENT))
         
         # read the job spec and update attributes
         self.requests = jobSpec.requests
@@ -110,14 +121,47 @@ class EngineBase(object):
         self.timeout = jobSpec.timeout
         self.clientFunction = lambda t: eval(jobSpec.clientFunction)
         
-        # dump the host/port/URLs to be fetched into a queue
-        for url in self.requests.keys():
-            scheme, host, port, path = _parse(str(url))
-            self.httpClientRequestQueue.put([host, port, 
-                                             str(self.requests[url]["method"]), 
-                                             str(url), 
-                                             self.requests[url]["postdata"],
-                                             self.requests[url]["cookies"]])
+        # resolve the host/port/URLs to be fetched and encode the requests
+        # once, up front, so engines can pick the next one without any
+        # parsing or locking
+        self.requestMix = RequestMix(self.requests, jobSpec.requestSelection, jobSpec.requestsFile, str(self.userAgent))
+        
+        # requests which run past the job's timeout are failed.  with lots of
+        # requests in flight, one timer wheel is much cheaper than a
+        # DelayedCall each
+        self.timeouts = None
+        if self.timeout not in (None, 0, float("inf")):
+            self.timeouts = TimerWheel()
+        
+        # closed-loop clients think between requests.  they all wait on the
+        # one timer wheel, at a finer resolution than the timeouts
+        self.thinkTime = ThinkTime.fromJobSpec(jobSpec)
+        self.thinkTimer = None
+        if self.thinkTime is not None:
+            self.thinkTimer = TimerWheel(resolution=0.01)
+        
+        # https targets share a TLS context, and its session cache
+        self.tlsContext = None
+        if [url for url in self._targetUrls() if url.startswith("https:")]:
+            self.tlsContext = TLSContext(jobSpec.tlsResumption)
+        
+        # look the target hosts up now, and keep them fresh in the background
+        # once the job starts, so requests connect straight to an address.
+        # jobs which want DNS time counted in timeToConnect resolve on every
+        # request instead
+        self.hostCache = None
+        if not jobSpec.measureResolution:
+            self.hostCache = HostCache(self._targetHosts(), jobSpec.dnsRoundRobin)
+            self.hostCache.prime()
+        
+        # every request's timings, for jobs which ask for them
+        self.samples = None
+        self._sampleTargets = None
+        if jobSpec.recordSamples:
+            targets = self._sampleTargetUrls()
+            self._sampleTargets = dict([(targets[i], i) for i in range(len(targets) - 1, -1, -1)])
+            self.samples = SampleLogWriter(sampleLogPath(jobId), targets,
+                                           maxBytes=config.parameter("samples", "maxBytes", type=int, default=MAX_BYTES))
         
         db.execute("INSERT INTO jobs (id, startTime, spec) VALUES (?, ?, ?)", 
                     (self.jobId, datetime.datetime.now(), self.jobSpec))
@@ -125,31 +169,84 @@ class EngineBase(object):
                     (self.jobId, 0, 0))
 
   
-    # start the engine.  set the current time and set the job state as running,
-    # then spin up all of the clients
-    def start(self):
+    # every host the job will connect to
+    def _targetHosts(self):
+        return [entry[0] for entry in self.requestMix.entries]
+    
+    def _targetUrls(self):
+        return [entry[3] for entry in self.requestMix.entries]
+    
+    # the sample log's target table.  samples refer to these by index
+    def _sampleTargetUrls(self):
+        return self._targetUrls()
+
+  
+    # start the engine.  startAt (epoch seconds) is when the master wants all
+    # of the job's slaves to start; the engine waits until then, or if the
+    # request got here late, starts straight away with its clock set back to
+    # startAt, so its elapsed time keeps in step with the other slaves'
+    def start(self, startAt=None):
         # only start once
+        if self.jobState != JobState.NEW or self._startCall is not None:
+            return
+        
+        now = time.time()
+        if startAt is None:
+            startAt = now
+        elif startAt > now:
+            log.debug("Starting job %d in %.3fs" % (self.jobId, startAt - now))
+            self._startCall = reactor.callLater(startAt - now, self._begin, startAt)
+            return
+        elif now - startAt > 0.1:
+            log.warn("Job %d's start request arrived %.3fs late" % (self.jobId, now - startAt))
+        self._begin(startAt)
+    
+    # set the clock going and set the job state as running, then spin up all
+    # of the clients
+    def _begin(self, startTime):
+        self._startCall = None
         if self.jobState != JobState.NEW:
             return
         
         log.debug("Starting job %d" % self.jobId)
         
-        self.startTime = time.time()
+        self.startTime = startTime
+        self._clockStart = monotonic() - (time.time() - startTime)
         self.jobState = JobState.RUNNING
+        self._lagCursor = LoopLag.cursor()
+        self._cpuMark = LoopLag.cpuMark()
+        if self.samples is not None:
+            self.samples.setStartTime(self.startTime)
+        Governor.register(self.jobId, self.jobSpec.weight)
+        if self.hostCache is not None:
+            self.hostCache.start()
+        self._scheduleBucket()
         self.iterator()
 
 
     # handy method to set up a Deferred and set up callbacks.  this needs to be
-    # a separate method so it can easily be triggered by reactor.callLater
-    def _request(self, host, port, method, url, postdata, cookies):
-        factory = StatisticalHTTPDownloader(url,
-                                            "/dev/null",
-                                            method=method,
-                                            postdata=postdata,
-                                            cookies=cookies, 
-                                            agent=str(self.userAgent),
-                                            timeout=self.timeout)
-        reactor.connectTCP(host, port, factory)
+    # a separate method so it can easily be triggered by reactor.callLater.
+    # data is the request already encoded by the request mix
+    def _request(self, host, port, method, url, postdata, cookies, data=None):
+        if data is None:
+            data = encodeRequest(method, url, postdata, cookies, str(self.userAgent))
+        self._send(RawHTTPClientFactory(data, method), host, port, url, postdata, cookies)
+    
+    # send the request factory holds.  engines which keep their factories
+    # reset them and send them again
+    def _send(self, factory, host, port, url, postdata, cookies):
+        if self.timeouts is not None:
+            factory.timer = self.timeouts.arm(self.timeout, factory.expire)
+        
+        connection = factory
+        if self.tlsContext is not None and url.startswith("https:"):
+            connection = self.tlsContext.wrap(host, port, factory)
+        if self.hostCache is not None:
+            host = self.hostCache.lookup(host)
+        SocketBudget.connectTCP(host, port, connection, self)
+        self._issued()
+        if self.samples is not None:
+            factory.deferred.addBoth(self._sample, factory, self._sampleTargets.get(url, UNKNOWN_TARGET))
         factory.deferred.addCallback(self.callback)
         factory.deferred.addErrback(self.errback)
         try:
@@ -157,6 +254,28 @@ class EngineBase(object):
             self.bytesTransferred = self.bytesTransferred + len(postdata)
         except TypeError:
             pass
+        return factory.deferred
+        
+
+    def _issued(self):
+        self.requestsIssued = self.requestsIssued + 1
+        _requestsIssued.inc()
+        _inFlight.inc()
+    
+    
+    # write a finished request to the sample log and pass its result on
+    def _sample(self, result, factory, target):
+        value = factory.value
+        if isinstance(result, Failure):
+            bucket = self._errorBucket(result)
+            status = ERROR_STATUSES.get(bucket, bucket)
+            elapsedTime = time.time() - value["startTime"]
+        else:
+            status = value["status"]
+            elapsedTime = value["elapsedTime"]
+        self.samples.append(value["startTime"], target, status, value["timeToConnect"], value["timeToHandshake"],
+                            value["timeToFirstByte"], elapsedTime, value["bytesTransferred"])
+        return result
         
 
     # mark a job as paused.  derived class' iteration loops should be
@@ -168,6 +287,7 @@ class EngineBase(object):
         
         self.jobState = JobState.PAUSED
         self._timeAtPause = time.time()
+        Governor.share(self.jobId, 0)
         
         log.debug("Pausing job %d" % self.jobId)
     
@@ -192,21 +312,44 @@ class EngineBase(object):
                 
         self.jobState = JobState.COMPLETE
         self.endTime = time.time()
-        self._generateStats(force=True)
+        if self._startCall is not None:
+            self._startCall.cancel()
+            self._startCall = None
+        if self._bucketCall is not None:
+            self._bucketCall.cancel()
+            self._bucketCall = None
+        Governor.unregister(self.jobId)
+        SocketBudget.discard(self)
+        if self.hostCache is not None:
+            self.hostCache.stop()
+        if self.timeouts is not None:
+            self.timeouts.stop()
+        if self.thinkTimer is not None:
+            self.thinkTimer.stop()
+        if self.samples is not None:
+            self.samples.close()
+            if self.samples.dropped:
+                log.warn("Job %d's sample log filled up; %d samples were dropped" % (self.jobId, self.samples.dropped))
+        self._closeLastBucket()
         
         db.execute("UPDATE jobs SET endTime = ? WHERE id = ?", (datetime.datetime.now(), self.jobId))
         db.execute("UPDATE jobs SET results = ? WHERE id = ?", (self.results(), self.jobId))    
         log.debug("Job %d complete" % self.jobId)
     
     
-    # some bookkeeping
+    # some bookkeeping.  failed requests have no timings (value is None) and
+    # don't count towards the averages
     def _bookkeep(self, value):
         self.iterations = self.iterations + 1
-        self.bytesTransferred = self.bytesTransferred + value["bytesTransferred"]
         self.elapsedTime = time.time() - self.startTime - self.pausedTime
-        self._averageTimeToConnect = (value["timeToConnect"] + ((self.iterations-1) * self._averageTimeToConnect))/self.iterations
-        self._averageTimeToFirstByte = (value["timeToFirstByte"] + ((self.iterations-1) * self._averageTimeToFirstByte))/self.iterations
-        self._averageResponseTime = (value["elapsedTime"] + ((self.iterations-1) * self._averageResponseTime))/self.iterations
+        if value is not None:
+            self.bytesTransferred = self.bytesTransferred + value["bytesTransferred"]
+            self._averageTimeToConnect = (value["timeToConnect"] + ((self.iterations-1) * self._averageTimeToConnect))/self.iterations
+            if value["timeToHandshake"]:
+                self._handshakes = self._handshakes + 1
+                self._averageTimeToHandshake = (value["timeToHandshake"] + ((self._handshakes-1) * self._averageTimeToHandshake))/self._handshakes
+            self._averageTimeToFirstByte = (value["timeToFirstByte"] + ((self.iterations-1) * self._averageTimeToFirstByte))/self.iterations
+            self._averageResponseTime = (value["elapsedTime"] + ((self.iterations-1) * self._averageResponseTime))/self.iterations
     
         if self.elapsedTime >= self.duration:
             self.stop()
@@ -215,42 +358,85 @@ class EngineBase(object):
             self.stop()        
 
     
-    # generate statistics
-    def _generateStats(self, force=False):
-        # if another timeslice has passed since the last time we took stats
-        # (requests/sec, number of concurrent requests) then let's do it again.
-        if (self.elapsedTime - self._statsBookmark >= self.statsInterval) or force:
-            try:
-                self.statisticsByTime[self.elapsedTime] = {
-                    "iterations_total": self.iterations,
-                    "iterations_success": self.requestsCompleted,
-                    "iterations_fail": self.requestsFailed,
-                    "timeToConnect": self._averageTimeToConnect,
-                    "timeToFirstByte": self._averageTimeToFirstByte,
-                    "responseTime": self._averageResponseTime,
-                    "requestsPerSec": float(self.iterations - self.statisticsByTime[self._statsBookmark]["iterations_total"])/float(self.elapsedTime - self._statsBookmark),
-                    "errors": self.errors,
-                    "bytesTransferred": self.bytesTransferred,
-                    "throughput": float(self.bytesTransferred - self.statisticsByTime[self._statsBookmark]["bytesTransferred"])/float(self.elapsedTime - self._statsBookmark),
-                }
-                
-                # if it's been less than 1 second since the last stats
-                # calculation, the results can get skewed.  for example
-                # if the engine is humming along at 15 requests/sec and 
-                # we get stats at time t and t+0.001 during which there have
-                # been 2 hits, the calculation will say there has been 
-                # 2/.001 = 2000 hits/sec.  so in this case, just steal it
-                # from time t, i guess
-                if self.elapsedTime - self._statsBookmark < 1.0:
-                    self.statisticsByTime[self.elapsedTime]["requestsPerSec"] = self.statisticsByTime[self._statsBookmark]["requestsPerSec"]
-               
-                
-                db.execute("UPDATE accounting SET elapsedTime = ?, bytesTransferred = ? WHERE job = ?", 
-                              (self.elapsedTime, self.bytesTransferred, self.jobId))
-                
-                self._statsBookmark = self.elapsedTime
-            except ZeroDivisionError:
-                pass
+    # Stats are kept in buckets statsInterval seconds wide, counted on the
+    # monotonic clock from the job's start time.  Responses only bump the
+    # running totals; a timer closes each bucket when its time is up and
+    # takes the entry for it, keyed by the end of the bucket.  The job's
+    # slaves share a start time, so their keys line up exactly.  The clock
+    # keeps running while the job's paused, so paused buckets show as idle
+    def _clock(self):
+        return monotonic() - self._clockStart
+
+    def _scheduleBucket(self):
+        end = (self._bucket + 1) * self.statsInterval
+        self._bucketCall = reactor.callLater(max(end - self._clock(), 0), self._closeBucket)
+
+    # a timer which fires late closes every bucket it missed as one entry,
+    # covering all of them
+    def _closeBucket(self):
+        self._bucketCall = None
+        if self.jobState == JobState.COMPLETE:
+            return
+        
+        index = bucketIndex(self._clock(), self.statsInterval)
+        if index > self._bucket:
+            self._generateStats(bucketTime(index, self.statsInterval), (index - self._bucket) * self.statsInterval)
+            self._bucket = index
+        self._scheduleBucket()
+
+    # the part of a bucket the job got through before it stopped
+    def _closeLastBucket(self):
+        if self._clockStart is None:
+            return
+        now = self._clock()
+        index = bucketIndex(now, self.statsInterval)
+        if index > self._bucket:
+            self._generateStats(bucketTime(index, self.statsInterval), (index - self._bucket) * self.statsInterval)
+            self._bucket = index
+        covered = now - self._bucket * self.statsInterval
+        if covered > 1e-6:
+            self._generateStats(bucketTime(self._bucket + 1, self.statsInterval), covered)
+            self._bucket = self._bucket + 1
+    
+    # take the stats entry for the interval seconds up to key
+    def _generateStats(self, key, interval):
+        # how far behind the reactor was running, and how busy the process
+        # was, since the last stats.  a saturated slave measures its own
+        # queueing along with the target's latency
+        previous = self.statisticsByTime[self._statsBookmark]
+        (lag, lagCursor) = LoopLag.percentiles(self._lagCursor)
+        (cpu, cpuMark) = LoopLag.cpu(self._cpuMark)
+        self.statisticsByTime[key] = {
+            "iterations_total": self.iterations,
+            "iterations_success": self.requestsCompleted,
+            "iterations_fail": self.requestsFailed,
+            "timeToConnect": self._averageTimeToConnect,
+            "timeToHandshake": self._averageTimeToHandshake,
+            "timeToFirstByte": self._averageTimeToFirstByte,
+            "responseTime": self._averageResponseTime,
+            "requestsPerSec": float(self.iterations - previous["iterations_total"]) / interval,
+            "errors": dict(self.errors),
+            "bytesTransferred": self.bytesTransferred,
+            "throughput": float(self.bytesTransferred - previous["bytesTransferred"]) / interval,
+            "interval": interval,
+            "responseTimes": self._responseTimes,
+            "requestsRequested": self.requestsRequested,
+            "requestsIssued": self.requestsIssued,
+            "loopLagP50": lag["p50"],
+            "loopLagP90": lag["p90"],
+            "loopLagP99": lag["p99"],
+            "loopLagMax": lag["max"],
+            "cpu": cpu,
+        }
+        self._lagCursor = lagCursor
+        self._cpuMark = cpuMark
+        self._responseTimes = [0] * (len(LATENCY_BUCKETS) + 1)
+        
+        db.execute("UPDATE accounting SET elapsedTime = ?, bytesTransferred = ? WHERE job = ?", 
+                      (self.elapsedTime, self.bytesTransferred, self.jobId))
+        
+        self._statsBookmark = key
+        self.rollups.added(key)
     
     
     # default callback which handles bookkeeping.  derived classes
@@ -258,36 +444,54 @@ class EngineBase(object):
     # via super(), or else duplicate the bookkeeping code
     def callback(self, value):
         self._bookkeep(value)
-        self._generateStats()
         self.requestsCompleted = self.requestsCompleted + 1
+        _responses.inc()
+        _inFlight.dec()
+        _responseTime.observe(value["elapsedTime"])
+        self._responseTimes[bisect_left(LATENCY_BUCKETS, value["elapsedTime"])] += 1
+        _bytesReceived.inc(value["bytesTransferred"])
 
     
     # default errback -- see comments for callback()
     def errback(self, value):
         log.debug("Firing errback.  Error: %s" % value)
-        self._bookkeep("")
-        self._generateStats()
+        self._bookkeep(None)
         self.requestsFailed = self.requestsFailed + 1
+        _inFlight.dec()
+        
+        bucket = self._errorBucket(value)
+        self.errors[bucket] = self.errors.get(bucket, 0) + 1
+        _requestErrors.labels(str(bucket)).inc()
+
+
+    # HTTP error statuses are counted by status code, everything else by what
+    # went wrong
+    def _errorBucket(self, value):
+        if value.check(error.Error):
+            try:
+                return int(value.value.status)
+            except ValueError:
+                pass
         
         # this is probably going to slow things down in a super high traffic environment
         # due to string searches, but there doesn't seem to be a better way.  errback 
         # handling is not very awesome, especially in terms of propagating exceptions
         if "Connection lost" in value.getErrorMessage():
-            self.errors["connectionLost"] = self.errors["connectionLost"] + 1
-        elif "TimeoutError" in value.getErrorMessage():
-            self.errors["timeout"] = self.errors["timeout"] + 1
-        elif "ConnectBindError" in value.getErrorMessage():
-            self.errors["unknown"] = self.errors["unknown"] + 1 
+            return "connectionLost"
+        elif value.check(TimeoutError) or "TimeoutError" in value.getErrorMessage():
+            return "timeout"
         else:
-            self.errors["unknown"] = self.errors["unknown"] + 1
+            return "unknown"
 
 
     # return the job's state
     def state(self):
         return self.jobState
 
-    # generate and fill in a JobResults object
-    def results(self, short=False):        
+    # generate and fill in a JobResults object.  query picks the time range
+    # and resolution of results_byTime, as keyword arguments to
+    # RollupSeries.query
+    def results(self, short=False, query=None):        
         jobResults = JobResults()
         jobResults.job_id = self.jobId
         jobResults.job_state = self.jobState
@@ -308,8 +512,10 @@ class EngineBase(object):
                 del(jobResults.results_byTime)
             except AttributeError:
                 pass
+        elif query is None:
+            jobResults.results_byTime = copy.deepcopy(self.rollups.entries())
         else:
-            jobResults.results_byTime = copy.deepcopy(self.statisticsByTime)
+            jobResults.results_byTime = copy.deepcopy(self.rollups.query(**query))
         
         return jobResults
     
\ No newline at end of file
@@ -1,69 +1,113 @@
-from Queue import Queue, Empty
 import math
 import time
-import random
 
 from twisted.internet import reactor
 
 from base import EngineBase
+from rawhttp import RawHTTPClientFactory
+from ..capacity import Governor
+from requestmix import EmptyRequestMix
 from thundercloud.spec.job import JobState
-from thundercloud import config
 
+# seconds between looks at the client function
+TICK = 0.1
+
+
+# One of the engine's clients, which sends a request, waits for the answer
+# and sends the next.  Its factory is reset and sent again rather than
+# thrown away, unless its last request expired and may still be holding on
+# to a connection or a place in the socket queue
+class BenchmarkClient(object):
+    __slots__ = ("factory",)
+
+    def __init__(self):
+        self.factory = None
+
+    def prepare(self, data, method):
+        if self.factory is None or self.factory.expired:
+            self.factory = RawHTTPClientFactory(data, method)
+        else:
+            self.factory.reset(data, method)
+        return self.factory
+
+
+# Keeps exactly as many clients running as the client function asks for.
+# Every TICK seconds the target is worked out again; clients are started to
+# make up any shortfall, and any surplus retire as their requests finish,
+# back into a pool of idle clients for when the target goes up again.  With
+# a think time or pacing, clients wait on the engine's think timer between
+# requests
 class BenchmarkEngine(EngineBase):
 
     def __init__(self, jobId, jobSpec):
         super(BenchmarkEngine, self).__init__(jobId, jobSpec)
         self.iterator = self._loop
-        self.clients = 0
+        self.clients = 0            # clients with a request out, or thinking
+        self.target = 0
+        self.idle = []
+        self._loopCall = None
 
-    # find out the number of clients needed at the current time, and add clients
-    # until the max number of clients is reached
     def _loop(self):
-        if self.jobState == JobState.RUNNING:
-            # calculates client function at time t
-            clientFunctionResult = min(int(config.parameter("network", "clients.max")), abs(int(math.ceil(self.clientFunction(time.time())))))
-            
-            # only add clients if clientFunc(t) calls for more clients than are
-            # currently in the system.  this may not always be the case -- if a 
-            # traffic slowdown is being simulated, clients in the system need to
-            # die off.  an example of this is a sine wave; at t=1 there will be more
-            # clients than t=1.5
-            if clientFunctionResult > self.clients:
-                for i in range(self.clients, clientFunctionResult):
-                    # take a request item off the queue and then move it right up top.
-                    # this seems nonsensical but it makes the clients fetch all the URLs
-                    # in the order of the queue, and easily allows n clients to handle n+1
-                    # URLs
-                    #
-                    # queue may be empty if there are no URLs in the job spec
-                    try:
-                        request = self.httpClientRequestQueue.get(False)
-                    except Empty:
-                        self.stop()
-                        return
-                    self.httpClientRequestQueue.put(request)
-                    self.clients = self.clients + 1
-                    reactor.callLater(0, self._request, 
-                                      request[0], request[1], request[2],
-                                      request[3], request[4], request[5])
-                        
-
-    # after each request is processed, do some calculations and spin up some
-    # new requests if the test is going to continue
-    def callback(self, value):
-        super(BenchmarkEngine, self).callback(value)
-        self.clients = self.clients - 1
-        
-        # just bail if the job isn't running anymore
+        if self._loopCall is not None and self._loopCall.active():
+            self._loopCall.cancel()
+        self._loopCall = None
+
         if self.jobState != JobState.RUNNING:
             return
-            
-        # otherwise keep it going
-        else:
-            self._loop()
 
+        self.elapsedTime = time.time() - self.startTime - self.pausedTime
+        if self.elapsedTime >= self.duration or self.bytesTransferred >= self.transferLimit:
+            self.stop()
+            return
+
+        self.target = Governor.share(self.jobId, abs(int(math.ceil(self.clientFunction(self.elapsedTime)))))
+        while self.clients < self.target:
+            if self.idle:
+                client = self.idle.pop()
+            else:
+                client = BenchmarkClient()
+            self.clients = self.clients + 1
+            if not self._issue(client):
+                return
+
+        self._loopCall = reactor.callLater(TICK, self._loop)
+
+    # send the client's next request.  the request mix hands out URLs in
+    # round-robin or weighted order, which easily allows n clients to handle
+    # n+1 URLs.  returns False if the mix is empty, which ends the job
+    def _issue(self, client):
+        try:
+            (host, port, method, url, postdata, cookies, data) = self.requestMix.next()
+        except EmptyRequestMix:
+            self.stop()
+            return False
+        self.requestsRequested = self.requestsRequested + 1
+        deferred = self._send(client.prepare(data, method), host, port, url, postdata, cookies)
+        deferred.addBoth(self._finished, client)
+        return True
+
+    # a client whose request finished thinks, then carries on
+    def _finished(self, result, client):
+        if self.thinkTime is not None and self.jobState == JobState.RUNNING:
+            delay = self.thinkTime.delay(client.factory.value["startTime"], time.time())
+            if delay > 0:
+                self.thinkTimer.arm(delay, self._next, client)
+                return
+        self._next(client)
+
+    # unless there are more clients than the target or the job isn't running
+    def _next(self, client):
+        if self.jobState != JobState.RUNNING or self.clients > self.target:
+            self.clients = self.clients - 1
+            self.idle.append(client)
+        else:
+            self._issue(client)
 
-    def errback(self, value):
-        super(BenchmarkEngine, self).errback(value)
-        self.clients = self.clients - 1
-    
+    def stop(self):
+        if self._loopCall is not None and self._loopCall.active():
+            self._loopCall.cancel()
+        self._loopCall = None
+        # clients who were thinking are dropped with the think timer
+        if self.jobState != JobState.COMPLETE and self.thinkTimer is not None:
+            self.clients = self.clients - self.thinkTimer.count
+        super(BenchmarkEngine, self).stop()
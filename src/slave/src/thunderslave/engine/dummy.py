@@ -1,6 +1,8 @@
 from zope.interface import implements
+import simplejson as json
 
-from thundercloud.spec.job import IJob
+from thundercloud.spec.job import IJob, JobResults
+from thundercloud.util.rollup import queryByTime
 
 from base import IEngine
 from ..db import dbConnection as db
@@ -34,7 +36,7 @@ class DummyEngine(object):
         
         
     # normal job operations don't work here
-    def start(self):
+    def start(self, startAt=None):
         return
     
     def pause(self):
@@ -50,7 +52,7 @@ class DummyEngine(object):
         return self.jobResults.job_state
 
     # generate and fill in a JobResults object
-    def results(self, short=False):
+    def results(self, short=False, query=None):
         if short == True:
             results = self.jobResults
             try:
@@ -59,4 +61,9 @@ class DummyEngine(object):
                 pass
             return results
         
+        if query is not None:
+            results = JobResults(json.loads(str(self.jobResults)))
+            results.results_byTime = queryByTime(results.results_byTime, **query)
+            return results
+        
         return self.jobResults
\ No newline at end of file
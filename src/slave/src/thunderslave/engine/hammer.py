@@ -1,21 +1,27 @@
-from Queue import Queue, Empty
 from twisted.internet import reactor
 import time
 import math
 
 from base import EngineBase
+from ..capacity import SocketBudget, Governor
+from requestmix import EmptyRequestMix
 from thundercloud.spec.job import JobState
-from thundercloud import config
 
 class HammerEngine(EngineBase):
 
     def __init__(self, jobId, jobSpec):
         super(HammerEngine, self).__init__(jobId, jobSpec)
         self.iterator = self._loop
+        self._loopCall = None
+        self._requestedTick = None  # the last second requestsRequested counted
 
     # dump a bunch of requests into the reactor, scheduling them evenly over the next 
     # second.  then schedule another loop for a second later
     def _loop(self):
+        if self._loopCall is not None and self._loopCall.active():
+            self._loopCall.cancel()
+        self._loopCall = None
+
         self.elapsedTime = time.time() - self.startTime - self.pausedTime
         
         if self.bytesTransferred >= self.transferLimit:
@@ -27,21 +33,44 @@ class HammerEngine(EngineBase):
             return
         
         if self.jobState == JobState.RUNNING:
-            numRequests = min(int(config.parameter("network", "clients.max")), abs(int(math.ceil(self.clientFunction(time.time())))))
+            # count what the client function asks for, whether or not the
+            # slave manages to send it all, once for each second of the job
+            # however many times the loop runs in it
+            wanted = abs(int(math.ceil(self.clientFunction(self.elapsedTime))))
+            tick = int(self.elapsedTime)
+            if tick != self._requestedTick:
+                self._requestedTick = tick
+                self.requestsRequested = self.requestsRequested + wanted
+        
+            # the slave is out of sockets and requests are already waiting for
+            # one, so don't pile any more on this time around
+            if SocketBudget.saturated():
+                self._loopCall = reactor.callLater(1, self.iterator)
+                return
+        
+            # nothing to send, either because nothing's wanted or the governor
+            # gave the job no clients, so look again next second
+            numRequests = Governor.share(self.jobId, wanted)
             try:
                 timeBetween = 1.0/numRequests
             except ZeroDivisionError:
-                reactor.callLater(0, self._loop)   # avoid recursing
+                self._loopCall = reactor.callLater(1, self.iterator)
                 return
             for i in range(0, numRequests):
-                # queue may be empty if there are no URLs in the job spec
+                # mix may be empty if there are no URLs in the job spec
                 try:
-                    request = self.httpClientRequestQueue.get(False)
-                except Empty:
+                    request = self.requestMix.next()
+                except EmptyRequestMix:
                     self.stop()
                     return
-                self.httpClientRequestQueue.put(request)
                 reactor.callLater(timeBetween, self._request, 
                                   request[0], request[1], request[2],
-                                  request[3], request[4], request[5])
-            reactor.callLater(1, self.iterator)
\ No newline at end of file
+                                  request[3], request[4], request[5],
+                                  request[6])
+            self._loopCall = reactor.callLater(1, self.iterator)
+
+    def stop(self):
+        if self._loopCall is not None and self._loopCall.active():
+            self._loopCall.cancel()
+        self._loopCall = None
+        super(HammerEngine, self).stop()
\ No newline at end of file
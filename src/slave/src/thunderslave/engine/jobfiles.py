@@ -0,0 +1,18 @@
+from thundercloud import config
+
+import os
+
+# Files a job spec names (request corpora, empirical think times) are read
+# from the slave's [files] directory and nowhere else, so whoever submits a
+# job can't have the slave read anything it likes.  Paths are taken relative
+# to the directory; absolute ones have to be inside it too.  Returns the
+# path to open, or None if it's outside the directory or none is configured
+def jobFilePath(path):
+    directory = config.parameter("files", "directory", default=None)
+    if not directory:
+        return None
+    directory = os.path.realpath(directory)
+    resolved = os.path.realpath(os.path.join(directory, path))
+    if not resolved.startswith(directory + os.sep):
+        return None
+    return resolved
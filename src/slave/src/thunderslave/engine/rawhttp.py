@@ -0,0 +1,208 @@
+import time
+
+from twisted.internet.protocol import Protocol, ClientFactory
+from twisted.internet.defer import Deferred
+from twisted.internet.error import TimeoutError
+from twisted.python.failure import Failure
+from twisted.web.client import _parse
+from twisted.web import error
+
+# largest response header block we're willing to buffer
+MAX_HEADER_LENGTH = 65536
+
+
+# Build the complete bytes of an HTTP/1.0 request.  This is done once per
+# URL/method/postdata when a job is created, so sending a request is just a
+# transport.write()
+def encodeRequest(method, url, postdata=None, cookies=None, agent=None):
+    scheme, host, port, path = _parse(url)
+    if (scheme == "http" and port != 80) or (scheme == "https" and port != 443):
+        host = "%s:%d" % (host, port)
+
+    lines = ["%s %s HTTP/1.0" % (method, path), "Host: %s" % host]
+    if agent is not None:
+        lines.append("User-Agent: %s" % agent)
+    if cookies:
+        lines.append("Cookie: %s" % "; ".join(["%s=%s" % (name, cookies[name]) for name in cookies.keys()]))
+    if postdata is not None:
+        lines.append("Content-Length: %d" % len(postdata))
+    lines.append("Connection: close")
+    lines.append("")
+    lines.append(postdata or "")
+    return str("\r\n".join(lines))
+
+
+# Writes a pre-encoded request and reads just enough of the response to tell
+# how it went: the status code, where the headers end and how long the body
+# is.  The body itself is counted and thrown away
+class RawHTTPClient(Protocol):
+    def __init__(self):
+        self.status = None
+        self.remaining = None
+        self.bodyBytes = 0
+        self._headers = ""
+        self._done = False
+
+    def connectionMade(self):
+        # timed out while waiting for a socket
+        if self.factory.expired:
+            self.transport.loseConnection()
+            return
+        self.transport.write(self.factory.data)
+
+    def dataReceived(self, data):
+        if self._done:
+            return
+
+        if self.status is None:
+            if not self._headers:
+                self.factory.firstByte()
+            self._headers = self._headers + data
+            end = self._headers.find("\r\n\r\n")
+            if end == -1:
+                if len(self._headers) > MAX_HEADER_LENGTH:
+                    self._finish(Failure(error.Error("502", "Response headers too long")))
+                return
+            if not self._parseHeaders(self._headers[:end]):
+                return
+            data = self._headers[end + 4:]
+            self._headers = ""
+
+        self.bodyBytes = self.bodyBytes + len(data)
+        if self.remaining is not None:
+            self.remaining = self.remaining - len(data)
+            if self.remaining <= 0:
+                self._finish()
+
+    def _parseHeaders(self, headers):
+        statusLine = headers.split("\r\n", 1)[0].split(" ", 2)
+        try:
+            self.status = int(statusLine[1])
+        except (IndexError, ValueError):
+            self._finish(Failure(error.Error("502", "Malformed status line")))
+            return False
+
+        # HEAD responses and 1xx/204/304 never have a body
+        if self.factory.method == "HEAD" or self.status < 200 or self.status in (204, 304):
+            self.remaining = 0
+            self._finish()
+            return False
+
+        lowered = headers.lower()
+        start = lowered.find("\r\ncontent-length:")
+        if start != -1:
+            start = start + len("\r\ncontent-length:")
+            end = lowered.find("\r\n", start)
+            if end == -1:
+                end = len(lowered)
+            try:
+                self.remaining = int(lowered[start:end])
+            except ValueError:
+                pass
+        return True
+
+    def _finish(self, failure=None):
+        if self._done:
+            return
+        self._done = True
+        if failure is not None:
+            self.factory.responseFailed(failure)
+        else:
+            self.factory.responseReceived(self.status, self.bodyBytes)
+        self.transport.loseConnection()
+
+    # without a Content-Length the body runs until the server hangs up
+    def connectionLost(self, reason):
+        if self._done:
+            return
+        if self.status is not None and not self.remaining:
+            self._finish()
+        else:
+            self._finish(reason)
+
+
+class RawHTTPClientFactory(ClientFactory):
+    protocol = RawHTTPClient
+    noisy = False
+
+    def __init__(self, data, method="GET"):
+        self.reset(data, method)
+
+    # get ready to send another request.  only a factory whose last request
+    # has finished can be reset; one which expired may still have a
+    # connection on the go, or be waiting for a socket.  every request gets
+    # a value of its own: the last one's connection may not have closed
+    # yet, and its TLS context still reads the handshake time from it
+    def reset(self, data, method="GET"):
+        self.data = data
+        self.method = method
+        self.deferred = Deferred()
+        self.timer = None
+        self.expired = False
+        self.connector = None
+        self.client = None
+        self.value = {
+            "startTime": time.time(),
+            "timeToConnect": 0,
+            "timeToHandshake": 0,
+            "timeToFirstByte": 0,
+            "elapsedTime": 0,
+            "bytesTransferred": 0,
+            "status": 0,
+        }
+
+    def startedConnecting(self, connector):
+        self.connector = connector
+
+    def buildProtocol(self, addr):
+        self.value["timeToConnect"] = time.time() - self.value["startTime"]
+        self.client = ClientFactory.buildProtocol(self, addr)
+        return self.client
+
+    def firstByte(self):
+        self.value["timeToFirstByte"] = time.time() - self.value["startTime"]
+
+    # error statuses fail the request just like Twisted's page getters do, so
+    # they land in the status code's error bucket
+    def responseReceived(self, status, bodyBytes):
+        if self.deferred.called:
+            return
+        self._cancelTimer()
+        self.value["elapsedTime"] = time.time() - self.value["startTime"]
+        self.value["bytesTransferred"] = bodyBytes
+        self.value["status"] = status
+        if status >= 400:
+            self.deferred.errback(error.Error(str(status)))
+        else:
+            self.deferred.callback(self.value)
+
+    def responseFailed(self, failure):
+        if self.deferred.called:
+            return
+        self._cancelTimer()
+        self.deferred.errback(failure)
+
+    def clientConnectionFailed(self, connector, reason):
+        self.responseFailed(reason)
+
+    def _cancelTimer(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+    # called by the engine's timer wheel when the request has taken too long.
+    # fails the request and drops the connection, wherever it's got to
+    def expire(self):
+        self.timer = None
+        if self.deferred.called:
+            return
+        self.expired = True
+        self.deferred.errback(TimeoutError("Request timed out"))
+        _abort(self.client, self.connector)
+
+
+def _abort(client, connector):
+    if client is not None and client.transport is not None:
+        getattr(client.transport, "abortConnection", client.transport.loseConnection)()
+    elif connector is not None and connector.state == "connecting":
+        connector.stopConnecting()
@@ -0,0 +1,197 @@
+from twisted.web.client import _parse
+
+from thundercloud.spec.job import JobSpec
+from rawhttp import encodeRequest
+from jobfiles import jobFilePath
+from thundercloud.util.lru import LRUCache
+
+from array import array
+import heapq
+import math
+import mmap
+import os
+import random
+import logging
+
+log = logging.getLogger("engine.requestmix")
+
+class EmptyRequestMix(Exception):
+    pass
+
+class InvalidCorpus(Exception):
+    pass
+
+# Round-robin arrays longer than this get too big to be worth it; past this
+# point weighted round-robin falls back to alias sampling
+MAX_ROUND_ROBIN = 1000000
+
+
+# Parse a request corpus file.  Each line is
+#
+#     URL [weight [method [postdata]]]
+#
+# separated by whitespace.  Blank lines and lines starting with # are skipped.
+# The file is memory-mapped and read a line at a time, so even corpora with
+# hundreds of thousands of URLs are cheap to load
+def _parseCorpus(path):
+    corpus = []
+    f = open(path, "rb")
+    try:
+        if os.fstat(f.fileno()).st_size == 0:
+            return corpus
+        m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            lineNo = 0
+            line = m.readline()
+            while line:
+                lineNo += 1
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    fields = line.split(None, 3)
+                    try:
+                        url = fields[0]
+                        weight = 1.0
+                        method = "GET"
+                        postdata = None
+                        if len(fields) > 1:
+                            weight = float(fields[1])
+                        if len(fields) > 2:
+                            method = fields[2].upper()
+                        if len(fields) > 3:
+                            postdata = fields[3]
+                    except ValueError:
+                        raise InvalidCorpus("%s:%d: bad weight" % (path, lineNo))
+                    if math.isnan(weight) or math.isinf(weight):
+                        raise InvalidCorpus("%s:%d: weight must be finite" % (path, lineNo))
+                    if weight <= 0:
+                        raise InvalidCorpus("%s:%d: weight must be positive" % (path, lineNo))
+                    corpus.append((url, weight, method, postdata))
+                line = m.readline()
+        finally:
+            m.close()
+    finally:
+        f.close()
+    return corpus
+
+# parsed corpora, keyed on (path, mtime, size) so a file is only parsed once
+# no matter how many jobs use it.  path is as the job spec gives it, and has
+# to be in the slave's job file directory
+_corpora = LRUCache(8)
+
+def loadCorpus(path):
+    resolved = jobFilePath(path)
+    if resolved is None:
+        raise InvalidCorpus("%s: not in the slave's job file directory" % path)
+    path = resolved
+    st = os.stat(path)
+    key = (path, st.st_mtime, st.st_size)
+    corpus = _corpora.get(key)
+    if corpus is None:
+        log.debug("Loading request corpus %s" % path)
+        corpus = _parseCorpus(path)
+        _corpora.put(key, corpus)
+    return corpus
+
+
+# Vose's alias method: O(n) setup, then O(1) weighted sampling with a single
+# random number per pick
+def _aliasTables(weights):
+    n = len(weights)
+    total = float(sum(weights))
+    scaled = [w * n / total for w in weights]
+    prob = [1.0] * n
+    alias = range(0, n)
+
+    small = [i for i in xrange(0, n) if scaled[i] < 1.0]
+    large = [i for i in xrange(0, n) if scaled[i] >= 1.0]
+    while small and large:
+        s = small.pop()
+        l = large.pop()
+        prob[s] = scaled[s]
+        alias[s] = l
+        scaled[l] = (scaled[l] + scaled[s]) - 1.0
+        if scaled[l] < 1.0:
+            small.append(l)
+        else:
+            large.append(l)
+
+    # anything left over is 1.0 give or take floating point error
+    return prob, alias
+
+# Stride scheduling: every entry advances by 1/weight each time it's picked,
+# and the entry furthest behind goes next.  This spreads heavier entries out
+# over the cycle instead of bunching them together.  Weights must be integers
+def _roundRobinOrder(weights):
+    heap = [(0.5 / weights[i], i) for i in xrange(0, len(weights))]
+    heapq.heapify(heap)
+    order = array("i")
+    for k in xrange(0, sum(weights)):
+        (passValue, i) = heap[0]
+        order.append(i)
+        heapq.heapreplace(heap, (passValue + 1.0 / weights[i], i))
+    return order
+
+
+# The URLs a job requests and how to pick the next one.  Every request is
+# resolved to a (host, port, method, url, postdata, cookies, data) tuple up
+# front, data being the complete request as it goes on the wire, so picking
+# one is just an index into a list
+class RequestMix(object):
+    def __init__(self, requests, selection=JobSpec.RequestSelection.ROUND_ROBIN, corpus=None, agent=None):
+        self.agent = agent
+        self.entries = []
+        weights = []
+
+        for url in requests.keys():
+            if not url:
+                continue
+            request = requests[url]
+            self._add(url, request["method"], request["postdata"], request["cookies"])
+            weights.append(request.get("weight", 1))
+
+        if corpus is not None:
+            for (url, weight, method, postdata) in loadCorpus(corpus):
+                self._add(url, method, postdata, {})
+                weights.append(weight)
+
+        self._position = 0
+        self._order = None
+        self._prob = None
+        self._alias = None
+
+        if not self.entries:
+            return
+
+        uniform = min(weights) == max(weights)
+        integral = [int(w) for w in weights] == weights
+        if selection == JobSpec.RequestSelection.ROUND_ROBIN and uniform:
+            self._order = array("i", xrange(0, len(self.entries)))
+        elif selection == JobSpec.RequestSelection.ROUND_ROBIN and integral and sum(weights) <= MAX_ROUND_ROBIN:
+            self._order = _roundRobinOrder([int(w) for w in weights])
+        else:
+            (self._prob, self._alias) = _aliasTables(weights)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _add(self, url, method, postdata, cookies):
+        scheme, host, port, path = _parse(str(url))
+        data = encodeRequest(str(method), str(url), postdata, cookies, self.agent)
+        self.entries.append((host, port, str(method), str(url), postdata, cookies, data))
+
+    def next(self):
+        if self._order is not None:
+            i = self._order[self._position]
+            self._position += 1
+            if self._position == len(self._order):
+                self._position = 0
+            return self.entries[i]
+
+        if self._prob is not None:
+            u = random.random() * len(self._prob)
+            i = int(u)
+            if u - i < self._prob[i]:
+                return self.entries[i]
+            return self.entries[self._alias[i]]
+
+        raise EmptyRequestMix
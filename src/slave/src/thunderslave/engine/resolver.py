@@ -0,0 +1,170 @@
+from twisted.internet import reactor
+from twisted.internet.abstract import isIPAddress
+from twisted.internet.defer import DeferredList, succeed
+
+import socket
+import logging
+
+try:
+    from twisted.names import client, dns
+except ImportError:
+    client = None
+    dns = None
+
+log = logging.getLogger("engine.resolver")
+
+# TTLs are clamped to this range so records with tiny TTLs don't turn into
+# a stream of lookups, and long-lived ones still get looked at now and then
+MIN_TTL = 5
+MAX_TTL = 3600
+
+# used when the system resolver answers, since it doesn't tell us the TTL
+DEFAULT_TTL = 60
+
+# (first try, retry) timeouts for a single DNS lookup
+LOOKUP_TIMEOUT = (1, 3)
+
+def _isIPv6Address(host):
+    try:
+        socket.inet_pton(socket.AF_INET6, host)
+        return True
+    except (socket.error, ValueError, AttributeError):
+        return False
+
+
+# Addresses for every host a job talks to, looked up when the job is created
+# and refreshed in the background as their TTLs run out once it starts.
+# Engines connect to the cached address, so requests never wait on a lookup
+# and resolution time stays out of timeToConnect.  With roundRobin,
+# successive lookups cycle through all of a host's A and AAAA records
+class HostCache(object):
+    def __init__(self, hosts, roundRobin=False, resolver=None, clock=reactor):
+        self.roundRobin = roundRobin
+        self.resolver = resolver
+        self.clock = clock
+        self.hosts = [host for host in set(hosts) if not isIPAddress(host) and not _isIPv6Address(host)]
+        self._addresses = {}
+        self._positions = {}
+        self._calls = {}
+        self._due = {}              # when primed hosts need looking up again
+        self._primed = False
+        self._refreshing = False
+        self._stopped = False
+
+    def _getResolver(self):
+        if self.resolver is None and client is not None:
+            self.resolver = client.getResolver()
+        return self.resolver
+
+    # resolve every host once, without keeping them fresh, so a job which is
+    # created but never started doesn't leave timers behind.  the returned
+    # Deferred fires once they've all been looked up, whether or not that
+    # worked
+    def prime(self):
+        self._primed = True
+        return DeferredList([self.refresh(host) for host in self.hosts])
+
+    # keep every host fresh from now on, resolving them first if they haven't
+    # been primed
+    def start(self):
+        self._refreshing = True
+        if not self._primed:
+            return self.prime()
+        now = self.clock.seconds()
+        for (host, due) in self._due.items():
+            self._schedule(host, max(due - now, 0))
+        self._due = {}
+        return succeed(None)
+
+    def stop(self):
+        self._stopped = True
+        for call in self._calls.values():
+            if call.active():
+                call.cancel()
+        self._calls = {}
+        self._due = {}
+
+    # address to connect to for host.  hosts which haven't been resolved (yet),
+    # or which only the system resolver knows about, are handed back as they
+    # are and get resolved at connect time
+    def lookup(self, host):
+        addresses = self._addresses.get(host)
+        if addresses is None:
+            return host
+        if not self.roundRobin or len(addresses) == 1:
+            return addresses[0]
+        position = self._positions[host]
+        self._positions[host] = (position + 1) % len(addresses)
+        return addresses[position]
+
+    def refresh(self, host):
+        d = self._resolve(host)
+        d.addCallback(self._resolved, host)
+        d.addErrback(self._failed, host)
+        return d
+
+    # returns a Deferred firing with a list of (address, ttl)
+    def _resolve(self, host):
+        resolver = self._getResolver()
+        if resolver is None:
+            return self._resolveSystem(host)
+
+        lookups = [resolver.lookupAddress(host, timeout=LOOKUP_TIMEOUT)]
+        if self.roundRobin:
+            lookups.append(resolver.lookupIPV6Address(host, timeout=LOOKUP_TIMEOUT))
+        d = DeferredList(lookups, consumeErrors=True)
+        d.addCallback(self._records, host)
+        return d
+
+    def _records(self, results, host):
+        addresses = []
+        for (success, result) in results:
+            if not success:
+                continue
+            for record in result[0]:
+                if record.type == dns.A:
+                    addresses.append((record.payload.dottedQuad(), record.ttl))
+                elif record.type == dns.AAAA:
+                    addresses.append((socket.inet_ntop(socket.AF_INET6, record.payload.address), record.ttl))
+        return addresses
+
+    def _resolveSystem(self, host):
+        d = reactor.resolve(host)
+        d.addCallback(lambda address: [(address, DEFAULT_TTL)])
+        return d
+
+    def _resolved(self, addresses, host):
+        if not addresses:
+            return self._failed(None, host)
+
+        # keep the order stable so round-robin positions mean something
+        # across refreshes
+        seen = []
+        for (address, ttl) in addresses:
+            if address not in seen:
+                seen.append(address)
+        if self._addresses.get(host) != seen:
+            log.debug("%s resolved to %s" % (host, ", ".join(seen)))
+            self._addresses[host] = seen
+            self._positions[host] = 0
+
+        ttl = min([ttl for (address, ttl) in addresses])
+        self._schedule(host, max(MIN_TTL, min(MAX_TTL, ttl)))
+        return seen
+
+    # old addresses are kept until a lookup succeeds again
+    def _failed(self, failure, host):
+        log.warning("Couldn't resolve %s: %s" % (host, failure))
+        self._schedule(host, MIN_TTL)
+        return None
+
+    def _schedule(self, host, delay):
+        if self._stopped:
+            return
+        if not self._refreshing:
+            self._due[host] = self.clock.seconds() + delay
+            return
+        call = self._calls.get(host)
+        if call is not None and call.active():
+            call.cancel()
+        self._calls[host] = self.clock.callLater(delay, self.refresh, host)
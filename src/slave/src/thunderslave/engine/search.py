@@ -0,0 +1,13 @@
+from hammer import HammerEngine
+
+# The slave's part of a SEARCH job: a HAMMER job whose rate (requests/sec)
+# is set by the master as it searches, rather than by the client function
+class SearchEngine(HammerEngine):
+
+    def __init__(self, jobId, jobSpec):
+        super(SearchEngine, self).__init__(jobId, jobSpec)
+        self.rate = 0
+        self.clientFunction = lambda t: self.rate
+
+    def setRate(self, rate):
+        self.rate = rate
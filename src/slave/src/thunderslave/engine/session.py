@@ -0,0 +1,320 @@
+import math
+import time
+import re
+
+from twisted.web.client import HTTPClientFactory, _parse
+from twisted.internet import reactor
+from twisted.internet.error import TimeoutError
+from twisted.python.failure import Failure
+
+from base import EngineBase
+from rawhttp import _abort
+from ..capacity import SocketBudget, Governor
+from thundercloud.spec.job import JobState
+
+_variable = re.compile(r"\$\{(\w+)\}")
+
+# Sessions need the response body to pull values out of and the Set-Cookie
+# headers, so unlike the other engines they go through Twisted's page getter.
+# Set-Cookie headers end up in self.cookies
+class StatisticalHTTPClientFactory(HTTPClientFactory):
+    def __init__(self, url, method="GET", postdata=None, headers=None, cookies=None, agent=None):
+        HTTPClientFactory.__init__(self, url, method=method, postdata=postdata, headers=headers, cookies=cookies, agent=agent)
+        self.value = {
+            "startTime": time.time(),
+            "timeToConnect": 0,
+            "timeToHandshake": 0,
+            "timeToFirstByte": 0,
+            "elapsedTime": 0,
+            "bytesTransferred": 0,
+            "status": 0,
+        }
+        self.timer = None
+        self.expired = False
+        self.connector = None
+        self.client = None
+
+    def startedConnecting(self, connector):
+        self.connector = connector
+
+    def buildProtocol(self, addr):
+        self.value["timeToConnect"] = time.time() - self.value["startTime"]
+        self.client = HTTPClientFactory.buildProtocol(self, addr)
+        return self.client
+
+    def gotHeaders(self, headers):
+        self.value["timeToFirstByte"] = time.time() - self.value["startTime"]
+        return HTTPClientFactory.gotHeaders(self, headers)
+
+    def page(self, page):
+        self.value["elapsedTime"] = time.time() - self.value["startTime"]
+        self.value["bytesTransferred"] = len(page)
+        self.value["status"] = int(self.status)
+        self._cancelTimer()
+        return HTTPClientFactory.page(self, page)
+
+    def noPage(self, reason):
+        self._cancelTimer()
+        return HTTPClientFactory.noPage(self, reason)
+
+    def clientConnectionFailed(self, connector, reason):
+        self._cancelTimer()
+        return HTTPClientFactory.clientConnectionFailed(self, connector, reason)
+
+    def _cancelTimer(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+    # see RawHTTPClientFactory.expire.  if the connection never got going,
+    # nothing else is going to tell the page getter it's over
+    def expire(self):
+        self.timer = None
+        if not self.waiting:
+            return
+        self.expired = True
+        connected = self.client is not None and self.client.transport is not None
+        self.noPage(Failure(TimeoutError("Request timed out")))
+        _abort(self.client, self.connector)
+        disconnected = getattr(self, "_disconnectedDeferred", None)
+        if not connected and disconnected is not None and not disconnected.called:
+            disconnected.callback(None)
+
+
+# A single virtual user.  There can be a lot of these, so there's no instance
+# dict: the cookie jar is a tuple of (name, value) pairs and extracted
+# variables live in a list indexed by SessionFlow.variables
+class VirtualUser(object):
+    __slots__ = ("id", "step", "cookies", "variables")
+
+    def __init__(self, id):
+        self.id = id
+        self.step = 0
+        self.cookies = ()
+        self.variables = None
+
+
+# split a string on ${name} references.  constant strings are returned as-is,
+# otherwise a tuple of literal strings and variable indices
+def _template(text, variables):
+    if text is None or _variable.search(text) is None:
+        return text
+
+    parts = []
+    position = 0
+    for match in _variable.finditer(text):
+        if match.start() > position:
+            parts.append(text[position:match.start()])
+        name = match.group(1)
+        if not variables.has_key(name):
+            variables[name] = len(variables)
+        parts.append(variables[name])
+        position = match.end()
+    if position < len(text):
+        parts.append(text[position:])
+    return tuple(parts)
+
+def _render(template, values):
+    if template is None or template.__class__ is str:
+        return template
+    rendered = []
+    for part in template:
+        if part.__class__ is int:
+            part = values[part] or ""
+        rendered.append(part)
+    return "".join(rendered)
+
+
+class SessionStep(object):
+    __slots__ = ("method", "url", "postdata", "headers", "host", "port", "extract")
+
+    def __init__(self, step, variables):
+        self.method = str(step.get("method", "GET"))
+        self.url = _template(str(step["url"]), variables)
+        self.postdata = _template(step.get("postdata", None), variables)
+        if self.postdata is not None and self.postdata.__class__ is unicode:
+            self.postdata = str(self.postdata)
+        self.headers = None
+        if step.get("headers"):
+            self.headers = dict([(str(name), str(value)) for (name, value) in step["headers"].items()])
+
+        # the host and port of constant URLs only need to be worked out once
+        self.host = None
+        self.port = None
+        if self.url.__class__ is str:
+            scheme, self.host, self.port, path = _parse(self.url)
+
+        self.extract = []
+        for name in step.get("extract", {}).keys():
+            if not variables.has_key(name):
+                variables[name] = len(variables)
+            self.extract.append((variables[name], re.compile(step["extract"][name])))
+
+    # returns (host, port, url, postdata) for this step as seen by a user
+    def render(self, user):
+        if self.host is not None:
+            url = self.url
+            host, port = self.host, self.port
+        else:
+            url = _render(self.url, user.variables)
+            scheme, host, port, path = _parse(url)
+        return host, port, url, _render(self.postdata, user.variables)
+
+
+# A scripted flow -- login, browse, check out -- compiled from the job spec's
+# session description.  Every variable referenced or extracted anywhere in the
+# flow gets a fixed slot, so users only need a list of values
+class SessionFlow(object):
+    def __init__(self, session):
+        self.variables = {}
+        self.steps = [SessionStep(step, self.variables) for step in session["steps"]]
+
+        self.initialCookies = tuple([(str(name), str(value)) for (name, value) in session.get("cookies", {}).items()])
+        self.initialVariables = None
+        if self.variables:
+            self.initialVariables = [None] * len(self.variables)
+            for (name, value) in session.get("variables", {}).items():
+                if self.variables.has_key(name):
+                    self.initialVariables[self.variables[name]] = str(value)
+
+    # start a new session from the first step with fresh cookies and variables
+    def reset(self, user):
+        user.step = 0
+        user.cookies = self.initialCookies
+        if self.initialVariables is not None:
+            user.variables = list(self.initialVariables)
+            if self.variables.has_key("vu"):
+                user.variables[self.variables["vu"]] = str(user.id)
+
+    # record the outcome of the user's current step and move on to the next
+    # one, starting over once the flow is finished
+    def advance(self, user, page, cookies):
+        step = self.steps[user.step]
+        for (index, pattern) in step.extract:
+            match = pattern.search(page)
+            if match is not None:
+                if match.groups():
+                    user.variables[index] = match.group(1)
+                else:
+                    user.variables[index] = match.group(0)
+        user.cookies = tuple(cookies.items())
+
+        user.step = user.step + 1
+        if user.step == len(self.steps):
+            self.reset(user)
+
+
+# Runs clientFunction(t) virtual users through the job's session flow.  Each
+# user has at most one request in flight and carries its own cookie jar and
+# extracted variables from one step to the next
+class SessionEngine(EngineBase):
+
+    def __init__(self, jobId, jobSpec):
+        self.flow = SessionFlow(jobSpec.session)
+        super(SessionEngine, self).__init__(jobId, jobSpec)
+        self.iterator = self._loop
+        self.clients = 0
+        self.targetUsers = 0
+        self._nextUserId = 0
+        self._parked = []
+        self._loopCall = None
+
+    # hosts of steps whose URLs depend on variables aren't known up front
+    def _targetHosts(self):
+        return [step.host for step in self.flow.steps if step.host is not None]
+
+    def _targetUrls(self):
+        return [step.url for step in self.flow.steps if step.url.__class__ is str]
+
+    # samples are recorded against the step, whatever its URL came out as
+    def _sampleTargetUrls(self):
+        return [str(step["url"]) for step in self.jobSpec.session["steps"]]
+
+    # once a second, work out how many users should be in the system and add
+    # any that are missing.  surplus users leave after their current request
+    def _loop(self):
+        if self._loopCall is not None and self._loopCall.active():
+            self._loopCall.cancel()
+        self._loopCall = None
+
+        if self.jobState != JobState.RUNNING:
+            return
+
+        self.elapsedTime = time.time() - self.startTime - self.pausedTime
+        if self.elapsedTime >= self.duration or self.bytesTransferred >= self.transferLimit:
+            self.stop()
+            return
+
+        self.targetUsers = Governor.share(self.jobId, abs(int(math.ceil(self.clientFunction(self.elapsedTime)))))
+
+        # users who finished a request while the job was paused carry on
+        # where they left off
+        parked, self._parked = self._parked, []
+        for user in parked:
+            self._step(user)
+
+        while self.clients < self.targetUsers:
+            user = VirtualUser(self._nextUserId)
+            self._nextUserId = self._nextUserId + 1
+            self.flow.reset(user)
+            self.clients = self.clients + 1
+            self._step(user)
+
+        self._loopCall = reactor.callLater(1, self._loop)
+
+    def _step(self, user):
+        step = self.flow.steps[user.step]
+        host, port, url, postdata = step.render(user)
+        factory = StatisticalHTTPClientFactory(url,
+                                               method=step.method,
+                                               postdata=postdata,
+                                               headers=step.headers,
+                                               cookies=dict(user.cookies),
+                                               agent=str(self.userAgent))
+        if self.timeouts is not None:
+            factory.timer = self.timeouts.arm(self.timeout, factory.expire)
+
+        connection = factory
+        if self.tlsContext is not None and url.startswith("https:"):
+            connection = self.tlsContext.wrap(host, port, factory)
+        if self.hostCache is not None:
+            host = self.hostCache.lookup(host)
+        SocketBudget.connectTCP(host, port, connection, self)
+        self.requestsRequested = self.requestsRequested + 1
+        self._issued()
+        if self.samples is not None:
+            factory.deferred.addBoth(self._sample, factory, user.step)
+        factory.deferred.addCallbacks(self._stepDone, self._stepFailed,
+                                      callbackArgs=(user, factory), errbackArgs=(user,))
+        if postdata is not None:
+            self.bytesTransferred = self.bytesTransferred + len(postdata)
+        return factory.deferred
+
+    def _stepDone(self, page, user, factory):
+        self.callback(factory.value)
+        self.flow.advance(user, page, factory.cookies)
+        self._continue(user, factory.value["startTime"])
+
+    # a failed step ends the user's session; they start again from the top
+    def _stepFailed(self, failure, user):
+        self.errback(failure)
+        self.flow.reset(user)
+        self._continue(user)
+
+    # users think between steps.  started is when the step was sent, for
+    # pacing
+    def _continue(self, user, started=None):
+        if self.thinkTime is not None and self.jobState == JobState.RUNNING:
+            delay = self.thinkTime.delay(started, time.time())
+            if delay > 0:
+                self.thinkTimer.arm(delay, self._next, user)
+                return
+        self._next(user)
+
+    def _next(self, user):
+        if self.jobState == JobState.PAUSED:
+            self._parked.append(user)
+        elif self.jobState != JobState.RUNNING or self.clients > self.targetUsers:
+            self.clients = self.clients - 1
+        else:
+            self._step(user)
@@ -0,0 +1,86 @@
+from thundercloud.spec.job import JobSpec
+from jobfiles import jobFilePath
+
+import random
+import logging
+
+log = logging.getLogger("engine.thinktime")
+
+class InvalidThinkTime(Exception):
+    pass
+
+
+# Parse a file of think times, one number of seconds per line.  Blank lines
+# and lines starting with # are skipped.  The file has to be in the slave's
+# job file directory
+def _parseEmpirical(path):
+    resolved = jobFilePath(path)
+    if resolved is None:
+        raise InvalidThinkTime("%s: not in the slave's job file directory" % path)
+    values = []
+    f = open(resolved, "rb")
+    try:
+        lineNo = 0
+        for line in f:
+            lineNo += 1
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                value = float(line)
+            except ValueError:
+                raise InvalidThinkTime("%s:%d: bad think time" % (path, lineNo))
+            if value < 0:
+                raise InvalidThinkTime("%s:%d: negative think time" % (path, lineNo))
+            values.append(value)
+    finally:
+        f.close()
+    if not values:
+        raise InvalidThinkTime("%s: no think times" % path)
+    return values
+
+
+# How long a closed-loop client waits between getting an answer and sending
+# its next request.  The think time is drawn from the job's distribution;
+# with pacing as well, a client also waits until pacing seconds have passed
+# since it sent its last request, so each client sends at most one request
+# every pacing seconds however quickly it's answered
+class ThinkTime(object):
+    def __init__(self, thinkTime=None, pacing=None, rng=None):
+        self.random = rng or random.Random()
+        self.pacing = pacing
+        self._sample = lambda: 0
+        if thinkTime is not None:
+            self._sample = self._sampler(thinkTime)
+
+    @classmethod
+    def fromJobSpec(cls, jobSpec):
+        if jobSpec.thinkTime is None and jobSpec.pacing is None:
+            return None
+        return cls(jobSpec.thinkTime, jobSpec.pacing)
+
+    def _sampler(self, thinkTime):
+        distribution = thinkTime["distribution"]
+        if distribution == JobSpec.ThinkTime.CONSTANT:
+            seconds = float(thinkTime["seconds"])
+            return lambda: seconds
+        elif distribution == JobSpec.ThinkTime.UNIFORM:
+            (low, high) = (float(thinkTime["min"]), float(thinkTime["max"]))
+            return lambda: self.random.uniform(low, high)
+        elif distribution == JobSpec.ThinkTime.EXPONENTIAL:
+            rate = 1.0 / float(thinkTime["mean"])
+            cap = float(thinkTime.get("max", float("inf")))
+            return lambda: min(self.random.expovariate(rate), cap)
+        elif distribution == JobSpec.ThinkTime.EMPIRICAL:
+            values = _parseEmpirical(thinkTime["file"])
+            log.debug("Loaded %d think times from %s" % (len(values), thinkTime["file"]))
+            return lambda: values[int(self.random.random() * len(values))]
+        raise InvalidThinkTime("Unknown think time distribution %s" % distribution)
+
+    # seconds to wait at time now before sending the next request, for a
+    # client whose last request was sent at started
+    def delay(self, started, now):
+        delay = self._sample()
+        if self.pacing is not None and started is not None:
+            delay = max(delay, started + self.pacing - now)
+        return max(delay, 0)
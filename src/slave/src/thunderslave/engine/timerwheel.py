@@ -0,0 +1,92 @@
+from twisted.internet import reactor
+from twisted.internet.task import LoopingCall
+
+import math
+
+# slack for floating point error when turning times into ticks
+EPSILON = 1e-6
+
+class Timer(object):
+    __slots__ = ("wheel", "slot", "deadline", "f", "args")
+
+    def __init__(self, wheel, slot, deadline, f, args):
+        self.wheel = wheel
+        self.slot = slot
+        self.deadline = deadline
+        self.f = f
+        self.args = args
+
+    # O(1): just drop the timer from its slot
+    def cancel(self):
+        if self.slot is not None:
+            self.slot.discard(self)
+            self.slot = None
+            self.wheel.count = self.wheel.count - 1
+
+
+# Hashed timer wheel.  Time is cut into ticks of resolution seconds and each
+# timer is hashed into the slot for the tick it expires on, so arming and
+# cancelling are a set add/discard no matter how many timers there are.  A
+# single LoopingCall walks the wheel a tick at a time while timers are armed,
+# instead of the reactor juggling a DelayedCall per timer.  Timers fire up to
+# one tick late
+class TimerWheel(object):
+    def __init__(self, resolution=0.1, size=512, clock=reactor):
+        self.resolution = resolution
+        self.clock = clock
+        self._slots = [set() for i in xrange(0, size)]
+        self._tick = 0
+        self._startTime = None
+        self._loop = None
+        self.count = 0
+
+    def arm(self, delay, f, *args):
+        if self._loop is None:
+            self._start()
+
+        # always at least one tick ahead, so a timer can't land in the slot
+        # that's being walked
+        now = (self.clock.seconds() - self._startTime) / self.resolution
+        deadline = max(self._tick + 1, int(math.ceil(now + delay / self.resolution - EPSILON)))
+        slot = self._slots[deadline % len(self._slots)]
+        timer = Timer(self, slot, deadline, f, args)
+        slot.add(timer)
+        self.count = self.count + 1
+        return timer
+
+    def _start(self):
+        self._startTime = self.clock.seconds() - self._tick * self.resolution
+        self._loop = LoopingCall(self._advance)
+        self._loop.clock = self.clock
+        self._loop.start(self.resolution, now=False)
+
+    def stop(self):
+        if self._loop is not None and self._loop.running:
+            self._loop.stop()
+        self._loop = None
+        for slot in self._slots:
+            for timer in slot:
+                timer.slot = None
+            slot.clear()
+        self.count = 0
+
+    # catch up on every tick that's passed, in case the reactor was busy
+    def _advance(self):
+        now = int((self.clock.seconds() - self._startTime) / self.resolution + EPSILON)
+        while self._tick < now:
+            self._tick = self._tick + 1
+            self._expire(self._slots[self._tick % len(self._slots)])
+
+        if self.count == 0 and self._loop is not None:
+            self._loop.stop()
+            self._loop = None
+
+    def _expire(self, slot):
+        if not slot:
+            return
+        expired = [timer for timer in slot if timer.deadline <= self._tick]
+        for timer in expired:
+            slot.discard(timer)
+            timer.slot = None
+            self.count = self.count - 1
+            timer.f(*timer.args)
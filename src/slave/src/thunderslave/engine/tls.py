@@ -0,0 +1,91 @@
+import time
+import logging
+
+# pyOpenSSL is optional; without it, jobs with https targets can't run
+try:
+    from OpenSSL import SSL
+    from twisted.protocols.tls import TLSMemoryBIOFactory, TLSMemoryBIOProtocol
+except ImportError:
+    SSL = None
+    TLSMemoryBIOFactory = object
+    TLSMemoryBIOProtocol = object
+
+log = logging.getLogger("engine.tls")
+
+class TLSUnavailable(Exception):
+    pass
+
+
+# Hands the TLS connection to the job's context before the handshake starts,
+# so it can offer a cached session, and gives the context a chance to keep
+# the session once the connection is done with it
+class _ResumingTLSProtocol(TLSMemoryBIOProtocol):
+    def connectionMade(self):
+        self.factory.tlsContext.prepare(self._tlsConnection, self.factory.target, self.factory.wrappedFactory.value)
+        TLSMemoryBIOProtocol.connectionMade(self)
+
+    def connectionLost(self, reason):
+        TLSMemoryBIOProtocol.connectionLost(self, reason)
+        self.factory.tlsContext.finished(self._tlsConnection, self.factory.target)
+
+
+class _TLSClientFactory(TLSMemoryBIOFactory):
+    protocol = _ResumingTLSProtocol
+
+    def __init__(self, tlsContext, target, wrappedFactory):
+        TLSMemoryBIOFactory.__init__(self, tlsContext, True, wrappedFactory)
+        self.tlsContext = tlsContext
+        self.target = target
+
+
+# One TLS context per job.  The last session negotiated with each target is
+# kept and offered on the next connection to it, so with resume on, only the
+# first connection to a target pays for a full handshake.  Handshake time is
+# recorded as timeToHandshake in each request's value.  Certificates aren't
+# verified: we're here to load the target, not to trust it
+class TLSContext(object):
+    def __init__(self, resume=True):
+        if SSL is None:
+            raise TLSUnavailable("pyOpenSSL is not installed")
+        self.resume = resume
+        self.sessions = {}
+        self.handshakes = 0
+
+        self._context = SSL.Context(SSL.SSLv23_METHOD)
+        self._context.set_options(SSL.OP_NO_SSLv2 | SSL.OP_NO_SSLv3)
+        if not resume:
+            self._context.set_options(SSL.OP_NO_TICKET)
+        self._context.set_info_callback(self._info)
+
+    def getContext(self):
+        return self._context
+
+    def wrap(self, host, port, factory):
+        return _TLSClientFactory(self, (host, port), factory)
+
+    def prepare(self, connection, target, value):
+        connection.set_app_data(value)
+        connection.set_tlsext_host_name(target[0])
+        if self.resume:
+            session = self.sessions.get(target)
+            if session is not None:
+                connection.set_session(session)
+
+    # TLS 1.3 session tickets only show up after the handshake, so sessions
+    # are picked up when the connection closes
+    def finished(self, connection, target):
+        value = connection.get_app_data()
+        if self.resume and value is not None and value["timeToHandshake"]:
+            session = connection.get_session()
+            if session is not None:
+                self.sessions[target] = session
+        connection.set_app_data(None)
+
+    def _info(self, connection, where, ret):
+        if not where & SSL.SSL_CB_HANDSHAKE_DONE:
+            return
+        value = connection.get_app_data()
+        if value is None or value["timeToHandshake"]:
+            return
+        self.handshakes = self.handshakes + 1
+        value["timeToHandshake"] = time.time() - value["startTime"] - value["timeToConnect"]
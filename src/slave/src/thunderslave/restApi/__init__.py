@@ -12,6 +12,7 @@ from nodes import RootNode, LeafNode
 from thundercloud import config
 
 from ..authentication.root import RootDBChecker
+from ..db import dbConnection as db
 from twisted.web import guard
 from twisted.cred.portal import Portal
 from twisted.web.resource import IResource
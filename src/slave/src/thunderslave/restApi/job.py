@@ -1,4 +1,7 @@
 from zope.interface import Interface, implements
+from twisted.internet.interfaces import IPullProducer
+from twisted.web import http
+from twisted.web.server import NOT_DONE_YET
 import jsonpickle
 import simplejson as json
 import logging
@@ -6,12 +9,22 @@ import logging
 from nodes import RootNode
 from nodes import LeafNode
 from nodes import Http400, Http404
+from nodes import JsonBytes
 
 from ..controller import Controller
+from ..controller.controller import NoSampleLog
+from ..engine.tls import TLSUnavailable
+from ..engine.requestmix import InvalidCorpus
+from ..engine.thinktime import InvalidThinkTime
 from thundercloud.spec.job import IJob, JobSpec, JobResults
+from thundercloud.util.rollup import queryArgs
+from thundercloud.util.compression import EncodingWriter, negotiateEncoding
 
 log = logging.getLogger("restApi.job")
 
+# bytes read from a sample log at a time
+CHUNK_SIZE = 64 * 1024
+
 # Handle requests sent to /job
 class Job(RootNode):    
 
@@ -25,16 +38,52 @@ class Job(RootNode):
         if not jobSpecObj.validate():
             raise Http400, "Invalid request"
         
-        jobId = Controller.createJob(jobSpecObj)
+        try:
+            jobId = Controller.createJob(jobSpecObj)
+        except TLSUnavailable:
+            raise Http400, "This slave can't make HTTPS requests"
+        except InvalidCorpus, e:
+            raise Http400, "Can't load the request corpus: %s" % e
+        except InvalidThinkTime, e:
+            raise Http400, "Can't load the think times: %s" % e
+        except IOError, e:
+            raise Http400, "Can't read %s: %s" % (e.filename, e.strerror)
         self.putChild("%d" % jobId, JobNode())
         return jobId
 
 
+# Streams a byte range of a file to a request, a chunk at a time as the
+# client keeps up
+class _RangeSender(object):
+    implements(IPullProducer)
+
+    def __init__(self, path, start, end, writer):
+        self.file = open(path, "rb")
+        self.file.seek(start)
+        self.remaining = end - start
+        self.writer = writer
+
+    def resumeProducing(self):
+        while self.remaining > 0:
+            data = self.file.read(min(CHUNK_SIZE, self.remaining))
+            if not data:
+                break
+            self.remaining = self.remaining - len(data)
+            if self.writer.write(data):
+                return
+        self.file.close()
+        self.writer.request.unregisterProducer()
+        self.writer.finish()
+
+    def stopProducing(self):
+        self.file.close()
+
+
 # Handle requests for /job/n[/operation] URLs
 class JobNode(LeafNode):
     implements(IJob)
     getCommands = ["results", "state"]
-    postCommands = ["start", "pause", "resume", "stop", "modify", "remove"]
+    postCommands = ["start", "pause", "resume", "stop", "modify", "remove", "rate"]
     
     # handle GET /job/n
     def GET(self, request):
@@ -44,6 +93,12 @@ class JobNode(LeafNode):
         else:
             return self.results(jobId, None)
 
+    # GET /job/n/samples streams the raw sample log, which isn't JSON
+    def render_GET(self, request):
+        if request.postpath and request.postpath[0].lower() == "samples":
+            return self.samples(int(request.prepath[-1]), request)
+        return LeafNode.render_GET(self, request)
+
     # handle POST /job/n/operation -- call the appropriate method
     # for the given job ID
     def POST(self, request):
@@ -53,9 +108,16 @@ class JobNode(LeafNode):
         else:
             raise Http400
     
-    # start a new job
+    # start a new job, at "at" (epoch seconds on this slave's clock) if it's
+    # given, so it starts in step with the job's other slaves
     def start(self, jobId, args):
-        Controller.startJob(jobId)
+        startAt = None
+        try:
+            if args.has_key("at"):
+                startAt = float(args["at"][0])
+        except ValueError:
+            raise Http400, "Invalid start time"
+        Controller.startJob(jobId, startAt)
         return True
     
     # pause an existing job
@@ -73,6 +135,18 @@ class JobNode(LeafNode):
         Controller.stopJob(jobId)
         return True
     
+    # set the rate of a SEARCH job, "rps" requests/sec
+    def rate(self, jobId, args):
+        try:
+            rate = float(args["rps"][0])
+        except (KeyError, ValueError):
+            raise Http400, "Invalid rate"
+        try:
+            Controller.setJobRate(jobId, rate)
+        except AttributeError:
+            raise Http400, "Job doesn't take a rate"
+        return True
+    
     # status of a job in the system
     def state(self, jobId, args):
         return Controller.jobState(jobId)
@@ -82,16 +156,44 @@ class JobNode(LeafNode):
         Controller.removeJob(jobId)
         return True
     
-    # get a job's statistics
+    # get a job's statistics.  from, to and resolution (all in seconds)
+    # narrow down results_byTime
     def results(self, jobId, args):
         short = None
+        query = None
         try:
             if args.has_key("short"):
                 short = json.loads(args["short"][0])
+            query = queryArgs(args)
         except AttributeError:
             pass            
+        except ValueError:
+            raise Http400, "Invalid results query"
             
-        return Controller.jobResults(jobId, short).toJson()
+        return JsonBytes(Controller.encodedJobResults(jobId, short, query))
+    
+    # a job's sample log, from the given byte offset to however much has
+    # been written so far.  clients following a running job ask again from
+    # where the last response ended
+    def samples(self, jobId, request):
+        try:
+            offset = int(request.args.get("offset", [0])[0])
+            (path, length) = Controller.sampleLog(jobId)
+        except ValueError:
+            request.setResponseCode(http.BAD_REQUEST)
+            return "Invalid offset"
+        except NoSampleLog, ex:
+            request.setResponseCode(http.NOT_FOUND)
+            return str(ex)
+        
+        offset = max(0, min(offset, length))
+        request.setHeader("Content-Type", "application/octet-stream")
+        request.setHeader("Vary", "Accept-Encoding")
+        coding = negotiateEncoding(request)
+        if coding is None:
+            request.setHeader("Content-Length", str(length - offset))
+        request.registerProducer(_RangeSender(path, offset, length, EncodingWriter(request, coding)), False)
+        return NOT_DONE_YET
 
 
 # Build the API URL hierarchy
@@ -1,8 +1,11 @@
 from twisted.web.resource import Resource
+from twisted.web.server import NOT_DONE_YET
 from zope.interface import Interface, implements
 import simplejson as json
 import logging
 
+from thundercloud.util.compression import writeBody
+
 log = logging.getLogger("restApi.node")
 
 class Http400(Exception):
@@ -11,6 +14,10 @@ class Http400(Exception):
 class Http404(Exception):
     pass
 
+# a response which is already JSON-encoded and should be written as-is
+class JsonBytes(str):
+    pass
+
 class INode(Interface):
     def GET(self, request):
         """GET operation"""
@@ -24,17 +31,23 @@ class Node(Resource):
     # there's a bit of indirection here having child nodes implement
     # POST and GET and not render_{POST,GET} -- but this is so that 
     # derived classes don't have to deal with the content-types, headers,
-    # and details of json output
+    # and details of json output.  large bodies are compressed if the client
+    # asks for it
 
     def render_GET(self, request):
         request.setHeader("Content-Type", "text/plain")
-        response = json.dumps(self.GET(request))
-        return response
+        writeBody(request, self._encode(self.GET(request)))
+        return NOT_DONE_YET
         
     def render_POST(self, request):
         request.setHeader("Content-Type", "text/plain")
-        response = json.dumps(self.POST(request))
-        return response
+        writeBody(request, self._encode(self.POST(request)))
+        return NOT_DONE_YET
+    
+    def _encode(self, response):
+        if isinstance(response, JsonBytes):
+            return str(response)
+        return json.dumps(response)
     
     def render_PUT(self, request):
         pass
@@ -1,19 +1,113 @@
 from nodes import RootNode
 from nodes import LeafNode
+from nodes import Http400
+from ..capacity import SocketBudget, Governor
+from ..controller import Controller
+from ..engine.base import EngineBase
+from thundercloud.spec.dataobject import DataObject
+from thundercloud.util.looplag import LoopLag
+from thundercloud.util.metrics import Metrics
+from thundercloud.util.compression import writeBody
+from thundercloud.util.profiler import Profiler, ProfilerBusy, ProfilerUnavailable, objectCounts, startArgs, resultArgs
+from thundercloud import config
 
 from twisted.web.resource import Resource
+from twisted.internet.protocol import Factory, Protocol
+from twisted.web.server import NOT_DONE_YET
 
+import simplejson as json
+import time
+
+# heartbeats carry the slave's clock, so the master can work out how far
+# off it is from its own
 class HeartBeat(LeafNode):
     def GET(self, request):
-        return True
+        return {"time": time.time()}
     
 class Jobs(LeafNode):
     def GET(self, request):
-        return {"jobs": 0}
+        counts = Controller.jobCounts()
+        return {"jobs": sum(counts.values()), "states": counts}
+    
+class Sockets(LeafNode):
+    def GET(self, request):
+        return SocketBudget.status()
+
+# how the slave's clients are shared out between its jobs
+class Clients(LeafNode):
+    def GET(self, request):
+        return Governor.status()
+
+# every metric in the registry, in the Prometheus text format, for the
+# monitoring scraper
+class MetricsNode(LeafNode):
+    def render_GET(self, request):
+        request.setHeader("Content-Type", "text/plain; version=0.0.4")
+        writeBody(request, Metrics.expose())
+        return NOT_DONE_YET
+
+# event loop lag percentiles over the last ten seconds
+class Lag(LeafNode):
+    def GET(self, request):
+        return LoopLag.status()
+
+# Profiles and object counts give a lot away about the slave.  With HTTP
+# authentication on they're behind it like everything else; with it off
+# they're only served to clients on the slave's own host
+class LocalLeafNode(LeafNode):
+    def render(self, request):
+        if not config.parameter("network", "authentication", type=bool, default=True):
+            address = request.getClientIP() or ""
+            if not (address.startswith("127.") or address == "::1"):
+                request.setResponseCode(403)
+                request.setHeader("Content-Type", "text/plain")
+                return json.dumps("Only served locally while authentication is off")
+        return LeafNode.render(self, request)
+
+# GET /status/profile returns the stats of the running or last profile.
+# POST /status/profile[?duration=30&mode=cprofile|sampling] starts one and
+# POST /status/profile/stop ends it early
+class Profile(LocalLeafNode):
+    def GET(self, request):
+        try:
+            return Profiler.results(**resultArgs(request.args))
+        except ValueError:
+            raise Http400, "Invalid arguments"
+
+    def POST(self, request):
+        try:
+            if request.postpath and request.postpath[0] == "stop":
+                Profiler.stop()
+                return Profiler.results(**resultArgs(request.args))
+            Profiler.start(**startArgs(request.args))
+        except (ValueError, ProfilerBusy, ProfilerUnavailable), ex:
+            raise Http400, str(ex)
+        return Profiler.status()
+
+# counts of live objects, by type
+class Objects(LocalLeafNode):
+    categories = {
+        "engines": EngineBase,
+        "factories": Factory,
+        "protocols": Protocol,
+        "dataObjects": DataObject,
+    }
     
+    def GET(self, request):
+        try:
+            limit = int(request.args.get("limit", [50])[0])
+        except ValueError:
+            raise Http400, "Invalid arguments"
+        return objectCounts(self.categories, limit)
 
 
 StatusApiTree = RootNode()
 StatusApiTree.putChild("", RootNode())
 StatusApiTree.putChild("heartbeat", HeartBeat())
-StatusApiTree.putChild("jobs", Jobs())
\ No newline at end of file
+StatusApiTree.putChild("jobs", Jobs())
+StatusApiTree.putChild("sockets", Sockets())
+StatusApiTree.putChild("clients", Clients())
+StatusApiTree.putChild("lag", Lag())
+StatusApiTree.putChild("metrics", MetricsNode())
+StatusApiTree.putChild("profile", Profile())
+StatusApiTree.putChild("objects", Objects())
\ No newline at end of file
@@ -0,0 +1,109 @@
+from thunderslave.capacity.budget import _SocketBudget, raiseDescriptorLimit, RESERVED_DESCRIPTORS
+from thunderslave.engine.rawhttp import RawHTTPClientFactory, encodeRequest
+
+from twisted.web import server, resource
+from twisted.web.static import Data
+from twisted.internet import reactor, task
+from twisted.internet.defer import gatherResults, inlineCallbacks, CancelledError
+from twisted.trial import unittest
+
+class BudgetTestMixin(object):
+    def setUp(self):
+        root = resource.Resource()
+        root.putChild("", Data("ok", "text/plain"))
+        self.listeningPort = reactor.listenTCP(0, server.Site(root), interface="127.0.0.1")
+        self.port = self.listeningPort.getHost().port
+        self.budget = _SocketBudget(reactor)
+
+    def tearDown(self):
+        return self.listeningPort.stopListening()
+
+    def request(self, owner=None):
+        factory = RawHTTPClientFactory(encodeRequest("GET", "http://127.0.0.1:%d/" % self.port))
+        self.budget.connectTCP("127.0.0.1", self.port, factory, owner)
+        return factory.deferred
+
+    # requests finish before their sockets are closed
+    @inlineCallbacks
+    def waitForSockets(self):
+        for i in range(0, 100):
+            if self.budget.inUse == 0:
+                break
+            yield task.deferLater(reactor, 0.01, lambda: None)
+
+
+class Budget(BudgetTestMixin, unittest.TestCase):
+
+    def test_configure(self):
+        """The budget is capped by the open file limit and sockets.max"""
+        self.budget.configure(maxSockets=10)
+        self.assertEquals(self.budget.budget, 10)
+        self.budget.configure()
+        self.assertEquals(self.budget.budget, max(raiseDescriptorLimit() - RESERVED_DESCRIPTORS, 1))
+
+    @inlineCallbacks
+    def test_backpressure(self):
+        """Connections past the budget wait for a socket instead of failing"""
+        self.budget.budget = 1
+        requests = [self.request() for i in range(0, 3)]
+        self.assertEquals(self.budget.inUse, 1)
+        self.assertEquals(self.budget.waiting(), 2)
+        self.assertTrue(self.budget.saturated())
+
+        results = yield gatherResults(requests)
+        self.assertEquals(len(results), 3)
+        yield self.waitForSockets()
+        self.assertEquals(self.budget.inUse, 0)
+        self.assertEquals(self.budget.waiting(), 0)
+
+    @inlineCallbacks
+    def test_bindAddresses(self):
+        """Connections are spread over the local bind addresses"""
+        self.budget.bindAddresses = [("127.0.0.1", 0), ("127.0.0.1", 0)]
+        yield gatherResults([self.request() for i in range(0, 3)])
+        self.assertEquals(self.budget._nextAddress, 1)
+
+    @inlineCallbacks
+    def test_linger(self):
+        """Sockets closed with SO_LINGER 0 are still handed back"""
+        self.budget.linger = True
+        yield self.request()
+        yield self.waitForSockets()
+        self.assertEquals(self.budget.inUse, 0)
+
+    @inlineCallbacks
+    def test_connectionRefused(self):
+        """Failed connections hand their socket back"""
+        port = self.port
+        yield self.listeningPort.stopListening()
+        factory = RawHTTPClientFactory(encodeRequest("GET", "http://127.0.0.1:%d/" % port))
+        self.budget.connectTCP("127.0.0.1", port, factory)
+        self.listeningPort = reactor.listenTCP(0, server.Site(resource.Resource()), interface="127.0.0.1")
+        yield self.assertFailure(factory.deferred, Exception)
+        self.assertEquals(self.budget.inUse, 0)
+
+    @inlineCallbacks
+    def test_queueTime(self):
+        """Time spent waiting for a socket isn't counted against the target"""
+        self.budget.budget = 1
+        self.request()
+        factory = RawHTTPClientFactory(encodeRequest("GET", "http://127.0.0.1:%d/" % self.port))
+        self.budget.connectTCP("127.0.0.1", self.port, factory)
+        factory.value["startTime"] = factory.value["startTime"] - 60
+        value = yield factory.deferred
+        self.assertTrue(value["elapsedTime"] < 30)
+        yield self.waitForSockets()
+
+    @inlineCallbacks
+    def test_discard(self):
+        """A stopped engine's waiting requests are dropped, not connected"""
+        self.budget.budget = 1
+        owner = object()
+        first = self.request(owner)
+        second = self.request(owner)
+        self.budget.discard(owner)
+        self.assertEquals(self.budget.waiting(), 0)
+        yield self.assertFailure(second, CancelledError)
+        yield first
+        yield self.waitForSockets()
+        self.assertEquals(self.budget.inUse, 0)
@@ -0,0 +1,54 @@
+from thunderslave.capacity.governor import _Governor
+
+from twisted.trial import unittest
+
+class GovernorTestMixin(object):
+    def setUp(self):
+        self.governor = _Governor(100)
+
+
+class Shares(GovernorTestMixin, unittest.TestCase):
+
+    def test_alone(self):
+        """A job on its own gets what it asks for, up to the limit"""
+        self.governor.register(1)
+        self.assertEquals(self.governor.share(1, 60), 60)
+        self.assertEquals(self.governor.share(1, 500), 100)
+        self.assertTrue(self.governor.contended())
+
+    def test_fair(self):
+        """Jobs which all want more than the limit split it evenly"""
+        for jobId in (1, 2, 3):
+            self.governor.register(jobId)
+            self.governor.share(jobId, 100)
+        self.assertEquals([self.governor.share(jobId, 100) for jobId in (1, 2, 3)], [33, 33, 33])
+        self.assertEquals(self.governor.throttled(), {1: 67, 2: 67, 3: 67})
+
+    def test_leftover(self):
+        """What a small job doesn't use goes to the others"""
+        for jobId in (1, 2, 3):
+            self.governor.register(jobId)
+        self.governor.share(1, 10)
+        self.governor.share(2, 100)
+        self.assertEquals(self.governor.share(3, 100), 45)
+        self.assertEquals(self.governor.share(1, 10), 10)
+
+    def test_weights(self):
+        """Contended jobs share in proportion to their weights"""
+        self.governor.register(1, 3)
+        self.governor.register(2, 1)
+        self.governor.share(1, 100)
+        self.assertEquals(self.governor.share(2, 100), 25)
+        self.assertEquals(self.governor.share(1, 100), 75)
+
+    def test_unregister(self):
+        """A job's share goes back to the others when it finishes or pauses"""
+        self.governor.register(1)
+        self.governor.register(2)
+        self.governor.share(1, 100)
+        self.assertEquals(self.governor.share(2, 100), 50)
+        self.governor.share(1, 0)
+        self.assertEquals(self.governor.share(2, 100), 100)
+        self.governor.unregister(1)
+        self.assertEquals(self.governor.status()["jobs"].keys(), ["2"])
+        self.assertFalse(self.governor.contended())
@@ -0,0 +1,79 @@
+from thunderslave.controller.controller import _Controller
+from thunderslave.db import dbConnection as db
+from thunderslave.engine.thinktime import InvalidThinkTime
+from thundercloud.spec.job import JobSpec, JobResults, JobState
+from thundercloud import config
+
+from twisted.trial import unittest
+
+import simplejson as json
+import os
+
+class ControllerTestMixin(object):
+    def setUp(self):
+        self.controller = _Controller()
+
+    def tearDown(self):
+        db.execute("DELETE FROM jobs")
+
+    def createCompletedJob(self, jobId):
+        jobSpec = JobSpec()
+        jobSpec.statsInterval = 1
+        jobResults = JobResults()
+        jobResults.job_id = jobId
+        jobResults.job_state = JobState.COMPLETE
+        jobResults.iterations_total = 42
+        db.execute("INSERT INTO jobs (id, spec, results) VALUES (?, ?, ?)", (jobId, jobSpec, jobResults))
+
+
+class CompletedJobs(ControllerTestMixin, unittest.TestCase):
+
+    def test_encodedResults(self):
+        """Completed job results are served pre-encoded, in short and full variants"""
+        self.createCompletedJob(1)
+        full = json.loads(self.controller.encodedJobResults(1, False))
+        short = json.loads(self.controller.encodedJobResults(1, True))
+        self.assertEquals(full["iterations_total"], 42)
+        self.assertTrue(full.has_key("results_byTime"))
+        self.assertEquals(short["iterations_total"], 42)
+        self.assertFalse(short.has_key("results_byTime"))
+
+    def test_cached(self):
+        """Completed jobs are only read from the DB once"""
+        self.createCompletedJob(2)
+        first = self.controller.encodedJobResults(2, False)
+        db.execute("DELETE FROM jobs WHERE id = 2")
+        self.assertIdentical(self.controller.encodedJobResults(2, False), first)
+        self.assertEquals(self.controller.jobState(2), JobState.COMPLETE)
+
+    def test_bounded(self):
+        """The completed job cache doesn't grow past its size"""
+        self.controller.completedJobs.maxSize = 2
+        for jobId in range(3, 6):
+            self.createCompletedJob(jobId)
+            self.controller.jobState(jobId)
+        self.assertEquals(self.controller.completedJobs.keys(), [4, 5])
+
+
+class CreateJobs(ControllerTestMixin, unittest.TestCase):
+
+    def test_badThinkTimes(self):
+        """A missing or malformed think time file fails the job's creation"""
+        jobSpec = JobSpec()
+        jobSpec.requests = { "http://127.0.0.1:80/foo": { "method": "GET", "postdata": None, "cookies": {}} }
+        jobSpec.measureResolution = True
+        directory = os.path.abspath(self.mktemp())
+        os.makedirs(directory)
+        if not config._config.has_section("files"):
+            config._config.add_section("files")
+        config._config.set("files", "directory", directory)
+        self.addCleanup(config._config.remove_option, "files", "directory")
+
+        jobSpec.thinkTime = {"distribution": "empirical", "file": "thinktimes"}
+        self.failUnlessRaises(IOError, self.controller.createJob, jobSpec)
+
+        f = open(os.path.join(directory, "thinktimes"), "w")
+        f.write("soon\n")
+        f.close()
+        self.failUnlessRaises(InvalidThinkTime, self.controller.createJob, jobSpec)
+        self.assertEquals(self.controller.jobs, {})
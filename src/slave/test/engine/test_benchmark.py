@@ -0,0 +1,96 @@
+from thunderslave.engine.benchmark import BenchmarkEngine
+from thunderslave.db import dbConnection as db
+from thundercloud.spec.job import JobSpec, JobState
+
+from twisted.web import server, resource
+from twisted.web.static import Data
+from twisted.internet import reactor, task
+from twisted.internet.defer import inlineCallbacks
+from twisted.trial import unittest
+
+class ClientPool(unittest.TestCase):
+    def setUp(self):
+        root = resource.Resource()
+        root.putChild("", Data("ok", "text/plain"))
+        self.listeningPort = reactor.listenTCP(0, server.Site(root), interface="127.0.0.1")
+        port = self.listeningPort.getHost().port
+
+        jobSpec = JobSpec()
+        jobSpec.profile = JobSpec.JobProfile.BENCHMARK
+        jobSpec.requests = { "http://127.0.0.1:%d/" % port: { "method": "GET", "postdata": None, "cookies": {}} }
+        jobSpec.duration = 60
+        jobSpec.statsInterval = 1
+        jobSpec.timeout = 10
+        jobSpec.clientFunction = "4"
+        self.engine = BenchmarkEngine(1, jobSpec)
+
+    @inlineCallbacks
+    def tearDown(self):
+        self.engine.stop()
+        while self.engine.clients:
+            yield task.deferLater(reactor, 0.01, lambda: None)
+        db.execute("DELETE FROM jobs")
+        db.execute("DELETE FROM accounting")
+        yield self.listeningPort.stopListening()
+
+    def wait(self, seconds):
+        return task.deferLater(reactor, seconds, lambda: None)
+
+    @inlineCallbacks
+    def test_rampUp(self):
+        """The engine keeps as many clients running as the client function asks for"""
+        self.engine.start()
+        yield self.wait(0.3)
+        self.assertEquals(self.engine.clients, 4)
+        self.assertTrue(self.engine.requestsCompleted > 4)
+
+    @inlineCallbacks
+    def test_rampDown(self):
+        """Surplus clients retire to the pool when the target drops, and come back from it"""
+        self.engine.start()
+        yield self.wait(0.3)
+        self.engine.clientFunction = lambda t: 1
+        yield self.wait(0.3)
+        self.assertEquals(self.engine.clients, 1)
+        self.assertEquals(len(self.engine.idle), 3)
+
+        completed = self.engine.requestsCompleted
+        self.engine.clientFunction = lambda t: 2
+        yield self.wait(0.3)
+        self.assertEquals(self.engine.clients, 2)
+        self.assertEquals(len(self.engine.idle), 2)
+        self.assertTrue(self.engine.requestsCompleted > completed)
+
+    @inlineCallbacks
+    def test_jobTime(self):
+        """The client function is evaluated at seconds into the job"""
+        self.engine.jobSpec.clientFunction = "t < 0.5 and 2 or 5"
+        self.engine = BenchmarkEngine(2, self.engine.jobSpec)
+        self.engine.start()
+        yield self.wait(0.2)
+        self.assertEquals(self.engine.clients, 2)
+        yield self.wait(0.5)
+        self.assertEquals(self.engine.clients, 5)
+
+    @inlineCallbacks
+    def test_paused(self):
+        """Clients go idle while the job's paused"""
+        self.engine.start()
+        yield self.wait(0.2)
+        self.engine.pause()
+        yield self.wait(0.2)
+        self.assertEquals(self.engine.clients, 0)
+        self.assertEquals(len(self.engine.idle), 4)
+        self.engine.resume()
+        self.assertEquals(self.engine.clients, 4)
+
+    @inlineCallbacks
+    def test_thinkTime(self):
+        """Clients think between requests, which holds the request rate down"""
+        self.engine.jobSpec.thinkTime = {"distribution": "constant", "seconds": 0.1}
+        self.engine = BenchmarkEngine(2, self.engine.jobSpec)
+        self.engine.start()
+        yield self.wait(0.35)
+        self.assertEquals(self.engine.clients, 4)
+        self.assertTrue(8 <= self.engine.requestsIssued <= 16)
+        self.assertEquals(self.engine.thinkTimer.count + self.engine.requestsIssued - self.engine.requestsCompleted - self.engine.requestsFailed, 4)
@@ -1,12 +1,18 @@
 from thunderslave.engine.base import EngineBase
 from thunderslave.engine.hammer import HammerEngine
+from thunderslave.capacity import Governor
+from thunderslave.db import dbConnection as db
+from thundercloud.spec.job import JobSpec, JobState
 
+from twisted.internet import reactor, task
 from twisted.internet.defer import Deferred, inlineCallbacks, returnValue
 
+import time
+
 from twisted.trial import unittest
 
 class TestEngine(HammerEngine):
-    def _request(self, host, port, method, url, postdata, cookies):
+    def _request(self, host, port, method, url, postdata, cookies, data=None):
         d = Deferred()
         d.addCallback(self._callback)
         d.addErrback(self._callback)
@@ -20,10 +26,132 @@ class TestEngine(HammerEngine):
         #    "bytesTransferred": 0,
         #}
 
+# a HammerEngine for a one-URL job; test cases change the spec it's created
+# with in createJobSpec
 class EngineTestMixin(object):
     def setUp(self):
-        pass
+        self.engine = HammerEngine(1, self.createJobSpec())
     
     def tearDown(self):
-        pass
+        self.engine.stop()
+        db.execute("DELETE FROM jobs")
+        db.execute("DELETE FROM accounting")
+
+    def createJobSpec(self):
+        jobSpec = JobSpec()
+        jobSpec.requests = { "http://127.0.0.1:80/foo": { "method": "GET", "postdata": None, "cookies": {}} }
+        jobSpec.duration = 60
+        jobSpec.statsInterval = 1
+        return jobSpec
+
+
+class ScheduledStart(EngineTestMixin, unittest.TestCase):
+    def setUp(self):
+        EngineTestMixin.setUp(self)
+        self.started = []
+        self.engine.iterator = lambda: self.started.append(time.time())
+
+    def createJobSpec(self):
+        jobSpec = EngineTestMixin.createJobSpec(self)
+        jobSpec.measureResolution = True
+        return jobSpec
+
+    @inlineCallbacks
+    def test_later(self):
+        """A job waits for its start time, and counts its time from it"""
+        startAt = time.time() + 0.1
+        self.engine.start(startAt)
+        self.assertEquals(self.engine.state(), JobState.NEW)
+        self.assertEquals(self.started, [])
+
+        yield task.deferLater(reactor, 0.2, lambda: None)
+        self.assertEquals(self.engine.state(), JobState.RUNNING)
+        self.assertEquals(self.engine.startTime, startAt)
+        self.assertTrue(self.started[0] >= startAt)
+
+    def test_late(self):
+        """A start request which arrives late starts the job with its clock set back"""
+        startAt = time.time() - 5
+        self.engine.start(startAt)
+        self.assertEquals(self.engine.state(), JobState.RUNNING)
+        self.assertEquals(self.engine.startTime, startAt)
+        self.assertEquals(len(self.started), 1)
+
+    def test_stopped(self):
+        """Stopping a job before its start time means it never starts"""
+        self.engine.start(time.time() + 60)
+        self.engine.stop()
+        self.assertEquals(self.engine.state(), JobState.COMPLETE)
+        self.assertEquals(self.engine._startCall, None)
+
+
+class StatsBuckets(EngineTestMixin, unittest.TestCase):
+    def setUp(self):
+        EngineTestMixin.setUp(self)
+        self.engine.iterator = lambda: None
+
+    def createJobSpec(self):
+        jobSpec = EngineTestMixin.createJobSpec(self)
+        jobSpec.statsInterval = 0.1
+        return jobSpec
+
+    @inlineCallbacks
+    def test_timer(self):
+        """Stats are taken on a timer, keyed by the end of each bucket"""
+        self.engine.start()
+        yield task.deferLater(reactor, 0.35, lambda: None)
+        self.assertEquals(sorted(self.engine.statisticsByTime.keys()), [0, 0.1, 0.2, 0.3])
+        for t in [0.1, 0.2, 0.3]:
+            self.assertEquals(self.engine.statisticsByTime[t]["interval"], 0.1)
+
+    @inlineCallbacks
+    def test_lastBucket(self):
+        """Stopping a job takes stats for the part of a bucket it got through"""
+        self.engine.start()
+        yield task.deferLater(reactor, 0.15, lambda: None)
+        self.engine.stop()
+        self.assertEquals(sorted(self.engine.statisticsByTime.keys()), [0, 0.1, 0.2])
+        self.assertTrue(0 < self.engine.statisticsByTime[0.2]["interval"] < 0.1)
+        self.assertEquals(self.engine._bucketCall, None)
+
+
+class Hammer(EngineTestMixin, unittest.TestCase):
+    def setUp(self):
+        EngineTestMixin.setUp(self)
+        self.loops = []
+        def loop():
+            self.loops.append(time.time())
+            HammerEngine._loop(self.engine)
+        self.engine.iterator = loop
+        self.limit = Governor.limit
+        Governor.configure(0)
+
+    def tearDown(self):
+        EngineTestMixin.tearDown(self)
+        Governor.configure(self.limit)
+
+    def createJobSpec(self):
+        jobSpec = EngineTestMixin.createJobSpec(self)
+        jobSpec.clientFunction = "10"
+        return jobSpec
+
+    @inlineCallbacks
+    def test_noClients(self):
+        """A job the governor gives no clients looks again a second later"""
+        self.engine.start()
+        yield task.deferLater(reactor, 0.1, lambda: None)
+        self.assertEquals(len(self.loops), 1)
+        self.assertTrue(self.engine._loopCall.getTime() - self.loops[0] >= 0.99)
+
+    def test_requested(self):
+        """What the client function asks for is counted once a second"""
+        self.engine.start()
+        self.engine.iterator()
+        self.engine.iterator()
+        self.assertEquals(self.engine.requestsRequested, 10)
 
+    def test_jobTime(self):
+        """The client function is evaluated at seconds into the job"""
+        self.engine.clientFunction = lambda t: t < 5 and 3 or 100
+        self.engine.start()
+        self.assertEquals(self.engine.requestsRequested, 3)
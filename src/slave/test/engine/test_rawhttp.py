@@ -0,0 +1,88 @@
+from thunderslave.engine.rawhttp import encodeRequest, RawHTTPClientFactory
+
+from twisted.test.proto_helpers import StringTransport
+from twisted.web import error
+from twisted.trial import unittest
+
+class RawHTTPTestMixin(object):
+    def connect(self, method="GET"):
+        factory = RawHTTPClientFactory(encodeRequest(method, "http://localhost:8080/foo"), method)
+        protocol = factory.buildProtocol(None)
+        transport = StringTransport()
+        protocol.makeConnection(transport)
+        return factory, protocol, transport
+
+
+class Encoding(unittest.TestCase):
+
+    def test_get(self):
+        """GET requests are encoded with the host, agent and cookies"""
+        data = encodeRequest("GET", "http://localhost:8080/foo?bar=1", cookies={"a": "b"}, agent="agent/1.0")
+        self.assertEquals(data, "GET /foo?bar=1 HTTP/1.0\r\n"
+                                "Host: localhost:8080\r\n"
+                                "User-Agent: agent/1.0\r\n"
+                                "Cookie: a=b\r\n"
+                                "Connection: close\r\n"
+                                "\r\n")
+
+    def test_post(self):
+        """Postdata follows the headers, with its length"""
+        data = encodeRequest("POST", "http://localhost/", postdata="x=1")
+        self.assertTrue(data.startswith("POST / HTTP/1.0\r\nHost: localhost\r\n"))
+        self.assertTrue(data.endswith("Content-Length: 3\r\nConnection: close\r\n\r\nx=1"))
+
+
+class Parsing(RawHTTPTestMixin, unittest.TestCase):
+
+    def test_contentLength(self):
+        """Responses finish as soon as Content-Length bytes of body are in"""
+        factory, protocol, transport = self.connect()
+        self.assertEquals(transport.value(), factory.data)
+
+        results = []
+        factory.deferred.addCallback(results.append)
+        protocol.dataReceived("HTTP/1.1 200 OK\r\nContent-")
+        protocol.dataReceived("Length: 10\r\n\r\n01234")
+        self.assertEquals(results, [])
+        protocol.dataReceived("56789")
+        self.assertEquals(results[0]["bytesTransferred"], 10)
+        self.assertTrue(transport.disconnecting)
+
+    def test_untilClose(self):
+        """Without a Content-Length the body runs until the connection closes"""
+        factory, protocol, transport = self.connect()
+        results = []
+        factory.deferred.addCallback(results.append)
+        protocol.dataReceived("HTTP/1.0 200 OK\r\n\r\nabc")
+        protocol.dataReceived("def")
+        self.assertEquals(results, [])
+        protocol.connectionLost(None)
+        self.assertEquals(results[0]["bytesTransferred"], 6)
+
+    def test_errorStatus(self):
+        """Error statuses fail the request"""
+        factory, protocol, transport = self.connect()
+        protocol.dataReceived("HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\n\r\n")
+        return self.assertFailure(factory.deferred, error.Error)
+
+    def test_head(self):
+        """HEAD responses don't wait for a body"""
+        factory, protocol, transport = self.connect("HEAD")
+        results = []
+        factory.deferred.addCallback(results.append)
+        protocol.dataReceived("HTTP/1.1 200 OK\r\nContent-Length: 100\r\n\r\n")
+        self.assertEquals(results[0]["bytesTransferred"], 0)
+
+    def test_reset(self):
+        """A factory can be reset and used for another request"""
+        factory, protocol, transport = self.connect()
+        protocol.dataReceived("HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok")
+        first = factory.deferred
+
+        factory.reset(encodeRequest("HEAD", "http://localhost:8080/bar"), "HEAD")
+        self.assertNotIdentical(factory.deferred, first)
+        self.assertEquals(factory.value["bytesTransferred"], 0)
+        protocol = factory.buildProtocol(None)
+        transport = StringTransport()
+        protocol.makeConnection(transport)
+        self.assertTrue(transport.value().startswith("HEAD /bar"))
@@ -0,0 +1,125 @@
+from thunderslave.engine.requestmix import RequestMix, EmptyRequestMix, InvalidCorpus, loadCorpus, _aliasTables
+from thundercloud.spec.job import JobSpec
+from thundercloud import config
+
+from twisted.trial import unittest
+
+import random
+import os
+
+class RequestMixTestMixin(object):
+    def createRequests(self, weights):
+        requests = {}
+        for i in range(0, len(weights)):
+            requests["http://localhost:80/%d" % i] = { "method": "GET", "postdata": None, "cookies": {}, "weight": weights[i] }
+        return requests
+
+    def count(self, mix, n):
+        counts = {}
+        for i in range(0, n):
+            url = mix.next()[3]
+            counts[url] = counts.get(url, 0) + 1
+        return counts
+
+
+class Selection(RequestMixTestMixin, unittest.TestCase):
+
+    def test_roundRobin(self):
+        """Unweighted round-robin visits every URL once per cycle"""
+        mix = RequestMix(self.createRequests([1, 1, 1]))
+        urls = [mix.next()[3] for i in range(0, 6)]
+        self.assertEquals(urls[:3], urls[3:])
+        self.assertEquals(len(set(urls)), 3)
+
+    def test_weightedRoundRobin(self):
+        """Weighted round-robin picks URLs exactly in proportion to their weights"""
+        mix = RequestMix(self.createRequests([1, 2, 5]))
+        counts = self.count(mix, 80)
+        self.assertEquals(counts["http://localhost:80/0"], 10)
+        self.assertEquals(counts["http://localhost:80/1"], 20)
+        self.assertEquals(counts["http://localhost:80/2"], 50)
+
+    def test_weightedRandom(self):
+        """Alias sampling picks URLs roughly in proportion to their weights"""
+        random.seed(0)
+        mix = RequestMix(self.createRequests([1, 3]), JobSpec.RequestSelection.WEIGHTED)
+        counts = self.count(mix, 40000)
+        self.assertApproximates(counts["http://localhost:80/1"] / 40000.0, 0.75, 0.02)
+
+    def test_aliasTables(self):
+        """Alias tables preserve the weight distribution"""
+        weights = [1, 2, 3, 4]
+        (prob, alias) = _aliasTables(weights)
+        mass = [0.0] * len(weights)
+        for i in range(0, len(weights)):
+            mass[i] += prob[i]
+            mass[alias[i]] += 1.0 - prob[i]
+        for i in range(0, len(weights)):
+            self.assertApproximates(mass[i] / len(weights), weights[i] / 10.0, 1e-9)
+
+    def test_empty(self):
+        """An empty request mix can't hand out requests"""
+        mix = RequestMix({"": {}})
+        self.assertEquals(len(mix), 0)
+        self.failUnlessRaises(EmptyRequestMix, mix.next)
+
+
+class Corpus(RequestMixTestMixin, unittest.TestCase):
+    def setUp(self):
+        self.directory = os.path.abspath(self.mktemp())
+        os.makedirs(self.directory)
+        if not config._config.has_section("files"):
+            config._config.add_section("files")
+        config._config.set("files", "directory", self.directory)
+
+    def tearDown(self):
+        config._config.remove_option("files", "directory")
+
+    # corpora are named relative to the job file directory, as job specs do
+    def writeCorpus(self, lines, name="corpus"):
+        f = open(os.path.join(self.directory, name), "w")
+        f.write("\n".join(lines) + "\n")
+        f.close()
+        return name
+
+    def test_corpus(self):
+        """Requests are read from a corpus file"""
+        path = self.writeCorpus([
+            "# comment",
+            "http://localhost:80/a",
+            "",
+            "http://localhost:80/b 3 post foo=bar",
+        ])
+        self.assertEquals(loadCorpus(path), [
+            ("http://localhost:80/a", 1.0, "GET", None),
+            ("http://localhost:80/b", 3.0, "POST", "foo=bar"),
+        ])
+        
+        mix = RequestMix({"": {}}, corpus=path)
+        counts = self.count(mix, 8)
+        self.assertEquals(counts["http://localhost:80/b"], 6)
+
+    def test_badWeight(self):
+        """Corpus weights have to be positive and finite"""
+        for weight in ("0", "-1", "x", "nan", "inf"):
+            path = self.writeCorpus(["http://localhost:80/a %s" % weight, "http://localhost:80/b 2"])
+            self.failUnlessRaises(InvalidCorpus, loadCorpus, path)
+
+    def test_parsedOnce(self):
+        """A corpus file is only parsed once"""
+        path = self.writeCorpus(["http://localhost:80/a"])
+        self.assertIdentical(loadCorpus(path), loadCorpus(path))
+
+    def test_outside(self):
+        """Only corpora in the job file directory are read"""
+        path = self.writeCorpus(["http://localhost:80/a"])
+        outside = os.path.join(os.path.dirname(self.directory), "outside")
+        f = open(outside, "w")
+        f.write("http://localhost:80/a\n")
+        f.close()
+        for name in (outside, "../outside", "/etc/passwd"):
+            self.failUnlessRaises(InvalidCorpus, loadCorpus, name)
+        self.assertEquals(len(loadCorpus(os.path.join(self.directory, path))), 1)
+
+        config._config.remove_option("files", "directory")
+        self.failUnlessRaises(InvalidCorpus, loadCorpus, path)
@@ -0,0 +1,112 @@
+from thunderslave.engine.resolver import HostCache, MIN_TTL
+
+from twisted.names import dns
+from twisted.names.error import DNSNameError
+from twisted.internet import task
+from twisted.internet.defer import succeed, fail
+from twisted.trial import unittest
+
+class FakeResolver(object):
+    def __init__(self, records):
+        self.records = records
+        self.lookups = 0
+
+    def _answer(self, name, type):
+        self.lookups = self.lookups + 1
+        answers = []
+        for (recordType, address, ttl) in self.records.get(name, []):
+            if recordType != type:
+                continue
+            if type == dns.A:
+                payload = dns.Record_A(address, ttl)
+            else:
+                payload = dns.Record_AAAA(address, ttl)
+            answers.append(dns.RRHeader(name, type, dns.IN, ttl, payload))
+        if not answers:
+            return fail(DNSNameError(name))
+        return succeed((answers, [], []))
+
+    def lookupAddress(self, name, timeout=None):
+        return self._answer(name, dns.A)
+
+    def lookupIPV6Address(self, name, timeout=None):
+        return self._answer(name, dns.AAAA)
+
+
+class HostCacheTestMixin(object):
+    def setUp(self):
+        self.clock = task.Clock()
+        self.resolver = FakeResolver({
+            "www.example.com": [(dns.A, "10.0.0.1", 30), (dns.A, "10.0.0.2", 60), (dns.AAAA, "::1", 60)],
+        })
+
+    def createCache(self, hosts, roundRobin=False):
+        cache = HostCache(hosts, roundRobin, resolver=self.resolver, clock=self.clock)
+        cache.start()
+        return cache
+
+
+class Lookups(HostCacheTestMixin, unittest.TestCase):
+
+    def test_preresolved(self):
+        """Hosts are resolved up front and lookups are served from the cache"""
+        cache = self.createCache(["www.example.com", "www.example.com"])
+        self.assertEquals(self.resolver.lookups, 1)
+        self.assertEquals(cache.lookup("www.example.com"), "10.0.0.1")
+        self.assertEquals(cache.lookup("www.example.com"), "10.0.0.1")
+        self.assertEquals(self.resolver.lookups, 1)
+
+    def test_addresses(self):
+        """IP addresses and unknown hosts are handed back as they are"""
+        cache = self.createCache(["127.0.0.1", "::1"])
+        self.assertEquals(cache.hosts, [])
+        self.assertEquals(cache.lookup("127.0.0.1"), "127.0.0.1")
+        self.assertEquals(cache.lookup("www.example.org"), "www.example.org")
+
+    def test_roundRobin(self):
+        """Round-robin cycles through every A and AAAA record"""
+        cache = self.createCache(["www.example.com"], roundRobin=True)
+        addresses = [cache.lookup("www.example.com") for i in range(0, 6)]
+        self.assertEquals(addresses, ["10.0.0.1", "10.0.0.2", "::1"] * 2)
+
+
+class Refresh(HostCacheTestMixin, unittest.TestCase):
+
+    def test_ttl(self):
+        """Hosts are looked up again when their shortest TTL runs out"""
+        cache = self.createCache(["www.example.com"])
+        self.clock.advance(29)
+        self.assertEquals(self.resolver.lookups, 1)
+        self.resolver.records["www.example.com"] = [(dns.A, "10.0.0.3", 30)]
+        self.clock.advance(1)
+        self.assertEquals(self.resolver.lookups, 2)
+        self.assertEquals(cache.lookup("www.example.com"), "10.0.0.3")
+
+    def test_failure(self):
+        """Addresses are kept when a refresh fails, and it's retried"""
+        cache = self.createCache(["www.example.com"])
+        self.resolver.records = {}
+        self.clock.advance(30)
+        self.assertEquals(cache.lookup("www.example.com"), "10.0.0.1")
+        self.clock.advance(MIN_TTL)
+        self.assertEquals(self.resolver.lookups, 3)
+
+    def test_stop(self):
+        """Stopped caches don't refresh"""
+        cache = self.createCache(["www.example.com"])
+        cache.stop()
+        self.assertEquals(self.clock.getDelayedCalls(), [])
+
+    def test_primed(self):
+        """Primed caches resolve up front, and only refresh once started"""
+        cache = HostCache(["www.example.com"], resolver=self.resolver, clock=self.clock)
+        cache.prime()
+        self.assertEquals(self.clock.getDelayedCalls(), [])
+        self.clock.advance(20)
+        cache.start()
+        self.assertEquals(self.resolver.lookups, 1)
+        self.clock.advance(9)
+        self.assertEquals(self.resolver.lookups, 1)
+        self.clock.advance(1)
+        self.assertEquals(self.resolver.lookups, 2)
+        cache.stop()
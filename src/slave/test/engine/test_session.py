@@ -0,0 +1,134 @@
+from thunderslave.engine.session import SessionEngine, SessionFlow, VirtualUser
+from thunderslave.db import dbConnection as db
+from thundercloud.spec.job import JobSpec, JobState, InvalidJobSpec
+
+from twisted.web import server, resource
+from twisted.internet import reactor
+from twisted.internet.defer import inlineCallbacks
+from twisted.trial import unittest
+
+import time
+
+class Login(resource.Resource):
+    isLeaf = True
+
+    def render(self, request):
+        request.addCookie("session", "s%s" % request.args.get("user", [""])[0])
+        return '<input name="csrf" value="abc123">'
+
+class Checkout(resource.Resource):
+    isLeaf = True
+
+    def __init__(self):
+        resource.Resource.__init__(self)
+        self.seen = []
+
+    def render(self, request):
+        self.seen.append((request.getCookie("session"), request.args.get("csrf", [""])[0]))
+        return "ok"
+
+
+class SessionTestMixin(object):
+    def createSession(self):
+        return {
+            "steps": [
+                {"url": "http://%s:%d/login?user=${vu}" % (self.host, self.port),
+                 "extract": {"token": 'name="csrf" value="([^"]+)"'}},
+                {"url": "http://%s:%d/checkout" % (self.host, self.port),
+                 "method": "POST",
+                 "postdata": "csrf=${token}",
+                 "headers": {"Content-Type": "application/x-www-form-urlencoded"}},
+            ],
+        }
+
+
+class Flow(SessionTestMixin, unittest.TestCase):
+    host = "localhost"
+    port = 80
+
+    def test_compile(self):
+        """Variables get a slot each and constant URLs are parsed up front"""
+        flow = SessionFlow(self.createSession())
+        self.assertEquals(sorted(flow.variables.keys()), ["token", "vu"])
+        self.assertEquals(flow.steps[1].host, "localhost")
+        self.assertEquals(flow.steps[0].host, None)
+
+    def test_advance(self):
+        """Extracted values and cookies are carried to the next step"""
+        flow = SessionFlow(self.createSession())
+        user = VirtualUser(7)
+        flow.reset(user)
+        self.assertEquals(flow.steps[0].render(user)[2], "http://localhost:80/login?user=7")
+
+        flow.advance(user, '<input name="csrf" value="xyz">', {"session": "s7"})
+        self.assertEquals(user.step, 1)
+        self.assertEquals(user.cookies, (("session", "s7"),))
+        self.assertEquals(flow.steps[1].render(user)[3], "csrf=xyz")
+
+        # the flow starts over with a clean slate once it's done
+        flow.advance(user, "", {"session": "s7"})
+        self.assertEquals(user.step, 0)
+        self.assertEquals(user.cookies, ())
+        self.assertEquals(flow.steps[1].render(user)[3], "csrf=")
+
+    def test_compact(self):
+        """Virtual users don't carry an instance dict"""
+        self.failIf(hasattr(VirtualUser(0), "__dict__"))
+
+    def test_validate(self):
+        """Session jobs need a well-formed list of steps"""
+        jobSpec = JobSpec()
+        jobSpec.profile = JobSpec.JobProfile.SESSION
+        jobSpec.duration = 60
+        jobSpec.statsInterval = 1
+        self.failUnlessRaises(InvalidJobSpec, jobSpec.validate)
+        jobSpec.session = {"steps": [{"url": "http://localhost/", "extract": {"bad": "("}}]}
+        self.failUnlessRaises(InvalidJobSpec, jobSpec.validate)
+        jobSpec.session = self.createSession()
+        self.assertTrue(jobSpec.validate())
+
+
+class Engine(SessionTestMixin, unittest.TestCase):
+    host = "127.0.0.1"
+
+    def setUp(self):
+        root = resource.Resource()
+        root.putChild("login", Login())
+        self.checkout = Checkout()
+        root.putChild("checkout", self.checkout)
+        self.listeningPort = reactor.listenTCP(0, server.Site(root), interface="127.0.0.1")
+        self.port = self.listeningPort.getHost().port
+
+    def tearDown(self):
+        db.execute("DELETE FROM jobs")
+        db.execute("DELETE FROM accounting")
+        return self.listeningPort.stopListening()
+
+    @inlineCallbacks
+    def test_session(self):
+        """A virtual user logs in and checks out with its cookie and token"""
+        jobSpec = JobSpec()
+        jobSpec.profile = JobSpec.JobProfile.SESSION
+        jobSpec.duration = 60
+        jobSpec.statsInterval = 1
+        jobSpec.session = self.createSession()
+        engine = SessionEngine(1, jobSpec)
+        engine.startTime = time.time()
+        engine.jobState = JobState.RUNNING
+
+        # no target users, so the user leaves after each step
+        user = VirtualUser(3)
+        engine.flow.reset(user)
+        engine.clients = 1
+        yield engine._step(user)
+        self.assertEquals(user.cookies, (("session", "s3"),))
+
+        engine.clients = 1
+        yield engine._step(user)
+        self.assertEquals(engine.requestsCompleted, 2)
+        self.assertEquals(engine.clients, 0)
+        self.assertEquals(self.checkout.seen, [("s3", "abc123")])
+
+        # and starts a new session afterwards
+        self.assertEquals(user.step, 0)
+        self.assertEquals(user.cookies, ())
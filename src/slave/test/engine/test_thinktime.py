@@ -0,0 +1,79 @@
+from thunderslave.engine.thinktime import ThinkTime, InvalidThinkTime
+from thundercloud.spec.job import JobSpec, InvalidJobSpec
+
+from thundercloud import config
+
+from twisted.trial import unittest
+
+import random
+import os
+
+class Distributions(unittest.TestCase):
+
+    def sample(self, thinkTime, n=2000):
+        thinkTime = ThinkTime(thinkTime, rng=random.Random(1))
+        return [thinkTime.delay(None, 0) for i in range(0, n)]
+
+    def test_constant(self):
+        """Constant think times are always the same"""
+        self.assertEquals(set(self.sample({"distribution": "constant", "seconds": 2}, 10)), set([2.0]))
+
+    def test_uniform(self):
+        """Uniform think times stay between min and max"""
+        samples = self.sample({"distribution": "uniform", "min": 1, "max": 3})
+        self.assertTrue(min(samples) >= 1 and max(samples) <= 3)
+        self.assertAlmostEquals(sum(samples) / len(samples), 2, 1)
+
+    def test_exponential(self):
+        """Exponential think times average out at the mean, and can be capped"""
+        samples = self.sample({"distribution": "exponential", "mean": 0.5})
+        self.assertAlmostEquals(sum(samples) / len(samples), 0.5, 1)
+        samples = self.sample({"distribution": "exponential", "mean": 0.5, "max": 1})
+        self.assertEquals(max(samples), 1)
+
+    def test_empirical(self):
+        """Empirical think times are drawn from the file, in the job file directory"""
+        directory = os.path.abspath(self.mktemp())
+        os.makedirs(directory)
+        if not config._config.has_section("files"):
+            config._config.add_section("files")
+        config._config.set("files", "directory", directory)
+        self.addCleanup(config._config.remove_option, "files", "directory")
+
+        path = "thinktimes"
+        f = open(os.path.join(directory, path), "w")
+        f.write("# seconds\n0.5\n\n1.5\n")
+        f.close()
+        self.assertEquals(set(self.sample({"distribution": "empirical", "file": path}, 100)), set([0.5, 1.5]))
+
+        self.failUnlessRaises(InvalidThinkTime, ThinkTime, {"distribution": "empirical", "file": "../thinktimes"})
+
+        f = open(os.path.join(directory, path), "w")
+        f.write("0.5\nsoon\n")
+        f.close()
+        self.failUnlessRaises(InvalidThinkTime, ThinkTime, {"distribution": "empirical", "file": path})
+
+    def test_pacing(self):
+        """Pacing holds a client back until its interval is up"""
+        thinkTime = ThinkTime({"distribution": "constant", "seconds": 0.25}, pacing=2)
+        self.assertEquals(thinkTime.delay(10, 10.5), 1.5)
+        self.assertEquals(thinkTime.delay(10, 11.9), 0.25)
+        self.assertEquals(ThinkTime(pacing=2).delay(10, 13), 0)
+
+    def test_validate(self):
+        """Think times need a known distribution and its parameters"""
+        jobSpec = JobSpec()
+        jobSpec.requests = { "http://localhost:80/": { "method": "GET", "postdata": None, "cookies": {}} }
+        jobSpec.duration = 60
+        jobSpec.statsInterval = 1
+        for (thinkTime, pacing) in [({"distribution": "normal"}, None),
+                                    ({"distribution": "uniform", "min": 3, "max": 1}, None),
+                                    ({"distribution": "exponential", "mean": 0}, None),
+                                    ({"distribution": "empirical"}, None),
+                                    (None, -1)]:
+            jobSpec.thinkTime = thinkTime
+            jobSpec.pacing = pacing
+            self.failUnlessRaises(InvalidJobSpec, jobSpec.validate)
+        jobSpec.thinkTime = {"distribution": "exponential", "mean": 1, "max": 5}
+        jobSpec.pacing = 2
+        self.assertTrue(jobSpec.validate())
@@ -0,0 +1,100 @@
+from thunderslave.engine.timerwheel import TimerWheel
+from thunderslave.engine.rawhttp import encodeRequest, RawHTTPClientFactory
+
+from twisted.internet import task
+from twisted.internet.error import TimeoutError
+from twisted.test.proto_helpers import StringTransport
+from twisted.trial import unittest
+
+class TimerWheelTestMixin(object):
+    def setUp(self):
+        self.clock = task.Clock()
+        self.wheel = TimerWheel(resolution=0.1, size=8, clock=self.clock)
+        self.fired = []
+
+    def tearDown(self):
+        self.wheel.stop()
+
+
+class Timers(TimerWheelTestMixin, unittest.TestCase):
+
+    def test_fire(self):
+        """Timers fire on the first tick at or after their deadline"""
+        self.wheel.arm(0.25, self.fired.append, "a")
+        self.clock.advance(0.2)
+        self.assertEquals(self.fired, [])
+        self.clock.advance(0.1)
+        self.assertEquals(self.fired, ["a"])
+        self.assertEquals(self.wheel.count, 0)
+
+    def test_cancel(self):
+        """Cancelled timers never fire"""
+        timer = self.wheel.arm(0.1, self.fired.append, "a")
+        self.wheel.arm(0.1, self.fired.append, "b")
+        timer.cancel()
+        timer.cancel()
+        self.assertEquals(self.wheel.count, 1)
+        self.clock.advance(0.1)
+        self.assertEquals(self.fired, ["b"])
+
+    def test_wrap(self):
+        """Timers further out than the wheel wait for their own lap"""
+        self.wheel.arm(0.1, self.fired.append, "near")
+        self.wheel.arm(0.9, self.fired.append, "far")
+        self.clock.pump([0.1] * 8)
+        self.assertEquals(self.fired, ["near"])
+        self.clock.advance(0.1)
+        self.assertEquals(self.fired, ["near", "far"])
+
+    def test_catchUp(self):
+        """Ticks missed while the reactor was busy are all walked"""
+        self.wheel.arm(0.1, self.fired.append, "a")
+        self.wheel.arm(0.3, self.fired.append, "b")
+        self.clock.advance(0.5)
+        self.assertEquals(self.fired, ["a", "b"])
+
+    def test_idle(self):
+        """The wheel stops ticking when nothing is armed, and starts again"""
+        self.wheel.arm(0.1, self.fired.append, "a")
+        self.clock.advance(0.1)
+        self.assertEquals(self.clock.getDelayedCalls(), [])
+        self.clock.advance(5)
+        self.wheel.arm(0.1, self.fired.append, "b")
+        self.clock.advance(0.1)
+        self.assertEquals(self.fired, ["a", "b"])
+
+
+class Expiry(TimerWheelTestMixin, unittest.TestCase):
+
+    def test_expire(self):
+        """Requests still running at their deadline fail with a timeout"""
+        factory = RawHTTPClientFactory(encodeRequest("GET", "http://localhost/"))
+        factory.timer = self.wheel.arm(1, factory.expire)
+        transport = StringTransport()
+        factory.buildProtocol(None).makeConnection(transport)
+
+        failures = []
+        factory.deferred.addErrback(failures.append)
+        self.clock.advance(1)
+        self.assertTrue(failures[0].check(TimeoutError))
+        self.assertTrue(transport.disconnecting)
+
+    def test_response(self):
+        """Answered requests cancel their timer"""
+        factory = RawHTTPClientFactory(encodeRequest("GET", "http://localhost/"))
+        factory.timer = self.wheel.arm(1, factory.expire)
+        protocol = factory.buildProtocol(None)
+        protocol.makeConnection(StringTransport())
+        protocol.dataReceived("HTTP/1.0 200 OK\r\nContent-Length: 0\r\n\r\n")
+        self.assertEquals(self.wheel.count, 0)
+        self.assertTrue(factory.deferred.called)
+
+    def test_queued(self):
+        """Requests which expire before they connect hang up straight away"""
+        factory = RawHTTPClientFactory(encodeRequest("GET", "http://localhost/"))
+        factory.deferred.addErrback(lambda failure: None)
+        factory.expire()
+        transport = StringTransport()
+        factory.buildProtocol(None).makeConnection(transport)
+        self.assertEquals(transport.value(), "")
+        self.assertTrue(transport.disconnecting)
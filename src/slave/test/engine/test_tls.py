@@ -0,0 +1,168 @@
+from thunderslave.engine.rawhttp import RawHTTPClientFactory, encodeRequest
+from thunderslave.engine.tls import TLSContext
+from thunderslave.engine.benchmark import BenchmarkEngine
+from thunderslave.engine.session import SessionEngine, VirtualUser
+from thunderslave.db import dbConnection as db
+from thundercloud.spec.job import JobSpec
+
+from twisted.web import server, resource
+from twisted.web.static import Data
+from twisted.internet import reactor, task
+from twisted.internet.defer import inlineCallbacks
+from twisted.trial import unittest
+
+import time
+
+try:
+    from OpenSSL import SSL, crypto
+except ImportError:
+    SSL = None
+
+class ServerContextFactory(object):
+    def __init__(self):
+        key = crypto.PKey()
+        key.generate_key(crypto.TYPE_RSA, 2048)
+        cert = crypto.X509()
+        cert.get_subject().CN = "localhost"
+        cert.set_serial_number(1)
+        cert.gmtime_adj_notBefore(0)
+        cert.gmtime_adj_notAfter(3600)
+        cert.set_issuer(cert.get_subject())
+        cert.set_pubkey(key)
+        cert.sign(key, "sha256")
+
+        self.resumed = []
+        self.context = SSL.Context(SSL.SSLv23_METHOD)
+        self.context.use_privatekey(key)
+        self.context.use_certificate(cert)
+        self.context.set_session_id("thundercloud")
+        self.context.set_info_callback(self._info)
+
+    def _info(self, connection, where, ret):
+        if where & SSL.SSL_CB_HANDSHAKE_DONE:
+            self.resumed.append(bool(SSL._lib.SSL_session_reused(connection._ssl)))
+
+    def getContext(self):
+        return self.context
+
+
+class TLSTestMixin(object):
+    def setUp(self):
+        root = resource.Resource()
+        root.putChild("", Data("ok", "text/plain"))
+        self.serverContext = ServerContextFactory()
+        self.listeningPort = reactor.listenSSL(0, server.Site(root), self.serverContext, interface="127.0.0.1")
+        self.port = self.listeningPort.getHost().port
+
+    def tearDown(self):
+        return self.listeningPort.stopListening()
+
+    @inlineCallbacks
+    def request(self, tlsContext):
+        url = "https://localhost:%d/" % self.port
+        factory = RawHTTPClientFactory(encodeRequest("GET", url))
+        reactor.connectTCP("127.0.0.1", self.port, tlsContext.wrap("localhost", self.port, factory))
+        yield factory.deferred
+
+        # sessions are kept once the connection is closed
+        for i in range(0, 100):
+            if ("localhost", self.port) in tlsContext.sessions or not tlsContext.resume:
+                break
+            yield task.deferLater(reactor, 0.01, lambda: None)
+        yield task.deferLater(reactor, 0.01, lambda: None)
+
+
+class Handshakes(TLSTestMixin, unittest.TestCase):
+    if SSL is None:
+        skip = "pyOpenSSL is not installed"
+
+    @inlineCallbacks
+    def test_resumption(self):
+        """Connections after the first resume the target's TLS session"""
+        tlsContext = TLSContext()
+        yield self.request(tlsContext)
+        yield self.request(tlsContext)
+        self.assertEquals(tlsContext.handshakes, 2)
+        self.assertEquals(self.serverContext.resumed, [False, True])
+
+    @inlineCallbacks
+    def test_noResumption(self):
+        """With resumption off every connection does a full handshake"""
+        tlsContext = TLSContext(resume=False)
+        yield self.request(tlsContext)
+        yield self.request(tlsContext)
+        self.assertEquals(self.serverContext.resumed, [False, False])
+
+    @inlineCallbacks
+    def test_handshakeTime(self):
+        """Handshake time is reported as its own phase"""
+        url = "https://localhost:%d/" % self.port
+        factory = RawHTTPClientFactory(encodeRequest("GET", url))
+        reactor.connectTCP("127.0.0.1", self.port, TLSContext().wrap("localhost", self.port, factory))
+        value = yield factory.deferred
+        self.assertTrue(value["timeToHandshake"] > 0)
+        self.assertTrue(value["timeToFirstByte"] >= value["timeToConnect"] + value["timeToHandshake"])
+        yield task.deferLater(reactor, 0.05, lambda: None)
+
+
+class Engines(TLSTestMixin, unittest.TestCase):
+    if SSL is None:
+        skip = "pyOpenSSL is not installed"
+
+    def tearDown(self):
+        db.execute("DELETE FROM jobs")
+        db.execute("DELETE FROM accounting")
+        return TLSTestMixin.tearDown(self)
+
+    def createJobSpec(self, profile):
+        jobSpec = JobSpec()
+        jobSpec.profile = profile
+        jobSpec.duration = 60
+        jobSpec.statsInterval = 1
+        jobSpec.clientFunction = "1"
+        return jobSpec
+
+    @inlineCallbacks
+    def test_request(self):
+        """The request path sends https requests through the job's TLS context"""
+        jobSpec = self.createJobSpec(JobSpec.JobProfile.BENCHMARK)
+        jobSpec.requests = { "https://127.0.0.1:%d/" % self.port: { "method": "GET", "postdata": None, "cookies": {}} }
+        engine = BenchmarkEngine(1, jobSpec)
+        engine.startTime = time.time()
+        engine._request(*engine.requestMix.next())
+        for i in range(0, 200):
+            if engine.requestsCompleted or engine.requestsFailed:
+                break
+            yield task.deferLater(reactor, 0.01, lambda: None)
+        self.assertEquals((engine.requestsCompleted, engine.requestsFailed), (1, 0))
+        self.assertEquals(engine.tlsContext.handshakes, 1)
+
+    @inlineCallbacks
+    def test_clientResumption(self):
+        """Benchmark clients which send again resume the target's TLS session"""
+        jobSpec = self.createJobSpec(JobSpec.JobProfile.BENCHMARK)
+        jobSpec.requests = { "https://127.0.0.1:%d/" % self.port: { "method": "GET", "postdata": None, "cookies": {}} }
+        engine = BenchmarkEngine(1, jobSpec)
+        engine.start()
+        for i in range(0, 500):
+            if engine.requestsCompleted >= 5:
+                break
+            yield task.deferLater(reactor, 0.01, lambda: None)
+        engine.stop()
+        yield task.deferLater(reactor, 0.05, lambda: None)
+        self.assertTrue(engine.requestsCompleted >= 5)
+        self.assertTrue(True in self.serverContext.resumed)
+
+    @inlineCallbacks
+    def test_session(self):
+        """Session steps to https URLs go through the job's TLS context"""
+        jobSpec = self.createJobSpec(JobSpec.JobProfile.SESSION)
+        jobSpec.session = {"steps": [{"url": "https://127.0.0.1:%d/" % self.port}]}
+        engine = SessionEngine(1, jobSpec)
+        engine.startTime = time.time()
+        user = VirtualUser(1)
+        engine.flow.reset(user)
+        engine.clients = 1
+        yield engine._step(user)
+        self.assertEquals((engine.requestsCompleted, engine.requestsFailed), (1, 0))
+        self.assertEquals(engine.tlsContext.handshakes, 1)
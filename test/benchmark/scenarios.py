@@ -0,0 +1,281 @@
+from twisted.internet import reactor, task
+from twisted.internet.defer import inlineCallbacks, returnValue, DeferredList
+from twisted.web import server, resource
+
+from thundercloud.spec.job import JobSpec, JobState, JobResults
+from thundercloud.spec.slave import SlaveSpec
+
+import subprocess
+import simplejson as json
+import time
+import copy
+import sys
+import os
+
+# which way is better for a metric
+HIGHER = "higher"
+LOWER = "lower"
+
+def metric(name, value, unit, better):
+    return (name, {"value": value, "unit": unit, "better": better})
+
+
+# time n calls of f, best of a few rounds so one hiccup doesn't skew it.
+# returns seconds per call
+def _timeCalls(f, n, rounds=3):
+    best = float("inf")
+    for i in range(0, rounds):
+        start = time.time()
+        for j in xrange(0, n):
+            f()
+        best = min(best, time.time() - start)
+    return best / n
+
+
+# a JobResults as a slave would send it, with one entry per interval
+def _jobResults(intervals, offset=0.0):
+    jobResults = JobResults()
+    jobResults.job_state = JobState.RUNNING
+    jobResults.job_nodes = 1
+    jobResults.iterations_total = intervals * 100
+    jobResults.results_byTime = {}
+    for i in range(0, intervals):
+        stats = copy.deepcopy(JobResults._attributes["results_byTime"][0])
+        stats.update({
+            "iterations_total": i * 100,
+            "iterations_success": i * 99,
+            "iterations_fail": i,
+            "timeToConnect": 0.001,
+            "timeToFirstByte": 0.002,
+            "responseTime": 0.003,
+            "requestsPerSec": 100.0,
+            "throughput": 1024.0,
+            "bytesTransferred": i * 1024,
+        })
+        jobResults.results_byTime[i + offset] = stats
+    return jobResults
+
+
+# The sink runs in its own process so it doesn't eat into the engine's share
+# of the reactor.  It prints the port it's listening on once it's up
+def startSink():
+    process = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "sink.py")],
+                               stdout=subprocess.PIPE)
+    return process, int(process.stdout.readline())
+
+
+# a hammer run keeps up with the rate it's offered if it answers nearly all
+# of it, fails next to nothing and doesn't slow down doing it.  it sends each
+# second's requests in one go, so slowing down means they stop draining
+# within the second
+ACHIEVED = 0.95
+FAILURES = 0.01
+
+# run an engine profile against the sink for duration seconds, with clients
+# clients (requests/sec for the hammer engine).  returns what it managed
+@inlineCallbacks
+def _engineRun(profile, port, clients, duration):
+    from thunderslave.engine import EngineFactory
+    from thunderslave.db import dbConnection as db
+
+    url = "http://127.0.0.1:%d/" % port
+    jobSpec = JobSpec()
+    jobSpec.profile = profile
+    jobSpec.duration = duration
+    jobSpec.statsInterval = 1
+    jobSpec.timeout = 10
+    jobSpec.clientFunction = str(clients)
+    jobSpec.measureResolution = True
+    if profile == JobSpec.JobProfile.SESSION:
+        jobSpec.session = {"steps": [{"url": url}, {"url": url}]}
+    else:
+        jobSpec.requests = {url: {"method": "GET", "postdata": None, "cookies": {}}}
+
+    engine = EngineFactory.createFactory(profile + 1, jobSpec)
+    engine.start()
+    while engine.state() != JobState.COMPLETE:
+        yield task.deferLater(reactor, 0.1, lambda: None)
+
+    # let requests still in flight drain before the next run
+    yield task.deferLater(reactor, 1, lambda: None)
+    db.execute("DELETE FROM jobs")
+    db.execute("DELETE FROM accounting")
+
+    returnValue({
+        "rps": engine.requestsCompleted / (engine.endTime - engine.startTime),
+        "iterations": engine.iterations,
+        "failed": engine.requestsFailed,
+        "responseTime": engine._averageResponseTime,
+    })
+
+def _keptUp(run, rate, latency):
+    return (run["failed"] <= run["iterations"] * FAILURES and
+            run["rps"] >= rate * ACHIEVED and
+            run["responseTime"] <= latency)
+
+# The hammer engine sends whatever rate it's asked for, so what it completes
+# at a fixed rate just echoes the rate.  Its ceiling is found instead: the
+# offered rate doubles until a run doesn't keep up with it, then the gap
+# between the last run which kept up and the first which didn't is halved
+# until it's within precision.  Returns the requests/sec completed at the
+# highest rate it kept up with, 0 if it never did
+@inlineCallbacks
+def _hammerCeiling(port, options):
+    kept = None         # (rate, run) for the highest rate kept up with
+    missed = None       # lowest rate which wasn't
+    rate = options.rate
+    while True:
+        run = yield _engineRun(JobSpec.JobProfile.HAMMER, port, rate, options.duration)
+        passed = _keptUp(run, rate, options.latency)
+        print "  hammer at %d requests/sec: %.1f req/s, %d of %d failed, %.3fs average%s" % (
+            rate, run["rps"], run["failed"], run["iterations"], run["responseTime"], not passed and " (missed)" or "")
+        if passed:
+            kept = (rate, run)
+        else:
+            missed = rate
+
+        if missed is None:
+            if rate >= options.maxRate:
+                break
+            rate = min(rate * 2, options.maxRate)
+        else:
+            low = kept and kept[0] or 0
+            if missed - low <= max(int(low * options.precision), 1):
+                break
+            rate = (low + missed) / 2
+
+    if kept is None:
+        returnValue(0.0)
+    returnValue(kept[1]["rps"])
+
+# max sustained requests/sec of each engine profile against the sink.  the
+# closed-loop engines run a fixed number of clients flat out
+@inlineCallbacks
+def engineThroughput(options):
+    from thunderslave.capacity import Governor
+    Governor.configure(max(options.maxRate, options.clients))
+    (sink, port) = startSink()
+    metrics = []
+    try:
+        rps = yield _hammerCeiling(port, options)
+        metrics.append(metric("engine.hammer.rps", rps, "req/s", HIGHER))
+        for (name, profile) in [("benchmark", JobSpec.JobProfile.BENCHMARK),
+                                ("session", JobSpec.JobProfile.SESSION)]:
+            run = yield _engineRun(profile, port, options.clients, options.duration)
+            if run["failed"] > run["iterations"] * FAILURES:
+                raise Exception("%d of %d %s requests failed, throughput isn't meaningful" % (run["failed"], run["iterations"], name))
+            metrics.append(metric("engine.%s.rps" % name, run["rps"], "req/s", HIGHER))
+    finally:
+        sink.terminate()
+        sink.wait()
+    returnValue(metrics)
+
+
+# what the engines pay per response to keep their statistics
+def bookkeeping(options):
+    from thunderslave.engine.hammer import HammerEngine
+    from thunderslave.db import dbConnection as db
+
+    jobSpec = JobSpec()
+    jobSpec.requests = {"http://127.0.0.1:1/": {"method": "GET", "postdata": None, "cookies": {}}}
+    jobSpec.measureResolution = True
+    engine = HammerEngine(100, jobSpec)
+    engine.startTime = time.time()
+    engine.jobState = JobState.RUNNING
+    value = {
+        "startTime": engine.startTime,
+        "timeToConnect": 0.001,
+        "timeToHandshake": 0,
+        "timeToFirstByte": 0.002,
+        "elapsedTime": 0.003,
+        "bytesTransferred": 1024,
+    }
+    perCall = _timeCalls(lambda: engine._bookkeep(value), 100000)
+    db.execute("DELETE FROM jobs")
+    db.execute("DELETE FROM accounting")
+    return [metric("bookkeep.perResponse", perCall * 1e6, "us", LOWER)]
+
+
+# master-side aggregation time against the number of slaves and intervals
+def aggregation(options):
+    from thunderserver.orchestrator.job import AggregateJobResults
+
+    metrics = []
+    for slaves in options.slaves:
+        for intervals in options.intervals:
+            jobResults = [_jobResults(intervals, offset=slave * 0.0001) for slave in range(0, slaves)]
+            def aggregate():
+                AggregateJobResults().aggregate(jobResults, 1, False)
+            perCall = _timeCalls(aggregate, 1)
+            metrics.append(metric("aggregate.%dslaves.%dintervals" % (slaves, intervals), perCall * 1e3, "ms", LOWER))
+    return metrics
+
+
+# DataObject round trips, the way results cross the REST APIs
+def serialization(options):
+    jobResults = _jobResults(max(options.intervals))
+    encoded = str(jobResults)
+    jobSpec = JobSpec()
+    jobSpec.requests = dict([("http://127.0.0.1/%d" % i, {"method": "GET", "postdata": None, "cookies": {}}) for i in range(0, 100)])
+
+    encode = _timeCalls(lambda: str(jobResults), 20)
+    decode = _timeCalls(lambda: JobResults(json.loads(encoded)), 20)
+    spec = _timeCalls(lambda: JobSpec(json.loads(str(jobSpec))), 200)
+    return [
+        metric("serialize.jobResults.encode", len(encoded) / encode / 1024**2, "MB/s", HIGHER),
+        metric("serialize.jobResults.decode", len(encoded) / decode / 1024**2, "MB/s", HIGHER),
+        metric("serialize.jobSpec.roundTrip", 1.0 / spec, "ops/s", HIGHER),
+    ]
+
+
+# answers the master's polling the way a slave running job 1 would
+class SimulatedSlave(resource.Resource):
+    isLeaf = True
+
+    def __init__(self, results):
+        resource.Resource.__init__(self)
+        self.results = results
+
+    def render_GET(self, request):
+        if request.path.endswith("/state"):
+            return json.dumps(JobState.RUNNING)
+        return self.results
+
+@inlineCallbacks
+def fanout(options):
+    from thunderserver.orchestrator.job import JobPerspective
+    from thunderserver.orchestrator.slave import SlavePerspective
+
+    results = str(_jobResults(60))
+    metrics = []
+    for slaves in options.slaves:
+        ports = [reactor.listenTCP(0, server.Site(SimulatedSlave(results)), interface="127.0.0.1") for i in range(0, slaves)]
+        jobSpec = JobSpec()
+        jobSpec.statsInterval = 1
+        job = JobPerspective(1, jobSpec)
+        for port in ports:
+            slaveSpec = SlaveSpec()
+            slaveSpec.host = "127.0.0.1"
+            slaveSpec.port = port.getHost().port
+            slaveSpec.path = ""
+            job.addSlave(SlavePerspective(slaveSpec), 1)
+
+        for (name, operation) in [("state", job.state), ("results", lambda: job.results(False))]:
+            start = time.time()
+            for i in range(0, options.rounds):
+                yield operation()
+            metrics.append(metric("fanout.%dslaves.%s" % (slaves, name), (time.time() - start) / options.rounds * 1e3, "ms", LOWER))
+
+        job.release()
+        yield DeferredList([port.stopListening() for port in ports])
+    returnValue(metrics)
+
+
+# name -> scenario, in the order they're run
+SCENARIOS = [
+    ("engine", engineThroughput),
+    ("bookkeep", bookkeeping),
+    ("aggregate", aggregation),
+    ("serialize", serialization),
+    ("fanout", fanout),
+]
@@ -0,0 +1,13 @@
+from twisted.internet import reactor
+
+from server.basicWebServer import BasicWebServer
+
+import sys
+
+# The request sink for the engine scenarios.  Listens on a free port and
+# prints it so the suite knows where to send requests
+if __name__ == "__main__":
+    port = reactor.listenTCP(0, BasicWebServer, backlog=1024, interface="127.0.0.1")
+    print port.getHost().port
+    sys.stdout.flush()
+    reactor.run()
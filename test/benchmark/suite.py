@@ -0,0 +1,147 @@
+from twisted.internet import reactor
+from twisted.internet.defer import inlineCallbacks, maybeDeferred
+
+from thundercloud import config
+
+from scenarios import SCENARIOS, HIGHER
+
+from optparse import OptionParser
+import simplejson as json
+import subprocess
+import datetime
+import socket
+import sys
+import os
+
+# Runs the benchmark scenarios, appends the run to the history file (one JSON
+# object per line) and compares each metric against the median of the last
+# few runs on this host.  Exits with status 1 if anything regressed by more
+# than the threshold
+
+def _revision():
+    try:
+        return subprocess.Popen(["git", "rev-parse", "--short", "HEAD"], stdout=subprocess.PIPE, stderr=subprocess.PIPE).communicate()[0].strip() or None
+    except OSError:
+        return None
+
+def _median(values):
+    values = sorted(values)
+    middle = len(values) / 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def loadHistory(path):
+    history = []
+    try:
+        for line in open(path):
+            if line.strip():
+                history.append(json.loads(line))
+    except IOError:
+        pass
+    return history
+
+def recordRun(path, run):
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    historyFile = open(path, "a")
+    historyFile.write(json.dumps(run) + "\n")
+    historyFile.close()
+
+
+# baseline is the median of the last window runs on the same host which have
+# the metric.  returns a list of (name, value, baseline, change, regressed)
+def compare(run, history, threshold, window):
+    comparison = []
+    for (name, m) in sorted(run["metrics"].items()):
+        previous = [r["metrics"][name]["value"] for r in history
+                    if r["host"] == run["host"] and name in r["metrics"]][-window:]
+        if not previous:
+            comparison.append((name, m, None, None, False))
+            continue
+
+        baseline = _median(previous)
+        if baseline == 0:
+            change = 0.0
+        else:
+            change = (m["value"] - baseline) / float(baseline)
+        if m["better"] == HIGHER:
+            regressed = change < -threshold
+        else:
+            regressed = change > threshold
+        comparison.append((name, m, baseline, change, regressed))
+    return comparison
+
+def report(comparison):
+    print "%-40s %14s %14s %9s" % ("metric", "value", "baseline", "change")
+    for (name, m, baseline, change, regressed) in comparison:
+        if baseline is None:
+            print "%-40s %10.3f %-5s %14s %9s" % (name, m["value"], m["unit"], "-", "-")
+        else:
+            print "%-40s %10.3f %-5s %14.3f %+8.1f%%%s" % (name, m["value"], m["unit"], baseline, change * 100, regressed and "  REGRESSED" or "")
+
+
+@inlineCallbacks
+def run(options):
+    metrics = {}
+    try:
+        for (name, scenario) in SCENARIOS:
+            if options.only and name not in options.only:
+                continue
+            print "Running %s..." % name
+            result = yield maybeDeferred(scenario, options)
+            metrics.update(dict(result))
+    except Exception, ex:
+        print "Benchmark failed: %s" % ex
+        options.status = 2
+        reactor.stop()
+        return
+
+    run = {
+        "time": datetime.datetime.now().isoformat(),
+        "host": socket.gethostname(),
+        "revision": _revision(),
+        "metrics": metrics,
+    }
+    comparison = compare(run, loadHistory(options.history), options.threshold, options.window)
+    report(comparison)
+    if options.record:
+        recordRun(options.history, run)
+
+    regressions = [name for (name, m, baseline, change, regressed) in comparison if regressed]
+    if regressions:
+        print "%d metric(s) regressed by more than %d%%: %s" % (len(regressions), options.threshold * 100, ", ".join(regressions))
+        options.status = 1
+    reactor.stop()
+
+
+if __name__ == "__main__":
+    parser = OptionParser()
+    parser.add_option("--history", type="string", dest="history", default=os.path.join(os.environ.get("BUILD", "build"), "benchmark.jsonl"))
+    parser.add_option("--threshold", type="float", dest="threshold", default=0.15, help="allowed regression, as a fraction of the baseline")
+    parser.add_option("--window", type="int", dest="window", default=5, help="number of previous runs in the baseline")
+    parser.add_option("--only", type="string", dest="only", default="", help="comma separated scenarios to run")
+    parser.add_option("--no-record", action="store_false", dest="record", default=True, help="don't add this run to the history")
+    parser.add_option("-d", "--duration", type="int", dest="duration", default=5, help="seconds each engine runs for")
+    parser.add_option("-r", "--rate", type="int", dest="rate", default=1000, help="requests/sec the hammer engine's ceiling search starts at")
+    parser.add_option("--max-rate", type="int", dest="maxRate", default=64000, help="highest requests/sec the ceiling search offers")
+    parser.add_option("--precision", type="float", dest="precision", default=0.05, help="ceiling search precision, as a fraction of the rate")
+    parser.add_option("--latency", type="float", dest="latency", default=1.0, help="average response time, in seconds, past which the hammer engine isn't keeping up")
+    parser.add_option("-c", "--clients", type="int", dest="clients", default=50, help="concurrent clients for the other engines")
+    parser.add_option("--slaves", type="string", dest="slaves", default="1,10,25")
+    parser.add_option("--intervals", type="string", dest="intervals", default="60,300")
+    parser.add_option("--rounds", type="int", dest="rounds", default=20, help="fan-out operations per slave count")
+    (options, args) = parser.parse_args()
+    options.only = [name for name in options.only.split(",") if name]
+    options.slaves = [int(n) for n in options.slaves.split(",")]
+    options.intervals = [int(n) for n in options.intervals.split(",")]
+    options.status = 0
+
+    config._config.add_section("network")
+    config._config.set("network", "clients.max", "10")
+
+    reactor.callWhenRunning(run, options)
+    reactor.run()
+    sys.exit(options.status)
@@ -0,0 +1,53 @@
+from thundercloud.util.samplelog import SampleLog, analyze, FIELDS
+
+from optparse import OptionParser
+import sys
+
+# Percentiles over a raw sample log fetched from a slave, e.g.
+#
+#     curl -o job.samples http://slave:7000/job/3/samples
+#     python analyzeSamples.py --window 10 --percentiles 50,99,99.9 job.samples
+#
+# Times are in milliseconds, windows in seconds from the start of the job
+
+def _format(value):
+    if value is None:
+        return "-"
+    return "%.2f" % (value * 1000)
+
+
+if __name__ == "__main__":
+    parser = OptionParser(usage="%prog [options] samples-file")
+    parser.add_option("--field", type="choice", dest="field", default="elapsedTime",
+                      choices=[f for f in FIELDS if f.startswith("time") or f == "elapsedTime"])
+    parser.add_option("--percentiles", type="string", dest="percentiles", default="50,90,99,99.9")
+    parser.add_option("--window", type="float", dest="window", default=None, help="seconds per window; the whole log if not given")
+    parser.add_option("--from", type="float", dest="start", default=None, help="skip samples before this many seconds")
+    parser.add_option("--to", type="float", dest="end", default=None, help="skip samples from this many seconds on")
+    parser.add_option("--target", type="string", dest="target", default=None, help="only this URL")
+    parser.add_option("--targets", action="store_true", dest="listTargets", default=False, help="list the log's URLs and exit")
+    (options, args) = parser.parse_args()
+    if len(args) != 1:
+        parser.error("no samples file given")
+
+    log = SampleLog(args[0])
+    if options.listTargets:
+        for (i, target) in enumerate(log.targets):
+            print "%5d  %s" % (i, target)
+        sys.exit(0)
+
+    target = None
+    if options.target is not None:
+        if options.target not in log.targets:
+            parser.error("%s isn't in the log" % options.target)
+        target = log.targets.index(options.target)
+
+    percentiles = [float(p) for p in options.percentiles.split(",")]
+    results = analyze(log, options.field, percentiles, options.window, target, options.start, options.end)
+
+    print "%d samples, %s in ms" % (len(log), options.field)
+    print "%8s %9s %7s %9s %s" % ("start", "requests", "errors", "mean", " ".join(["%9s" % ("p%g" % p) for p in percentiles]))
+    for result in results:
+        print "%8.1f %9d %7d %9s %s" % (result["start"], result["count"], result["errors"], _format(result["mean"]),
+                                        " ".join(["%9s" % _format(result["percentiles"].get(p)) for p in percentiles]))
+    log.close()